@@ -0,0 +1,152 @@
+"""
+A standalone benchmark runner. It is configured like tests/runtests.py
+(and requires the same PostgreSQL environment variables) but sends emails
+to the locmem backend and uses stubbed SES/Twilio clients, so nothing
+leaves the machine.
+
+Results are stored in benchmarks/results/<commit>.json, compare them with:
+
+    python benchmarks/runbench.py --compare benchmarks/results/<commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from tests.runtests import SETTINGS as TEST_SETTINGS  # noqa: E402
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+SETTINGS = dict(
+    TEST_SETTINGS,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_HOST_USER='bench@example.com',
+    TWILIO_ACCOUNT_SID='bench',
+    TWILIO_AUTH_TOKEN='bench',
+    TWILIO_FROM_PHONE_NUMBER='+10000000000',
+    TEMPLATES=[dict(
+        TEST_SETTINGS['TEMPLATES'][0],
+        DIRS=[os.path.join(BASE_DIR, 'benchmarks', 'templates')],
+    )],
+)
+
+
+def get_commit() -> 'str':
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+        ).decode().strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=BASE_DIR,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def run_benchmark(bench, repeat: 'int') -> 'dict':
+    from django.core import mail
+    from django.db import transaction
+
+    from msg.handlers import MetaHandler
+
+    MetaHandler._handlers_map = {}
+    with transaction.atomic():
+        setup = bench.setup()
+        op = next(setup)
+        op()  # warm up caches (templates, translations, etc.)
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(bench.number):
+                op()
+            timings.append((time.perf_counter() - start) / bench.number)
+            mail.outbox = []
+
+        next(setup, None)
+        transaction.set_rollback(True)
+
+    return {
+        'number': bench.number,
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+    }
+
+
+def print_results(results: 'dict', baseline: 'dict' = None) -> 'None':
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        line = (f'{name.ljust(width)}  '
+                f'min {result["min"] * 1000:10.3f} ms  '
+                f'median {result["median"] * 1000:10.3f} ms')
+        if baseline and name in baseline:
+            ratio = result['median'] / baseline[name]['median']
+            line += f'  x{ratio:.2f} vs baseline'
+        print(line)
+
+
+def run_benchmarks():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-k', '--filter', default='',
+                        help='Run only benchmarks containing this string.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed rounds of each benchmark.')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='Results file to compare with.')
+    parser.add_argument('--no-save', action='store_true',
+                        help='Do not store results.')
+    args = parser.parse_args()
+
+    from django.conf import settings
+    settings.configure(**SETTINGS)
+
+    import django
+    django.setup()
+
+    from django.test.utils import setup_databases
+    from django.test.utils import teardown_databases
+
+    from benchmarks.suite import BENCHMARKS
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        results = {
+            bench.name: run_benchmark(bench, args.repeat)
+            for bench in BENCHMARKS if args.filter in bench.name
+        }
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if not args.no_save:
+        commit = get_commit()
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{commit}.json')
+        with open(path, 'w') as f:
+            json.dump({
+                'commit': commit,
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'results': results,
+            }, f, indent=2)
+        print(f'Results saved to {os.path.relpath(path)}')
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -0,0 +1,202 @@
+"""
+Benchmarks of the hot paths of django-msg. Each benchmark is a generator
+function registered with `@benchmark`. It prepares the state, yields
+the operation to time and cleans up after the generator is resumed.
+Runner (`runbench.py`) executes every benchmark in a transaction which
+is rolled back afterwards.
+"""
+from types import SimpleNamespace
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+
+from django.test import override_settings
+
+from msg.handlers import EmailHandler
+from msg.handlers import Handler
+from msg.handlers import MsgCtx
+from msg.handlers import SESHandler
+from msg.handlers import TwilioHandler
+from msg.models import Msg
+
+
+class Benchmark(NamedTuple):
+    name: 'str'
+    setup: 'Callable[[], Iterator[Callable[[], None]]]'
+    # Number of operations per round
+    number: 'int'
+
+
+BENCHMARKS: 'List[Benchmark]' = []
+
+
+def benchmark(name: 'str', number: 'int' = 100):
+    def decorator(setup):
+        BENCHMARKS.append(Benchmark(name, setup, number))
+        return setup
+    return decorator
+
+
+class BenchPayload(NamedTuple):
+    recipients: 'List[str]'
+    context: 'dict'
+
+
+def make_context(items: 'int' = 50) -> 'dict':
+    return {
+        'username': 'bench-user',
+        'items': [
+            {
+                'name': f'item {i}',
+                'description': 'lorem ipsum dolor sit amet ' * 4,
+                'price': i * 1.25,
+            }
+            for i in range(items)
+        ],
+        'total': sum(i * 1.25 for i in range(items)),
+    }
+
+
+def make_payload(recipients: 'int' = 1, items: 'int' = 50) -> 'BenchPayload':
+    return BenchPayload(
+        recipients=[f'user{i}@example.com' for i in range(recipients)],
+        context=make_context(items),
+    )
+
+
+class BenchMixin:
+    template_text = 'benchmarks/emails/bench.txt'
+    template_html = 'benchmarks/emails/bench.html'
+    subject = 'Benchmark'
+
+    def match(self, payload, *args, **kwargs):
+        return isinstance(payload, BenchPayload)
+
+    def parse(self, payload, *args, **kwargs):
+        return MsgCtx(recipients=payload.recipients, context=payload.context)
+
+
+class NoMatchBase(Handler):
+    """
+    Abstract (`match` is not defined) base of handlers
+    which are never matched.
+    """
+
+    def parse(self, *args, **kwargs):
+        pass
+
+    def send(self, msg):
+        pass
+
+
+def register_handlers(count: 'int') -> 'None':
+    """
+    Register `count` handlers where only the last one matches
+    `BenchPayload`, which is the worst case of routing.
+    """
+    for i in range(count - 1):
+        type(f'NoMatchHandler{i}', (NoMatchBase,), {
+            'name': f'no-match-{i}',
+            'match': lambda self, *args, **kwargs: False,
+        })
+
+    type('BenchEmailHandler', (BenchMixin, EmailHandler), {
+        'name': 'bench-email',
+    })
+
+
+class StubSESClient:
+
+    def send_email(self, **kwargs):
+        return {'MessageId': 'stub'}
+
+
+class StubTwilioClient:
+
+    def __init__(self):
+        self.api = SimpleNamespace(account=SimpleNamespace(
+            messages=SimpleNamespace(create=self.create),
+        ))
+
+    def create(self, **kwargs):
+        return SimpleNamespace(sid='stub')
+
+
+def _route(count: 'int'):
+    register_handlers(count)
+    payload = make_payload()
+    yield lambda: Msg.objects.create_from_any(payload)
+
+
+@benchmark('create_from_any[1 handler]')
+def route_1():
+    yield from _route(1)
+
+
+@benchmark('create_from_any[50 handlers]')
+def route_50():
+    yield from _route(50)
+
+
+@benchmark('create_from_any[500 handlers]', number=20)
+def route_500():
+    yield from _route(500)
+
+
+@benchmark('Msg.new[insert, 200 items context]')
+def msg_new():
+    register_handlers(1)
+    payload = make_payload(items=200)
+    yield lambda: Msg.new(payload, dispatch_now=False)
+
+
+@benchmark('dispatch[status writes]')
+def dispatch_status_writes():
+    register_handlers(1)
+    msg = Msg.new(make_payload(), dispatch_now=False)
+    with override_settings(MSG_SKIP_SEND=True):
+        yield msg.dispatch
+
+
+@benchmark('EmailHandler.render[50 items]')
+def email_render():
+    register_handlers(1)
+    msg = Msg.new(make_payload(), dispatch_now=False)
+    yield lambda: msg.handler.render(msg)
+
+
+def _fan_out(handler_cls, recipients: 'int'):
+    msg = Msg(
+        type=handler_cls.name,
+        language='en',
+        recipients=make_payload(recipients).recipients,
+        context=make_context(),
+    )
+    yield lambda: handler_cls().send(msg)
+
+
+@benchmark('EmailHandler.send[1000 recipients]', number=10)
+def fan_out_email():
+    handler_cls = type('FanOutEmailHandler', (BenchMixin, EmailHandler), {
+        'name': 'fan-out-email',
+    })
+    yield from _fan_out(handler_cls, 1000)
+
+
+@benchmark('SESHandler.send[1000 recipients]', number=10)
+def fan_out_ses():
+    handler_cls = type('FanOutSESHandler', (BenchMixin, SESHandler), {
+        'name': 'fan-out-ses',
+        '_get_client': lambda self, backend=None: StubSESClient(),
+    })
+    yield from _fan_out(handler_cls, 1000)
+
+
+@benchmark('TwilioHandler.send[1000 recipients]', number=10)
+def fan_out_twilio():
+    handler_cls = type('FanOutTwilioHandler', (BenchMixin, TwilioHandler), {
+        'name': 'fan-out-twilio',
+        '_get_client': lambda self, backend=None: StubTwilioClient(),
+    })
+    yield from _fan_out(handler_cls, 1000)
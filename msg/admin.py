@@ -1,9 +1,24 @@
+import json
+from datetime import timedelta
+from typing import Union
+
 from django import forms
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.views.main import ORDER_VAR
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 
+from . import counters
 from .models import Msg
+from .models import Suppression
 from .settings import msg_settings
 
 
@@ -11,6 +26,119 @@ def get_type_choices():
     return ((h.name, h.name) for h in msg_settings.handlers)
 
 
+def estimate_count(queryset: 'QuerySet') -> 'Union[int, None]':
+    """
+    Estimate number of rows of the queryset from the query plan,
+    without counting them.
+
+    :return:
+        Estimated count, None if the database can't estimate it.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which counts only small results exactly, larger ones are
+    estimated (see `estimate_count()`).
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self) -> 'int':
+        estimate = None
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_count_limit:
+            return super().count
+        return estimate
+
+
+class CreatedWithinListFilter(admin.SimpleListFilter):
+    """
+    Filter of recently created messages, so the changelist doesn't scan
+    the whole table unless asked to.
+    """
+    title = _('created within')
+    parameter_name = 'created_within'
+    default = '7'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('1', _('Past 24 hours')),
+            ('7', _('Past 7 days')),
+            ('30', _('Past 30 days')),
+            ('all', _('Any date')),
+        ]
+
+    def value(self):
+        value = super().value()
+        if value not in dict(self.lookup_choices):
+            return self.default
+        return value
+
+    def queryset(self, request, queryset):
+        if self.value() == 'all':
+            return queryset
+        since = timezone.now() - timedelta(days=int(self.value()))
+        return queryset.filter(created__gte=since)
+
+    def choices(self, changelist):
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: lookup}, [PAGE_VAR, 'id__lt'],
+                ),
+                'display': title,
+            }
+
+
+class MsgChangeList(ChangeList):
+    """
+    Changelist with keyset navigation: the "next" link filters messages
+    older than the last one on the page, instead of an OFFSET which
+    scans all the skipped rows.
+
+    Only the listing is read from `read_db`, actions get the queryset
+    of `get_queryset()`, which writes to the primary database.
+    """
+    next_page_url: 'Union[str, None]' = None
+
+    def get_queryset(self, request):
+        # Context is not shown in the changelist
+        return super().get_queryset(request).defer('context')
+
+    def get_results(self, request):
+        queryset = self.queryset
+        self.queryset = queryset.using(msg_settings.read_db)
+        try:
+            super().get_results(request)
+        finally:
+            self.queryset = queryset
+        # Only the default ordering (newest first) is keyset-paginated
+        if ORDER_VAR in self.params:
+            return
+        results = list(self.result_list)
+        if len(results) == self.list_per_page:
+            self.next_page_url = self.get_query_string(
+                {'id__lt': results[-1].pk}, [PAGE_VAR],
+            )
+
+
 class MsgModelForm(forms.ModelForm):
     type = forms.ChoiceField(choices=get_type_choices())
     language = forms.ChoiceField(
@@ -20,18 +148,39 @@ class MsgModelForm(forms.ModelForm):
 
     class Meta:
         model = Msg
-        fields = '__all__'
+        exclude = ['context_ref']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.context_pending:
+            self.instance.load_context()
+            self.initial['context'] = self.instance.context
+
+    def save(self, commit=True):
+        if 'context' in self.changed_data:
+            # Edited context is stored inline
+            self.instance.context_ref = None
+        elif self.instance.context_ref_id is not None:
+            self.instance.context = {}
+        return super().save(commit=commit)
 
 
 @admin.register(Msg)
 class MsgModelAdmin(admin.ModelAdmin):
     _language_map = dict(settings.LANGUAGES)
 
+    # Recipients shown in the changelist
+    _recipients_limit = 3
+
     form = MsgModelForm
     search_fields = ['type', 'recipients']
-    list_filter = ['type', 'status', 'language', 'created', 'modified']
-    list_display = ['id', 'type', 'status', 'get_language', 'recipients',
-                    'created', 'modified']
+    list_filter = [CreatedWithinListFilter, 'type', 'status', 'language',
+                   'modified']
+    list_display = ['id', 'type', 'status', 'get_language',
+                    'get_recipients', 'created', 'modified']
+    ordering = ['-id']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     actions = ['send_selected_messages']
 
@@ -40,6 +189,43 @@ class MsgModelAdmin(admin.ModelAdmin):
 
     get_language.short_description = _('language')
 
+    def get_recipients(self, obj):
+        recipients = [str(recipient) for recipient
+                      in obj.recipients[:self._recipients_limit]]
+        rest = len(obj.recipients) - len(recipients)
+        if rest > 0:
+            return ', '.join(recipients) + f' (+{rest})'
+        return ', '.join(recipients)
+
+    get_recipients.short_description = _('recipients')
+
+    def get_changelist(self, request, **kwargs):
+        return MsgChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # Summary of all messages, read from the counters (see
+        # `msg.counters`) rather than counted.
+        extra_context = {
+            'counts': sorted(counters.get_counts().items()),
+            **(extra_context or {}),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
     def send_selected_messages(self, request, queryset):
-        for instance in queryset:
-            instance.dispatch()
+        # Dispatched from the primary database, whichever database
+        # the selection was read from.
+        pks = list(queryset.values_list('pk', flat=True))
+        if msg_settings.async:
+            from .tasks import dispatch_msgs
+            dispatch_msgs.delay(pks)
+        else:
+            Msg.objects.dispatch_batch(
+                Msg.objects.primary().filter(pk__in=pks),
+            )
+
+
+@admin.register(Suppression)
+class SuppressionModelAdmin(admin.ModelAdmin):
+    search_fields = ['recipient']
+    list_filter = ['channel', 'created']
+    list_display = ['id', 'channel', 'recipient', 'reason', 'created']
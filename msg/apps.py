@@ -8,3 +8,7 @@ class MsgConfig(AppConfig):
         # Make sure that handlers are registered when django is ready
         from .settings import msg_settings
         msg_settings.import_setting('handlers')
+
+        if msg_settings.warm_up_translations:
+            from .utils import warm_up_translations
+            warm_up_translations()
@@ -0,0 +1,179 @@
+"""
+Weighted pools of provider backends (e.g. several SMTP relays or SES
+regions) with failover.
+
+Messages are spread across backends according to their weights. Weights
+of backends with high recent latency are lowered, in proportion to their
+p95 latency compared to the fastest backend. A send failed by the
+provider (see `msg.breaker.is_provider_failure()`) is retried with the
+next backend right away, and each backend has its own circuit breaker
+(see `msg.breaker`), unless breakers are disabled, so a failing backend
+is skipped until its cooldown passes. Other errors (e.g. an invalid
+recipient) are raised right away, they would fail with any backend.
+"""
+import json
+import random
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Union
+
+from . import hedging
+from .breaker import DEFAULTS as BREAKER_DEFAULTS
+from .breaker import CircuitBreaker
+from .breaker import is_provider_failure
+from .exceptions import CircuitOpenException
+from .settings import msg_settings
+
+# Keys of backend dicts which are not options of the backend
+POOL_KEYS = ('name', 'weight')
+
+
+class BackendPool:
+
+    def __init__(self, provider: 'str', backends: 'List[dict]',
+                 breaker_options: 'dict' = None):
+        assert backends, f'Backend pool of {provider!r} is empty.'
+        names = [backend['name'] for backend in backends]
+        assert len(set(names)) == len(names), (
+            f'Names of {provider!r} backends are not unique.'
+        )
+
+        self.provider = provider
+        self.backends = backends
+        # Backends have no breakers without options
+        self.breakers: 'Dict[str, CircuitBreaker]' = {}
+        if breaker_options:
+            options = {**BREAKER_DEFAULTS, **breaker_options}
+            self.breakers = {
+                name: CircuitBreaker(f'{provider}:{name}', **options)
+                for name in names
+            }
+        self.trackers = {
+            name: hedging.get_tracker(f'{provider}:{name}')
+            for name in names
+        }
+
+    def get_weights(self) -> 'Dict[str, float]':
+        p95 = {}
+        for name, tracker in self.trackers.items():
+            if len(tracker) >= hedging.MIN_SAMPLES:
+                p95[name] = tracker.percentile(0.95)
+        fastest = min(p95.values(), default=None)
+
+        weights = {}
+        for backend in self.backends:
+            weight = backend.get('weight', 1)
+            latency = p95.get(backend['name'])
+            if latency and fastest is not None:
+                weight *= fastest / latency
+            weights[backend['name']] = weight
+        return weights
+
+    def get_order(self) -> 'List[dict]':
+        """
+        :return:
+            Backends in weighted random order (weighted sampling
+            without replacement).
+        """
+        weights = self.get_weights()
+        keys = {
+            backend['name']: (
+                random.random() ** (1 / weights[backend['name']])
+                if weights[backend['name']] > 0 else 0
+            )
+            for backend in self.backends
+        }
+        return sorted(self.backends, key=lambda backend: keys[backend['name']],
+                      reverse=True)
+
+    def call(self, func: 'Callable[[dict], object]'):
+        """
+        Call `func` with options of backends in weighted random order,
+        until it succeeds or fails with an error of the message.
+
+        :param func:
+            Callable taking backend options (the backend dict without
+            `name` and `weight`)
+
+        :raise CircuitOpenException:
+            When breakers of all backends are open.
+        """
+        error: 'Union[Exception, None]' = None
+        for backend in self.get_order():
+            name = backend['name']
+            breaker = self.breakers.get(name)
+            trial = False
+            if breaker is not None:
+                try:
+                    trial = breaker.allow()
+                except CircuitOpenException as exc:
+                    error = error or exc
+                    continue
+
+            options = {key: value for key, value in backend.items()
+                       if key not in POOL_KEYS}
+            start = time.monotonic()
+            try:
+                result = func(options)
+            except Exception as exc:
+                if not is_provider_failure(exc):
+                    # Provider is up, the message would fail with
+                    # any backend (e.g. an invalid recipient)
+                    if breaker is not None:
+                        breaker.success(trial)
+                    raise
+                if breaker is not None:
+                    breaker.failure(trial)
+                error = exc
+                continue
+
+            if breaker is not None:
+                breaker.success(trial)
+            self.trackers[name].observe(time.monotonic() - start)
+            return result
+
+        raise error
+
+
+_pools: 'Dict[tuple, BackendPool]' = {}
+
+
+def get_options_key(options) -> 'str':
+    """
+    :return:
+        Hashable snapshot of (possibly nested) backend options.
+    """
+    return json.dumps(options, sort_keys=True, default=repr)
+
+
+def get_pool(handler) -> 'Union[BackendPool, None]':
+    """
+    :param handler:
+        Handler instance
+
+    :return:
+        Pool of handler's `backends` or backends of its provider from
+        `backends` setting, None if there are none.
+    """
+    provider = handler.provider or handler.name
+    backends = handler.backends
+    if backends is None:
+        backends = msg_settings.backends.get(provider)
+    if not backends:
+        return None
+
+    breaker_options = handler.circuit_breaker
+    if breaker_options is None:
+        breaker_options = msg_settings.circuit_breaker
+    breaker_options = breaker_options or None
+
+    key = (
+        handler.name,
+        get_options_key(backends),
+        get_options_key(breaker_options),
+    )
+    if key not in _pools:
+        _pools[key] = BackendPool(provider, backends, breaker_options)
+    return _pools[key]
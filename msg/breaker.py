@@ -0,0 +1,202 @@
+"""
+Circuit breakers of providers.
+
+When a provider keeps failing, its breaker opens and messages are failed
+(or deferred) right away, without touching the network, so workers are
+not blocked by timeouts of an unhealthy provider. After `cooldown`
+seconds the breaker is half-open and lets `half_open_trials` messages
+through. A successful trial closes the breaker, a failed one opens it
+again.
+
+State is kept in the Django cache, so it is shared by all workers using
+the same cache (use a shared backend, e.g. memcached or redis).
+
+Only failures of the provider count (see `is_provider_failure()`),
+errors of the message itself (e.g. an invalid recipient) don't.
+"""
+import smtplib
+import time
+from concurrent import futures
+from typing import Dict
+from typing import Union
+
+from django.core.cache import caches
+
+from .exceptions import CircuitOpenException
+from .settings import msg_settings
+
+DEFAULTS = {
+    # Failures within `failure_window` seconds which open the breaker
+    'failure_threshold': 5,
+    'failure_window': 60,
+    # Seconds the breaker stays open before a trial
+    'cooldown': 30,
+    'half_open_trials': 1,
+    # 'fail' - mark messages as ERROR, 'defer' - keep them PENDING
+    # and retry (celery tasks) after the cooldown.
+    'on_open': 'fail',
+    'cache': 'default',
+}
+
+# Error codes of throttled AWS requests (HTTP 400)
+THROTTLING_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+}
+
+
+class CircuitBreaker:
+
+    def __init__(self, provider: 'str', failure_threshold: 'int',
+                 failure_window: 'float', cooldown: 'float',
+                 half_open_trials: 'int', on_open: 'str', cache: 'str'):
+        assert on_open in ('fail', 'defer'), (
+            '`on_open` has to be either "fail" or "defer".'
+        )
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.cooldown = cooldown
+        self.half_open_trials = half_open_trials
+        self.on_open = on_open
+        self.cache = caches[cache]
+
+        prefix = f'msg:breaker:{provider}'
+        self._opened_key = f'{prefix}:opened'
+        self._failures_key = f'{prefix}:failures'
+        self._trials_key = f'{prefix}:trials'
+
+    @property
+    def defer(self) -> 'bool':
+        return self.on_open == 'defer'
+
+    def allow(self) -> 'bool':
+        """
+        Check the breaker before sending.
+
+        :raise CircuitOpenException:
+            When the breaker is open or all half-open trials are taken.
+
+        :return:
+            Whether it is a half-open trial.
+        """
+        opened = self.cache.get(self._opened_key)
+        if opened is None:
+            return False
+
+        retry_after = opened + self.cooldown - time.time()
+        if retry_after > 0:
+            raise CircuitOpenException(self.provider, retry_after,
+                                       defer=self.defer)
+
+        # Trials of a crashed worker are released after the cooldown
+        self.cache.add(self._trials_key, 0, timeout=self.cooldown)
+        try:
+            trials = self.cache.incr(self._trials_key)
+        except ValueError:
+            # Expired in the meantime
+            trials = 1
+            self.cache.set(self._trials_key, 1, timeout=self.cooldown)
+        if trials > self.half_open_trials:
+            raise CircuitOpenException(self.provider, self.cooldown,
+                                       defer=self.defer)
+        return True
+
+    def success(self, trial: 'bool') -> 'None':
+        if trial:
+            self.reset()
+
+    def failure(self, trial: 'bool') -> 'None':
+        if trial:
+            self._open()
+            return
+
+        self.cache.add(self._failures_key, 0, timeout=self.failure_window)
+        try:
+            failures = self.cache.incr(self._failures_key)
+        except ValueError:
+            failures = 1
+            self.cache.set(self._failures_key, 1,
+                           timeout=self.failure_window)
+        if failures >= self.failure_threshold:
+            self._open()
+
+    def reset(self) -> 'None':
+        self.cache.delete_many([
+            self._opened_key, self._failures_key, self._trials_key,
+        ])
+
+    def _open(self) -> 'None':
+        self.cache.set(self._opened_key, time.time(), timeout=None)
+        self.cache.delete_many([self._failures_key, self._trials_key])
+
+
+def _get_http_status(exc: 'Exception') -> 'Union[int, None]':
+    response = getattr(exc, 'response', None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        if response.get('Error', {}).get('Code') in THROTTLING_CODES:
+            return 429
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    if response is not None:
+        # requests HTTPError
+        return getattr(response, 'status_code', None)
+    # TwilioRestException
+    status = getattr(exc, 'status', None)
+    return status if isinstance(status, int) else None
+
+
+def is_provider_failure(exc: 'Exception') -> 'bool':
+    """
+    Whether the error is a failure of the provider: connection errors,
+    timeouts, 5xx responses and throttling (or temporary SMTP errors).
+    Other errors, e.g. 4xx responses to an invalid recipient, are errors
+    of the message, it would fail with any backend of the provider.
+    """
+    if isinstance(exc, CircuitOpenException):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, (smtplib.SMTPConnectError,
+                        smtplib.SMTPAuthenticationError)):
+        return True
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code < 500
+
+    status = _get_http_status(exc)
+    if status is not None:
+        return status >= 500 or status == 429
+
+    if isinstance(exc, (OSError, futures.TimeoutError)):
+        return True
+    try:
+        from botocore.exceptions import ConnectionError
+        from botocore.exceptions import HTTPClientError
+    except ImportError:
+        return False
+    return isinstance(exc, (ConnectionError, HTTPClientError))
+
+
+_breakers: 'Dict[tuple, CircuitBreaker]' = {}
+
+
+def get_breaker(handler) -> 'Union[CircuitBreaker, None]':
+    """
+    :param handler:
+        Handler instance
+
+    :return:
+        Circuit breaker of the handler's provider or None if disabled.
+    """
+    options = handler.circuit_breaker
+    if options is None:
+        options = msg_settings.circuit_breaker
+    if not options:
+        return None
+
+    provider = handler.provider or handler.name
+    key = (provider, tuple(sorted(options.items())))
+    if key not in _breakers:
+        _breakers[key] = CircuitBreaker(provider, **{**DEFAULTS, **options})
+    return _breakers[key]
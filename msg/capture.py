@@ -0,0 +1,104 @@
+"""
+Sampled capture of real traffic, for replaying it in performance tests
+(see `msg_replay` command).
+
+With `capture_rate` set, that fraction of created messages is appended
+to `capture_file` (JSON lines). Records are anonymized: they keep the
+handler, language, number of recipients and the shape of the context
+(keys, types, lengths of strings and lists), never the values or
+recipients themselves. Keys are kept only in dicts keyed by variable
+names, keys of dicts keyed by data (e.g. emails or ids) are replaced.
+"""
+import json
+import random
+import re
+import threading
+import time
+from typing import Iterator
+
+from .settings import msg_settings
+
+# Keys of dicts with only such keys are kept (they're variable names)
+KEY_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]{0,63}')
+
+_lock = threading.Lock()
+
+
+def get_shape(value):
+    """
+    Anonymize the value, keeping its structure: dicts keep their keys
+    (keys of dicts keyed by data become `'k<index>'`), lists their
+    lengths, strings become `'s<length>'`, other scalars their type
+    (`'i'`, `'f'`, `'b'`).
+    """
+    if isinstance(value, dict):
+        if all(isinstance(key, str) and KEY_RE.fullmatch(key)
+               for key in value):
+            return {key: get_shape(item) for key, item in value.items()}
+        return {f'k{index}': get_shape(item)
+                for index, item in enumerate(value.values())}
+    if isinstance(value, (list, tuple)):
+        return [get_shape(item) for item in value]
+    if isinstance(value, str):
+        return f's{len(value)}'
+    if isinstance(value, bool):
+        return 'b'
+    if isinstance(value, int):
+        return 'i'
+    if isinstance(value, float):
+        return 'f'
+    return None
+
+
+def restore_shape(shape):
+    """
+    Build a value of the shape (see `get_shape()`), with placeholder
+    strings of the original lengths.
+    """
+    if isinstance(shape, dict):
+        return {key: restore_shape(item) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [restore_shape(item) for item in shape]
+    if isinstance(shape, str):
+        if shape.startswith('s'):
+            return 'x' * int(shape[1:])
+        return {'b': False, 'i': 0, 'f': 0.0}.get(shape)
+    return None
+
+
+def get_record(handler, msg_ctx) -> 'dict':
+    return {
+        'time': time.time(),
+        'handler': handler.name,
+        'language': msg_ctx.language,
+        'recipients': len(msg_ctx.recipients),
+        'context': get_shape(msg_ctx.context),
+    }
+
+
+def maybe_capture(handler, msg_ctx) -> 'bool':
+    """
+    Append a record of the message to `capture_file`, if it is sampled.
+
+    :return:
+        Whether the message was captured.
+    """
+    path = msg_settings.capture_file
+    if not path or random.random() >= msg_settings.capture_rate:
+        return False
+
+    line = json.dumps(get_record(handler, msg_ctx)) + '\n'
+    try:
+        with _lock, open(path, 'a') as f:
+            f.write(line)
+    except OSError:
+        # Capture never breaks message creation
+        return False
+    return True
+
+
+def read_records(path: 'str') -> 'Iterator[dict]':
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
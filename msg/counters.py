@@ -0,0 +1,158 @@
+"""
+Message counts per handler and status (e.g. backlog depth for dashboards
+and autoscaling), without counting the messages table.
+
+Statement-level triggers on the messages table append count changes of
+each INSERT, UPDATE and DELETE to `MsgCounterDelta`, so concurrent writers
+never contend for the same counter row. `reconcile()`, run periodically
+(`msg.tasks.reconcile_counters`), folds the deltas into `MsgCounter`.
+Counts are read from both tables, so they are exact, and reading them
+costs O(handlers * statuses + pending deltas).
+
+TRUNCATE is not tracked, use `rebuild()` afterwards.
+"""
+from typing import Dict
+from typing import List
+
+from django.db import connections
+from django.db import transaction
+
+from .models import Msg
+from .models import MsgCounter
+from .models import MsgCounterDelta
+from .settings import msg_settings
+
+FUNCTION = 'msg_count_changes'
+TRIGGERS = {
+    'msg_count_insert': ('INSERT', 'NEW TABLE AS new_rows'),
+    'msg_count_update': ('UPDATE', 'OLD TABLE AS old_rows '
+                                   'NEW TABLE AS new_rows'),
+    'msg_count_delete': ('DELETE', 'OLD TABLE AS old_rows'),
+}
+
+
+def get_install_sql(table: 'str' = None) -> 'List[str]':
+    """
+    :return:
+        Statements creating the trigger function and triggers on the
+        messages table (or `table`).
+    """
+    delta_table = MsgCounterDelta._meta.db_table
+    statements = [f'''
+        CREATE OR REPLACE FUNCTION {FUNCTION}() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO {delta_table} (type, status, delta)
+                SELECT type, status, COUNT(*) FROM new_rows
+                GROUP BY type, status;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO {delta_table} (type, status, delta)
+                SELECT type, status, -COUNT(*) FROM old_rows
+                GROUP BY type, status;
+            ELSE
+                INSERT INTO {delta_table} (type, status, delta)
+                SELECT type, status, SUM(change) FROM (
+                    SELECT type, status, 1 AS change FROM new_rows
+                    UNION ALL
+                    SELECT type, status, -1 AS change FROM old_rows
+                ) changes
+                GROUP BY type, status
+                HAVING SUM(change) <> 0;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''']
+    statements += get_create_triggers_sql(table)
+    return statements
+
+
+def get_create_triggers_sql(table: 'str' = None) -> 'List[str]':
+    table = table or Msg._meta.db_table
+    return [
+        f'CREATE TRIGGER {name} AFTER {event} ON {table} '
+        f'REFERENCING {transition} '
+        f'FOR EACH STATEMENT EXECUTE PROCEDURE {FUNCTION}()'
+        for name, (event, transition) in TRIGGERS.items()
+    ]
+
+
+def get_drop_triggers_sql(table: 'str' = None) -> 'List[str]':
+    table = table or Msg._meta.db_table
+    return [f'DROP TRIGGER IF EXISTS {name} ON {table}'
+            for name in TRIGGERS]
+
+
+def get_uninstall_sql() -> 'List[str]':
+    return get_drop_triggers_sql() + [f'DROP FUNCTION {FUNCTION}()']
+
+
+def get_backfill_sql() -> 'str':
+    return (
+        f'INSERT INTO {MsgCounter._meta.db_table} (type, status, count) '
+        f'SELECT type, status, COUNT(*) FROM {Msg._meta.db_table} '
+        f'GROUP BY type, status'
+    )
+
+
+def reconcile(using: 'str' = 'default') -> 'None':
+    """
+    Fold pending deltas into the counters.
+    """
+    counter_table = MsgCounter._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'''
+            WITH moved AS (
+                DELETE FROM {MsgCounterDelta._meta.db_table}
+                RETURNING type, status, delta
+            )
+            INSERT INTO {counter_table} (type, status, count)
+            SELECT type, status, SUM(delta) FROM moved
+            GROUP BY type, status
+            ON CONFLICT (type, status) DO UPDATE
+            SET count = {counter_table}.count + EXCLUDED.count
+        ''')
+
+
+def rebuild(using: 'str' = 'default') -> 'None':
+    """
+    Recount the counters from the messages table. Writes to the messages
+    table wait until it is done.
+    """
+    with transaction.atomic(using=using), \
+            connections[using].cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {Msg._meta.db_table} IN SHARE MODE')
+        cursor.execute(f'DELETE FROM {MsgCounterDelta._meta.db_table}')
+        cursor.execute(f'DELETE FROM {MsgCounter._meta.db_table}')
+        cursor.execute(get_backfill_sql())
+
+
+def get_counts(using: 'str' = None) -> 'Dict[str, Dict[str, int]]':
+    """
+    :param using:
+        Database alias, `read_db` by default
+
+    :return:
+        Number of messages per handler and status name, e.g.
+        `{'welcome': {'NEW': 10, 'DONE': 1000}}`. Statuses without
+        messages are omitted.
+    """
+    with connections[using or msg_settings.read_db].cursor() as cursor:
+        cursor.execute(f'''
+            SELECT type, status, SUM(count) FROM (
+                SELECT type, status, count
+                FROM {MsgCounter._meta.db_table}
+                UNION ALL
+                SELECT type, status, delta
+                FROM {MsgCounterDelta._meta.db_table}
+            ) counts
+            GROUP BY type, status
+            HAVING SUM(count) <> 0
+            ORDER BY type, status
+        ''')
+        rows = cursor.fetchall()
+
+    counts: 'Dict[str, Dict[str, int]]' = {}
+    for handler, status, count in rows:
+        counts.setdefault(handler, {})[Msg.Status(status).name] = int(count)
+    return counts
@@ -4,3 +4,18 @@ class AmbiguousMsgHandlerException(Exception):
 
 class MissingHandlerException(Exception):
     pass
+
+
+class CircuitOpenException(Exception):
+    """
+    Provider's circuit breaker is open, message is not sent.
+    """
+
+    def __init__(self, provider: 'str', retry_after: 'float',
+                 defer: 'bool' = False):
+        super().__init__(f'Circuit breaker of {provider!r} provider is open '
+                         f'(retry after {retry_after:.0f}s).')
+        self.provider = provider
+        self.retry_after = retry_after
+        # Message should be sent later instead of failing
+        self.defer = defer
@@ -1,16 +1,28 @@
 import abc
+import functools
 import inspect
+from datetime import datetime
+from datetime import timedelta
 from typing import ClassVar
 from typing import Dict
 from typing import List
 from typing import NamedTuple
 from typing import Set
+from typing import Tuple
+from typing import Union
 
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import get_template
+from django.core.mail import get_connection
+from django.core.mail.message import make_msgid
 
+from . import hedging
+from .backends import get_options_key
+from .backends import get_pool
 from .exceptions import AmbiguousMsgHandlerException
+from .exceptions import MissingHandlerException
+from .metrics import track
+from .rendering import get_template
 from .settings import msg_settings
 
 
@@ -18,6 +30,8 @@ class MsgCtx(NamedTuple):
     recipients: 'List[str]'
     context: 'dict'
     language: 'str' = msg_settings.default_lang
+    # Overrides `Handler.ttl` of the message
+    ttl: 'Union[float, None]' = None
 
 
 class BaseHandler:
@@ -110,6 +124,44 @@ class Handler(BaseHandler, metaclass=MetaHandler):
     Interface for creating new handlers.
     """
     name: 'str'
+    # Days after which messages are purged, per status name,
+    # overrides `retention` setting (see `msg.retention`).
+    retention: 'Union[Dict[str, int], None]' = None
+    # Messages with more recipients are sent in chunks of this size,
+    # each chunk tracked and retried independently (see `MsgDelivery`).
+    recipients_chunk_size: 'Union[int, None]' = None
+    # Handlers of the same provider share a circuit breaker, defaults
+    # to the handler name (see `msg.breaker`).
+    provider: 'Union[str, None]' = None
+    # Overrides `circuit_breaker` setting, `False` disables it.
+    circuit_breaker: 'Union[dict, bool, None]' = None
+    # Provider timeouts (in seconds), override `connect_timeout`
+    # and `read_timeout` settings.
+    connect_timeout: 'Union[float, None]' = None
+    read_timeout: 'Union[float, None]' = None
+    # Hedge provider calls (see `msg.hedging`), only for providers
+    # where a duplicated message is acceptable.
+    hedge: 'bool' = False
+    hedge_percentile: 'float' = 0.95
+    # Weighted pool of provider backends, overrides `backends` setting
+    # (see `msg.backends`).
+    backends: 'Union[List[dict], None]' = None
+    # Alias of the engine (from `TEMPLATES` setting) of handler's
+    # templates, all engines are tried if not set (see `msg.rendering`).
+    template_engine: 'Union[str, None]' = None
+    # Post-processing of HTML templates, done once per process when
+    # the template is compiled (see `msg.rendering`).
+    inline_css: 'bool' = False
+    minify_html: 'bool' = False
+    # Seconds during which messages to the same recipients are merged
+    # into a single digest message (see `merge()`).
+    coalesce_window: 'Union[float, None]' = None
+    # Recipients suppressed on the channel are not sent messages,
+    # None disables the check (see `msg.suppression`).
+    channel: 'Union[str, None]' = None
+    # Seconds after which unsent messages expire and are never sent,
+    # `MsgCtx.ttl` overrides it per message.
+    ttl: 'Union[float, None]' = None
 
     class Meta:
         fields = ['name']
@@ -123,35 +175,211 @@ class Handler(BaseHandler, metaclass=MetaHandler):
         pass
 
     @abc.abstractmethod
-    def send(self, msg):
+    def send(self, msg) -> 'Union[str, None]':
+        """
+        :param msg:
+            Msg instance
+
+        :return:
+            Provider's id of the sent message, if any (recorded in
+            `MsgAttempt`).
+        """
         pass
 
+    def render(self, msg) -> 'Union[dict, None]':
+        """
+        Render language dependent parts of the message (templates,
+        subject, etc.). Rendering is CPU-bound and must not touch
+        the network nor the database, so the dispatch pipeline can run
+        it in a different pool of workers than `send()`.
+
+        Default implementation renders nothing, in which case `send()`
+        is expected to do all the work.
+
+        :param msg:
+            Msg instance
+
+        :return:
+            Picklable dict available in `send()` via `get_rendered()`
+            or None.
+        """
+        return None
+
+    def get_rendered(self, msg) -> 'Union[dict, None]':
+        """
+        Return output of the render stage for the message. If the message
+        was not rendered ahead (e.g. it is dispatched outside of
+        the pipeline) it is rendered now.
+        """
+        if msg.rendered is None:
+            with track('render', self.name):
+                return self.render(msg)
+        return msg.rendered
+
+    def get_expires_at(self, msg_ctx: 'MsgCtx',
+                       created: 'datetime') -> 'Union[datetime, None]':
+        """
+        :return:
+            Time after which the message is not sent (see `ttl`), None
+            if it doesn't expire.
+        """
+        ttl = msg_ctx.ttl if msg_ctx.ttl is not None else self.ttl
+        if not ttl:
+            return None
+        return created + timedelta(seconds=ttl)
+
+    def merge(self, context: 'dict', new_context: 'dict') -> 'dict':
+        """
+        Merge context of a new message into context of the open digest
+        (see `coalesce_window`).
+
+        Default implementation keeps the latest context, with contexts of
+        all merged messages in `digest` list.
+
+        :param context:
+            Context of the digest
+
+        :param new_context:
+            Context of the new message
+
+        :return:
+            New context of the digest.
+        """
+        digest = context.get('digest') or [context]
+        return {**new_context, 'digest': digest + [new_context]}
+
+    def get_template_context(self, msg) -> 'dict':
+        """
+        Context of handler's templates, the same for every engine.
+
+        :param msg:
+            Msg instance
+        """
+        return msg.context
+
+    def render_template(self, template_name: 'str', msg,
+                        html: 'bool' = False) -> 'str':
+        """
+        :param html:
+            Whether it's an HTML template, post-processed according
+            to `inline_css` and `minify_html`
+        """
+        template = get_template(
+            template_name,
+            using=self.template_engine,
+            inline=html and self.inline_css,
+            minify=html and self.minify_html,
+        )
+        return template.render(self.get_template_context(msg))
+
+    def get_timeouts(self) -> 'Tuple[float, float]':
+        """
+        :return:
+            (connect timeout, read timeout) tuple in seconds.
+        """
+        connect_timeout = self.connect_timeout
+        if connect_timeout is None:
+            connect_timeout = msg_settings.connect_timeout
+        read_timeout = self.read_timeout
+        if read_timeout is None:
+            read_timeout = msg_settings.read_timeout
+        return connect_timeout, read_timeout
+
+    def call_provider(self, func, *args, **kwargs):
+        """
+        Call provider's API, hedged when `hedge` is set.
+        Latencies are tracked per `provider`.
+        """
+        return hedging.call(
+            functools.partial(func, *args, **kwargs),
+            tracker=hedging.get_tracker(self.provider or self.name),
+            hedge=self.hedge,
+            percentile=self.hedge_percentile,
+        )
+
+    def call_backend(self, func):
+        """
+        Call `func` with options of a backend from the pool
+        (see `msg.backends`), failing over to other backends on errors.
+        Without backends `func` is called with empty options, in which
+        case provider is configured from the settings.
+
+        :param func:
+            Callable taking backend options dict
+        """
+        pool = get_pool(self)
+        if pool is None:
+            return func({})
+        return pool.call(func)
+
+    def sample_args(self, index: 'int') -> 'Union[Tuple[tuple, dict], None]':
+        """
+        Return arguments (args and kwargs) of a synthetic message matched
+        by this handler. They are used by load tests (`msg_loadtest`
+        command). Handlers which return None can't be load tested.
+
+        :param index:
+            Sequence number of the generated message
+        """
+        return None
+
 
 class EmailHandler(Handler):
     subject: 'str'
     template_text: 'str'
     template_html: 'str'
 
+    provider = 'smtp'
+    channel = 'email'
+
     class Meta:
         fields = ['subject', 'template_text', 'template_html']
 
+    def render(self, msg) -> 'dict':
+        rendered = {
+            'subject': str(self.subject),
+            'body_text': self.render_template(self.template_text, msg),
+            'body_html': None,
+        }
+
+        if self.template_html:
+            rendered['body_html'] = self.render_template(
+                self.template_html, msg, html=True,
+            )
+
+        return rendered
+
     def send(self, msg):
         assert hasattr(settings, 'EMAIL_FROM'), (
             '`settings.EMAIL_FROM` is not set.'
         )
 
-        body_text = get_template(self.template_text).render(msg.context)
+        rendered = self.get_rendered(msg)
         email = EmailMultiAlternatives(
-            subject=str(self.subject),
-            body=body_text,
+            subject=rendered['subject'],
+            body=rendered['body_text'],
             from_email=settings.EMAIL_FROM,
             to=msg.recipients,
         )
 
-        if self.template_html:
-            body_html = get_template(self.template_html).render(msg.context)
-            email.attach_alternative(body_html, 'text/html')
-
+        if rendered['body_html'] is not None:
+            email.attach_alternative(rendered['body_html'], 'text/html')
+
+        # Set here, so it's known even if the backend doesn't report it
+        message_id = make_msgid()
+        email.extra_headers['Message-ID'] = message_id
+        self.call_backend(functools.partial(self._send_email, email))
+        return message_id
+
+    def _send_email(self, email: 'EmailMultiAlternatives',
+                    backend: 'dict') -> 'None':
+        # Backend options are arguments of the email backend,
+        # e.g. `host`, `port`, `username`, `password`, `use_tls`.
+        email.connection = get_connection(
+            # SMTP has a single timeout, for connecting and reading
+            timeout=max(self.get_timeouts()),
+            **backend
+        )
         email.send()
 
 
@@ -160,11 +388,22 @@ class SESHandler(Handler):
     template_text: 'str'
     template_html: 'str'
 
+    provider = 'ses'
+    channel = 'email'
+
     class Meta:
         fields = ['subject', 'template_text', 'template_html']
 
     charset = 'utf-8'
 
+    def render(self, msg) -> 'dict':
+        return {
+            'subject': str(self.subject),
+            'body_text': self.render_template(self.template_text, msg),
+            'body_html': self.render_template(self.template_html, msg,
+                                              html=True),
+        }
+
     def send(self, msg):
         assert hasattr(settings, 'EMAIL_HOST_USER'), (
             '`settings.EMAIL_HOST_USER` is not set.'
@@ -176,37 +415,54 @@ class SESHandler(Handler):
 
         email_sender = f'{settings.EMAIL_FROM} <{settings.EMAIL_HOST_USER}>'
 
-        body_txt = get_template(self.template_text).render(msg.context)
-        body_html = get_template(self.template_html).render(msg.context)
-
-        client = self._get_client()
-        client.send_email(
+        rendered = self.get_rendered(msg)
+        response = self.call_backend(functools.partial(
+            self._send_email, email_sender, msg.recipients, rendered,
+        ))
+        return response['MessageId']
+
+    def _send_email(self, email_sender: 'str', recipients: 'List[str]',
+                    rendered: 'dict', backend: 'dict') -> 'dict':
+        client = self._get_client(backend)
+        return self.call_provider(
+            client.send_email,
             Source=email_sender,
             Destination={
-                'ToAddresses': msg.recipients,
+                'ToAddresses': recipients,
             },
             Message={
                 'Subject': {
-                    'Data': str(self.subject),
+                    'Data': rendered['subject'],
                     'Charset': self.charset,
                 },
                 'Body': {
                     'Text': {
-                        'Data': body_txt,
+                        'Data': rendered['body_text'],
                         'Charset': self.charset,
                     },
                     'Html': {
-                        'Data': body_html,
+                        'Data': rendered['body_html'],
                         'Charset': self.charset,
                     }
                 }
             }
         )
 
-    @staticmethod
-    def _get_client():
+    def _get_client(self, backend: 'dict' = None):
+        """
+        :param backend:
+            Options overriding the settings: `region_name`,
+            `endpoint_url`, `aws_access_key_id`, `aws_secret_access_key`
+        """
+        from botocore.config import Config
+
+        connect_timeout, read_timeout = self.get_timeouts()
         kwargs = {
             'region_name': getattr(settings, 'AWS_SES_REGION_NAME'),
+            'config': Config(
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+            ),
         }
         if hasattr(settings, 'AWS_SES_ACCESS_KEY_ID'):
             kwargs['aws_access_key_id'] = settings.AWS_SES_ACCESS_KEY_ID
@@ -214,6 +470,11 @@ class SESHandler(Handler):
         if hasattr(settings, 'AWS_SES_SECRET_ACCESS_KEY'):
             kwargs['aws_secret_access_key'] = settings.AWS_SES_SECRET_ACCESS_KEY
 
+        if hasattr(settings, 'AWS_SES_ENDPOINT_URL'):
+            kwargs['endpoint_url'] = settings.AWS_SES_ENDPOINT_URL
+
+        kwargs.update(backend or {})
+
         import boto3
         return boto3.client('ses', **kwargs)
 
@@ -221,27 +482,122 @@ class SESHandler(Handler):
 class TwilioHandler(Handler):
     template_text: 'str'
 
+    provider = 'twilio'
+    channel = 'sms'
+
     class Meta:
         fields = ['template_text']
 
+    def render(self, msg) -> 'dict':
+        return {
+            'body': self.render_template(self.template_text, msg),
+        }
+
     def send(self, msg):
-        assert hasattr(settings, 'TWILIO_ACCOUNT_SID'), (
-            '`settings.TWILIO_ACCOUNT_SID` is not set.'
-        )
-        assert hasattr(settings, 'TWILIO_AUTH_TOKEN'), (
-            '`settings.TWILIO_AUTH_TOKEN` is not set.'
-        )
+        body = self.get_rendered(msg)['body']
+        clients = {}
+
+        def send_sms(recipient, backend):
+            key = get_options_key(backend)
+            if key not in clients:
+                clients[key] = self._get_client(backend)
+            return self.call_provider(
+                clients[key].api.account.messages.create,
+                to=recipient,
+                from_=(backend['from_number'] if 'from_number' in backend
+                       else settings.TWILIO_FROM_PHONE_NUMBER),
+                body=body,
+            )
 
-        sid = settings.TWILIO_ACCOUNT_SID
-        auth_token = settings.TWILIO_AUTH_TOKEN
+        # Each recipient is sent separately, so it's balanced
+        # (and failed over) on its own.
+        sids = []
+        for recipient in msg.recipients:
+            message = self.call_backend(functools.partial(send_sms, recipient))
+            sids.append(message.sid)
+        return ','.join(sids)
 
+    def _get_client(self, backend: 'dict' = None):
+        """
+        :param backend:
+            Options overriding the settings: `account_sid`, `auth_token`,
+            `from_number`, `base_url`
+        """
+        from twilio.http.http_client import TwilioHttpClient
         from twilio.rest import Client
-        client = Client(sid, auth_token)
-        body = get_template(self.template_text).render(msg.context)
 
-        for recipient in msg.recipients:
-            client.api.account.messages.create(
-                to=recipient,
-                from_=settings.TWILIO_FROM_PHONE_NUMBER,
-                body=body,
+        backend = backend or {}
+        if 'account_sid' not in backend:
+            assert hasattr(settings, 'TWILIO_ACCOUNT_SID'), (
+                '`settings.TWILIO_ACCOUNT_SID` is not set.'
+            )
+        if 'auth_token' not in backend:
+            assert hasattr(settings, 'TWILIO_AUTH_TOKEN'), (
+                '`settings.TWILIO_AUTH_TOKEN` is not set.'
+            )
+        sid = backend.get('account_sid', getattr(
+            settings, 'TWILIO_ACCOUNT_SID', None,
+        ))
+        auth_token = backend.get('auth_token', getattr(
+            settings, 'TWILIO_AUTH_TOKEN', None,
+        ))
+        http_client = TwilioHttpClient()
+        # Passed to requests, which accepts (connect, read) tuple,
+        # the constructor accepts a number only.
+        http_client.timeout = self.get_timeouts()
+        client = Client(sid, auth_token, http_client=http_client)
+
+        if 'base_url' in backend:
+            client.api.base_url = backend['base_url']
+        elif hasattr(settings, 'TWILIO_API_BASE_URL'):
+            client.api.base_url = settings.TWILIO_API_BASE_URL
+
+        return client
+
+
+class MultiChannelHandler(Handler):
+    """
+    Handler of a logical message sent over several channels at once
+    (e.g. an email and an SMS). It is routed and parsed once, then
+    a message of each channel handler is created (see `MsgGroup`).
+
+    Channel handlers are regular handlers, their messages are rendered,
+    sent and tracked on their own. Their `match()` usually returns False,
+    so they aren't routed to directly.
+    """
+    # Names of channel handlers
+    channels: 'List[str]'
+
+    class Meta:
+        fields = ['channels']
+
+    @abc.abstractmethod
+    def parse(self, *args, **kwargs) -> 'Dict[str, MsgCtx]':
+        """
+        :return:
+            Context of each channel, by channel handler name. Channels
+            which are left out (e.g. the user has no phone number) are
+            not sent.
+        """
+        pass
+
+    def send(self, msg):
+        raise NotImplementedError(
+            'Messages of multi-channel handlers are sent by channel handlers.'
+        )
+
+    def get_channel(self, handler_name: 'str') -> 'Handler':
+        """
+        :return:
+            Instance of the channel handler.
+        """
+        if handler_name not in self.channels:
+            raise MissingHandlerException(
+                f'{handler_name!r} is not a channel of {self.name!r} handler'
+            )
+        handler_cls = MetaHandler.get_handler_cls(handler_name)
+        if handler_cls is None:
+            raise MissingHandlerException(
+                f'{handler_name} - such message handler does not exist'
             )
+        return handler_cls()
@@ -0,0 +1,109 @@
+"""
+Hedged provider calls.
+
+A hedged call starts a second, identical attempt when the first one
+takes longer than the recent p95 latency of the provider, and returns
+the result of whichever attempt succeeds first. It bounds the tail
+latency at the cost of a few percent of extra requests, and both attempts
+may succeed, so use it only where a duplicate is acceptable
+(e.g. one-time password SMS).
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Callable
+from typing import Dict
+from typing import Union
+
+# Latencies kept per provider
+WINDOW = 500
+# Calls are not hedged until there are enough latencies to estimate p95
+MIN_SAMPLES = 20
+WORKERS = 32
+
+
+class LatencyTracker:
+    """
+    Rolling window of the latest latencies (in seconds).
+    """
+
+    def __init__(self, window: 'int' = WINDOW):
+        self._latencies: 'deque' = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def observe(self, latency: 'float') -> 'None':
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, p: 'float') -> 'Union[float, None]':
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+
+
+_trackers: 'Dict[str, LatencyTracker]' = {}
+_trackers_lock = threading.Lock()
+_executor: 'Union[ThreadPoolExecutor, None]' = None
+
+
+def get_tracker(key: 'str') -> 'LatencyTracker':
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+        return _trackers[key]
+
+
+def _get_executor() -> 'ThreadPoolExecutor':
+    global _executor
+    with _trackers_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS)
+        return _executor
+
+
+def call(func: 'Callable', tracker: 'LatencyTracker',
+         hedge: 'bool' = False, percentile: 'float' = 0.95):
+    """
+    Call `func` and record its latency.
+
+    :param hedge:
+        Start a second attempt when the first one is slower than
+        `percentile` of the recent latencies.
+
+    :return:
+        Result of the first successful attempt.
+    """
+    delay = None
+    if hedge and len(tracker) >= MIN_SAMPLES:
+        delay = tracker.percentile(percentile)
+
+    start = time.monotonic()
+    if delay is None:
+        result = func()
+        tracker.observe(time.monotonic() - start)
+        return result
+
+    executor = _get_executor()
+    pending = {executor.submit(func)}
+    done, pending = wait(pending, timeout=delay)
+    if not done:
+        pending.add(executor.submit(func))
+
+    error = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                tracker.observe(time.monotonic() - start)
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Union
+
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .exceptions import MissingHandlerException
+from .handlers import Handler
+from .handlers import MetaHandler
+from .handlers import MultiChannelHandler
+from .models import Msg
+from .models import MsgContext
+from .models import context_digest
+from .settings import msg_settings
+
+COLUMNS = ['type', 'status', 'language', 'recipients', 'context',
+           'context_ref_id', 'created', 'modified', 'attempts',
+           'expires_at']
+
+
+class _Router:
+    """
+    Route items to handlers. Unlike `Msg.objects.create_from_any()`,
+    handlers are instantiated once for all items. Multi-channel handlers
+    are not supported, messages are written with `COPY` one per item.
+    """
+
+    def __init__(self, handler_name: 'Union[str, None]' = None):
+        if handler_name is None:
+            self.handler = None
+            self.handlers = [
+                handler_cls()
+                for handler_cls in MetaHandler.get_handlers().values()
+                if not issubclass(handler_cls, MultiChannelHandler)
+            ]
+            return
+
+        handler_cls = MetaHandler.get_handler_cls(handler_name)
+        if handler_cls is None:
+            raise MissingHandlerException(
+                f'{handler_name} - such message handler does not exist'
+            )
+        if issubclass(handler_cls, MultiChannelHandler):
+            raise MissingHandlerException(
+                f"{handler_name} - multi-channel handlers can't be used "
+                f"for bulk creation"
+            )
+        self.handler = handler_cls()
+
+    def route(self, item) -> 'Handler':
+        if self.handler is not None:
+            return self.handler
+
+        for handler in self.handlers:
+            if handler.match(item):
+                return handler
+
+        raise MissingHandlerException(
+            f'No handler found for provided arguments (args: {item!r}).'
+        )
+
+
+def _chunks(items: 'Iterable', size: 'int') -> 'Iterator[list]':
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_create_from_any(items: 'Iterable', handler: 'str' = None,
+                         chunk_size: 'int' = 10000,
+                         using: 'str' = 'default',
+                         returning: 'bool' = False,
+                         ) -> 'Iterator[Union[int, List[int]]]':
+    """
+    Create messages from a stream of items with constant memory.
+    Each item is routed (`match()`) and parsed (`parse()`) as the only
+    argument, then messages are written with `COPY` in chunks.
+
+    It's a generator, it yields after each written chunk.
+
+    :param items:
+        Iterable of items, e.g. rows of a CSV file, or a queryset
+        (iterated with `.iterator()`)
+
+    :param handler:
+        Handler name, if provided items are not routed
+
+    :param chunk_size:
+        Number of messages written at once
+
+    :param using:
+        Database alias
+
+    :param returning:
+        Whether to yield primary keys of the created messages.
+        Chunks are copied to a temporary staging table and moved
+        with `INSERT ... SELECT ... RETURNING`, which is slower.
+
+    :return:
+        Number of messages (or list of primary keys) of each chunk.
+    """
+    if isinstance(items, QuerySet):
+        items = items.iterator()
+
+    router = _Router(handler)
+    deduplicate = msg_settings.context_storage == 'deduplicated'
+    stored: 'Set[str]' = set()
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(Msg._meta.db_table)
+    columns = ', '.join(qn(column) for column in COLUMNS)
+    staging = qn('msg_import_staging')
+
+    with connection.cursor() as cursor:
+        if returning:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+        try:
+            for chunk in _chunks(items, chunk_size):
+                now = timezone.now()
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for item in chunk:
+                    h = router.route(item)
+                    msg_ctx = h.parse(item)
+                    expires_at = h.get_expires_at(msg_ctx, now)
+
+                    context, context_ref = msg_ctx.context, None
+                    if deduplicate and context:
+                        digest = context_digest(context)
+                        if digest not in stored:
+                            MsgContext.objects.db_manager(using).store(
+                                context,
+                            )
+                            stored.add(digest)
+                        context, context_ref = {}, digest
+
+                    writer.writerow([
+                        h.name,
+                        Msg.Status.NEW.value,
+                        msg_ctx.language,
+                        json.dumps(msg_ctx.recipients),
+                        json.dumps(context),
+                        context_ref,
+                        now.isoformat(),
+                        now.isoformat(),
+                        0,
+                        (expires_at.isoformat()
+                         if expires_at is not None else None),
+                    ])
+                buffer.seek(0)
+
+                if not returning:
+                    cursor.copy_expert(
+                        f'COPY {table} ({columns}) '
+                        f'FROM STDIN WITH (FORMAT csv)',
+                        buffer,
+                    )
+                    yield len(chunk)
+                    continue
+
+                cursor.copy_expert(
+                    f'COPY {staging} ({columns}) '
+                    f'FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+                cursor.execute(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'SELECT {columns} FROM {staging} RETURNING id'
+                )
+                pks = [row[0] for row in cursor.fetchall()]
+                cursor.execute(f'TRUNCATE {staging}')
+                yield pks
+        finally:
+            if returning:
+                cursor.execute(f'DROP TABLE IF EXISTS {staging}')
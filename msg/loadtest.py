@@ -0,0 +1,303 @@
+"""
+Load testing of the message pipeline (see `msg_loadtest` command) and
+replay of captured traffic (see `msg_replay` command and `msg.capture`).
+
+Importing this module registers synthetic handlers for each built-in
+handler base (`loadtest-email`, `loadtest-ses` and `loadtest-twilio`).
+To load test with celery, add them to `handlers` setting of the workers.
+"""
+import math
+import queue
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Sequence
+
+from django.db import connection
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from .capture import restore_shape
+from .handlers import EmailHandler
+from .handlers import Handler
+from .handlers import MetaHandler
+from .handlers import MsgCtx
+from .handlers import SESHandler
+from .handlers import TwilioHandler
+from .models import Msg
+
+FINAL_STATUSES = (Msg.Status.DONE.value, Msg.Status.ERROR.value,
+                  Msg.Status.SUPPRESSED.value, Msg.Status.EXPIRED.value)
+
+# Recipients of replayed messages per handler channel
+REPLAY_RECIPIENT_FORMATS = {
+    'sms': '+1555{index:07d}',
+}
+REPLAY_RECIPIENT_FORMAT = 'replay-{index}@example.com'
+
+
+class LoadTestMsg(NamedTuple):
+    handler: 'str'
+    index: 'int'
+
+
+class LoadTestMixin:
+    subject = 'Load test'
+    template_text = 'msg/loadtest/message.txt'
+    template_html = 'msg/loadtest/message.html'
+    recipient_format = 'loadtest-{index}@example.com'
+
+    def match(self, obj=None, *args, **kwargs):
+        return isinstance(obj, LoadTestMsg) and obj.handler == self.name
+
+    def parse(self, obj: 'LoadTestMsg') -> 'MsgCtx':
+        return MsgCtx(
+            recipients=[self.recipient_format.format(index=obj.index)],
+            context={'username': f'user-{obj.index}', 'index': obj.index},
+        )
+
+    def sample_args(self, index):
+        return (LoadTestMsg(handler=self.name, index=index),), {}
+
+
+class LoadTestEmailHandler(LoadTestMixin, EmailHandler):
+    name = 'loadtest-email'
+
+
+class LoadTestSESHandler(LoadTestMixin, SESHandler):
+    name = 'loadtest-ses'
+
+
+class LoadTestTwilioHandler(LoadTestMixin, TwilioHandler):
+    name = 'loadtest-twilio'
+    recipient_format = '+1555{index:07d}'
+
+
+class LoadTestReport(NamedTuple):
+    msg_pks: 'List[int]'
+    count: 'int'
+    done: 'int'
+    errors: 'int'
+    # Messages which didn't reach final status before the timeout
+    unfinished: 'int'
+    duration: 'float'
+    # Seconds per percentile (see `PERCENTILES`)
+    end_to_end_latency: 'Dict[float, float]'
+    send_latency: 'Dict[float, float]'
+    # Queries made by the load test process (Msg.new and dispatch)
+    queries_per_msg: 'float'
+
+    @property
+    def throughput(self) -> 'float':
+        return self.done / self.duration if self.duration else 0.0
+
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def percentiles(values: 'Sequence[float]') -> 'Dict[float, float]':
+    """
+    Nearest-rank percentiles of the values.
+    """
+    values = sorted(values)
+    if not values:
+        return {p: None for p in PERCENTILES}
+    return {
+        p: values[max(int(math.ceil(p * len(values))) - 1, 0)]
+        for p in PERCENTILES
+    }
+
+
+def get_handlers(names: 'Sequence[str]') -> 'List[Handler]':
+    handlers = []
+    for name in names:
+        handler_cls = MetaHandler.get_handler_cls(name)
+        if handler_cls is None:
+            raise ValueError(f'Handler {name!r} does not exist.')
+        handler = handler_cls()
+        if handler.sample_args(0) is None:
+            raise ValueError(f'Handler {name!r} does not define '
+                             '`sample_args()`, it cannot be load tested.')
+        handlers.append(handler)
+    return handlers
+
+
+def run_load_test(handlers: 'Sequence[Handler]', count: 'int',
+                  concurrency: 'int' = 1, use_async: 'bool' = False,
+                  timeout: 'float' = 600) -> 'LoadTestReport':
+    """
+    Create `count` messages (split evenly between handlers) with
+    `Msg.new()` and dispatch them from `concurrency` threads.
+    If `use_async` is set, messages are dispatched by celery workers
+    and the test waits for them (at most `timeout` seconds).
+    """
+    pks: 'List[int]' = []
+    queries: 'List[int]' = []
+    start = time.perf_counter()
+
+    def produce(indexes):
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                for index in indexes:
+                    handler = handlers[index % len(handlers)]
+                    args, kwargs = handler.sample_args(index)
+                    msg = Msg.new(*args, dispatch_now=False, **kwargs)
+                    pks.append(msg.pk)
+                    try:
+                        msg.dispatch(async=use_async)
+                    except Exception:
+                        # Status is set to ERROR and reported below
+                        pass
+            queries.append(len(captured))
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=produce, args=(range(i, count, concurrency),))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    queryset = Msg.objects.filter(pk__in=pks)
+    while use_async and time.perf_counter() - start < timeout:
+        if not queryset.exclude(status__in=FINAL_STATUSES).exists():
+            break
+        time.sleep(0.5)
+
+    return get_report(pks, count, time.perf_counter() - start, queries)
+
+
+def get_report(pks: 'List[int]', count: 'int', duration: 'float',
+               queries: 'List[int]') -> 'LoadTestReport':
+    rows = list(Msg.objects.filter(pk__in=pks).values_list(
+        'status', 'created', 'started_at', 'sent_at',
+    ))
+    done = [row for row in rows if row[0] == Msg.Status.DONE.value]
+
+    return LoadTestReport(
+        msg_pks=pks,
+        count=count,
+        done=len(done),
+        errors=sum(row[0] == Msg.Status.ERROR.value for row in rows),
+        unfinished=sum(row[0] not in FINAL_STATUSES for row in rows),
+        duration=duration,
+        end_to_end_latency=percentiles([
+            (sent_at - created).total_seconds()
+            for _, created, _, sent_at in done
+        ]),
+        send_latency=percentiles([
+            (sent_at - started_at).total_seconds()
+            for _, _, started_at, sent_at in done
+        ]),
+        queries_per_msg=sum(queries) / count if count else 0.0,
+    )
+
+
+def get_replay_ctx(record: 'dict', index: 'int') -> 'MsgCtx':
+    """
+    Message context of the captured record (see `msg.capture`), with
+    generated recipients and placeholder values.
+    """
+    handler_cls = MetaHandler.get_handler_cls(record['handler'])
+    recipient_format = REPLAY_RECIPIENT_FORMATS.get(
+        handler_cls.channel, REPLAY_RECIPIENT_FORMAT,
+    )
+    first = index * 1000
+    return MsgCtx(
+        recipients=[recipient_format.format(index=first + i)
+                    for i in range(record['recipients'])],
+        context=restore_shape(record['context']) or {},
+        language=record['language'],
+    )
+
+
+def run_replay(records: 'Sequence[dict]', speed: 'float' = 1.0,
+               concurrency: 'int' = 1) -> 'LoadTestReport':
+    """
+    Create messages of the captured records with
+    `Msg.objects.create_from_ctx()` and dispatch them from `concurrency`
+    threads. Records are replayed at their captured pace, `speed` times
+    faster (as fast as possible if 0).
+    """
+    missing = {record['handler'] for record in records
+               if MetaHandler.get_handler_cls(record['handler']) is None}
+    if missing:
+        raise ValueError('Handlers of captured messages do not exist: '
+                         + ', '.join(sorted(missing)))
+
+    pks: 'List[int]' = []
+    queries: 'List[int]' = []
+    jobs: 'queue.Queue' = queue.Queue()
+    start = time.perf_counter()
+
+    def consume():
+        try:
+            with CaptureQueriesContext(connection) as captured:
+                while True:
+                    job = jobs.get()
+                    if job is None:
+                        break
+                    index, record = job
+                    msg = Msg.objects.create_from_ctx(
+                        record['handler'], get_replay_ctx(record, index),
+                    )
+                    pks.append(msg.pk)
+                    try:
+                        msg.dispatch(async=False)
+                    except Exception:
+                        # Status is set to ERROR and reported below
+                        pass
+            queries.append(len(captured))
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=consume) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    first = records[0]['time'] if records else 0
+    for index, record in enumerate(records):
+        if speed:
+            delay = ((record['time'] - first) / speed
+                     - (time.perf_counter() - start))
+            if delay > 0:
+                time.sleep(delay)
+        jobs.put((index, record))
+
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+
+    return get_report(pks, len(records), time.perf_counter() - start,
+                      queries)
+
+
+def format_report(report: 'LoadTestReport') -> 'List[str]':
+    lines = [
+        f'Messages:   {report.count} '
+        f'(done {report.done}, errors {report.errors}, '
+        f'unfinished {report.unfinished})',
+        f'Duration:   {report.duration:.2f}s',
+        f'Throughput: {report.throughput:.1f} msg/s',
+        f'Queries:    {report.queries_per_msg:.1f} per message '
+        f'(load test process only)',
+    ]
+    for label, latency in (('End-to-end', report.end_to_end_latency),
+                           ('Send', report.send_latency)):
+        lines.append(f'{label} latency: ' + ', '.join(
+            f'p{int(p * 100)} {_format_seconds(value)}'
+            for p, value in latency.items()
+        ))
+    return lines
+
+
+def _format_seconds(value) -> 'str':
+    if value is None:
+        return '-'
+    return f'{value * 1000:.1f}ms'
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from msg.models import Msg
+
+
+class Command(BaseCommand):
+    help = 'Mark unsent messages past their expiry time as EXPIRED.'
+
+    def handle(self, *args, **options):
+        count = Msg.objects.expire()
+        self.stdout.write(f'Expired {count} messages.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from msg.models import Msg
+
+
+class Command(BaseCommand):
+    help = 'Dispatch digests whose coalescing window has passed.'
+
+    def handle(self, *args, **options):
+        count = Msg.objects.flush_digests()
+        self.stdout.write(f'Dispatched {count} digests.')
@@ -0,0 +1,47 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from msg.exceptions import MissingHandlerException
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class Command(BaseCommand):
+    help = ('Create messages from a CSV file, each row (a dict keyed by '
+            'the header) is passed to the handler as the only argument.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='CSV file with a header, "-" for stdin.')
+        parser.add_argument('--handler',
+                            help='Handler name, rows are routed if omitted.')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of messages written at once.')
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--dispatch', action='store_true',
+                            help='Dispatch messages chunk by chunk.')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            return self._import(sys.stdin, options)
+
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            return self._import(file, options)
+
+    def _import(self, file, options):
+        rows = csv.DictReader(file, delimiter=options['delimiter'])
+        try:
+            count = Msg.bulk_new(
+                rows,
+                dispatch_now=options['dispatch'],
+                async=msg_settings.async,
+                handler=options['handler'],
+                chunk_size=options['chunk_size'],
+            )
+        except MissingHandlerException as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f'Created {count} messages.')
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from msg.loadtest import format_report
+from msg.loadtest import get_handlers
+from msg.loadtest import run_load_test
+from msg.models import Msg
+from msg.standins import ProviderStandIns
+from msg.standins import send_to_standins
+
+
+class Command(BaseCommand):
+    help = ('Send synthetic messages through Msg.new and dispatch '
+            'to local stand-ins of the providers and report throughput, '
+            'latency and database queries per message.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--count', type=int, default=1000,
+                            help='Number of messages to send.')
+        parser.add_argument(
+            '--handler', dest='handlers', action='append',
+            help='Name of the handler to load test (can be repeated). '
+                 'Handler has to define `sample_args()`. '
+                 'Default: loadtest-email.',
+        )
+        parser.add_argument('-c', '--concurrency', type=int, default=1,
+                            help='Number of threads creating messages.')
+        parser.add_argument('--async', action='store_true', dest='use_async',
+                            help='Dispatch messages with celery.')
+        parser.add_argument('--timeout', type=float, default=600,
+                            help='Seconds to wait for celery workers.')
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Latency of the stand-ins in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests the stand-ins fail.')
+        parser.add_argument('--smtp-port', type=int, default=0,
+                            help='Port of the SMTP stand-in (random).')
+        parser.add_argument('--http-port', type=int, default=0,
+                            help='Port of SES/Twilio stand-in (random).')
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete generated messages.')
+
+    def handle(self, *args, **options):
+        # Registers synthetic `loadtest-*` handlers
+        import msg.loadtest  # noqa: F401
+
+        try:
+            handlers = get_handlers(options['handlers'] or ['loadtest-email'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        standins = ProviderStandIns(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            smtp_port=options['smtp_port'],
+            http_port=options['http_port'],
+        )
+        with standins, send_to_standins(standins):
+            self.stdout.write(
+                f'SMTP stand-in on port {standins.smtp_port}, '
+                f'SES/Twilio stand-in on port {standins.http_port}.'
+            )
+            report = run_load_test(
+                handlers,
+                count=options['count'],
+                concurrency=options['concurrency'],
+                use_async=options['use_async'],
+                timeout=options['timeout'],
+            )
+
+        if not options['keep']:
+            Msg.objects.filter(pk__in=report.msg_pks).delete()
+
+        for line in format_report(report):
+            self.stdout.write(line)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from msg import partitioning
+
+
+class Command(BaseCommand):
+    help = ('Manage range partitioning of messages table by creation date: '
+            '"convert" the table, "ensure" future monthly partitions exist '
+            'or "drop" old partitions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['convert', 'ensure', 'drop'])
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Number of future monthly partitions.')
+        parser.add_argument('--older-than-days', type=int,
+                            help='Drop partitions of messages older '
+                                 'than that (required by "drop").')
+        parser.add_argument('--drop-foreign-keys', action='store_true',
+                            help='Drop foreign keys referencing messages '
+                                 'table during conversion.')
+        parser.add_argument('--keep-old', action='store_true',
+                            help='Keep the original table after conversion.')
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'convert':
+            if partitioning.is_partitioned():
+                raise CommandError('Messages table is already partitioned.')
+            try:
+                partitioning.convert_to_partitioned(
+                    months_ahead=options['months_ahead'],
+                    drop_foreign_keys=options['drop_foreign_keys'],
+                    keep_old=options['keep_old'],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write('Messages table has been partitioned.')
+            return
+
+        if not partitioning.is_partitioned():
+            raise CommandError('Messages table is not partitioned, '
+                               'run "convert" first.')
+
+        if action == 'ensure':
+            names = partitioning.ensure_partitions(options['months_ahead'])
+            self.stdout.write(f'Created partitions: {", ".join(names) or "-"}')
+            return
+
+        if options['older_than_days'] is None:
+            raise CommandError('--older-than-days is required.')
+        before = timezone.now() - timedelta(days=options['older_than_days'])
+        names = partitioning.drop_partitions(before.date())
+        self.stdout.write(f'Dropped partitions: {", ".join(names) or "-"}')
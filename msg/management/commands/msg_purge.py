@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from msg.models import MsgContext
+from msg.retention import get_rules
+from msg.retention import purge
+
+
+class Command(BaseCommand):
+    help = ('Delete messages older than their retention '
+            '(see `retention` setting) in small chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of messages deleted at once.')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Pause between chunks in seconds.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print retention rules.')
+        parser.add_argument('--contexts-grace-hours', type=int, default=24,
+                            help='Keep unreferenced deduplicated contexts '
+                                 'younger than this.')
+
+    def handle(self, *args, **options):
+        try:
+            rules = get_rules()
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if not rules:
+            self.stdout.write('No retention is configured.')
+
+        for rule in rules:
+            description = (f'{rule.status.name} messages '
+                           f'of {rule.type or "all handlers"} '
+                           f'created before {rule.cutoff:%Y-%m-%d %H:%M}')
+            if options['dry_run']:
+                self.stdout.write(f'Would delete {description}.')
+                continue
+
+            deleted = purge(rule, chunk_size=options['chunk_size'],
+                            sleep=options['sleep'])
+            self.stdout.write(f'Deleted {deleted} {description}.')
+
+        if not options['dry_run']:
+            deleted = MsgContext.objects.purge_orphans(
+                older_than=timezone.now() - timedelta(
+                    hours=options['contexts_grace_hours'],
+                ),
+                chunk_size=options['chunk_size'],
+            )
+            self.stdout.write(f'Deleted {deleted} unreferenced contexts.')
@@ -0,0 +1,63 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from msg.capture import read_records
+from msg.loadtest import format_report
+from msg.loadtest import run_replay
+from msg.models import Msg
+from msg.standins import ProviderStandIns
+from msg.standins import send_to_standins
+
+
+class Command(BaseCommand):
+    help = ('Replay captured traffic (see `capture_file` setting) through '
+            'Msg.objects.create_from_ctx and dispatch to local stand-ins '
+            'of the providers and report throughput and latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Capture file (JSON lines).')
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Speed multiplier of the captured pace, 0 replays '
+                 'as fast as possible.',
+        )
+        parser.add_argument('-n', '--limit', type=int, default=None,
+                            help='Replay at most this many messages.')
+        parser.add_argument('-c', '--concurrency', type=int, default=1,
+                            help='Number of threads sending messages.')
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Latency of the stand-ins in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests the stand-ins fail.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete replayed messages.')
+
+    def handle(self, *args, **options):
+        try:
+            records = list(itertools.islice(read_records(options['path']),
+                                            options['limit']))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read the capture: {exc}')
+
+        standins = ProviderStandIns(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+        )
+        with standins, send_to_standins(standins):
+            try:
+                report = run_replay(
+                    records,
+                    speed=options['speed'],
+                    concurrency=options['concurrency'],
+                )
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        if not options['keep']:
+            Msg.objects.filter(pk__in=report.msg_pks).delete()
+
+        for line in format_report(report):
+            self.stdout.write(line)
+
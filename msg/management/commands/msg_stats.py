@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from msg.counters import get_counts
+from msg.models import Msg
+from msg.stats import PERCENTILES
+from msg.stats import get_handler_stats
+
+
+class Command(BaseCommand):
+    help = ('Report queue lag and send latency percentiles '
+            'of sent messages per handler.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--minutes',
+            type=int,
+            default=60,
+            help='Time window (in minutes) of sent messages to report on.',
+        )
+        parser.add_argument(
+            '--counts',
+            action='store_true',
+            help='Report number of messages per handler and status instead.',
+        )
+
+    def handle(self, *args, **options):
+        if options['counts']:
+            self._write_counts()
+            return
+
+        since = timezone.now() - timedelta(minutes=options['minutes'])
+        stats = get_handler_stats(since)
+
+        if not stats:
+            self.stdout.write('No messages sent in the given time window.')
+            return
+
+        percentiles = [f'p{int(p * 100)}' for p in PERCENTILES]
+        header = ['handler', 'count']
+        header += [f'lag {p}' for p in percentiles]
+        header += [f'send {p}' for p in percentiles]
+
+        rows = [header]
+        for item in stats:
+            rows.append(
+                [item.handler, str(item.count)]
+                + [_format_seconds(v) for v in item.queue_lag]
+                + [_format_seconds(v) for v in item.send_latency]
+            )
+
+        self._write_table(rows)
+
+    def _write_counts(self):
+        statuses = [status.name for status in Msg.Status]
+        rows = [['handler'] + [status.lower() for status in statuses]]
+        for handler, counts in sorted(get_counts().items()):
+            rows.append([handler] + [str(counts.get(status, 0))
+                                     for status in statuses])
+        self._write_table(rows)
+
+    def _write_table(self, rows):
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(rows[0]))]
+        for row in rows:
+            self.stdout.write('  '.join(
+                val.ljust(width) for val, width in zip(row, widths)
+            ))
+
+
+def _format_seconds(value) -> 'str':
+    if value is None:
+        return '-'
+    return f'{value:.3f}s'
@@ -0,0 +1,274 @@
+"""
+Instrumentation of the dispatch pipeline.
+
+Every stage of the pipeline (routing, parsing, rendering, sending and status
+writes) is wrapped with `track()`. When `metrics_backend` setting is not set,
+`track()` returns a shared no-op object, so instrumentation costs a function
+call per stage.
+"""
+import threading
+import time
+from typing import Dict
+from typing import Tuple
+from typing import Union
+
+from .settings import msg_settings
+
+STAGE_TOTAL = 'msg_stage_total'
+STAGE_DURATION = 'msg_stage_duration_seconds'
+STAGE_IN_FLIGHT = 'msg_stage_in_flight'
+
+METRICS = {
+    STAGE_TOTAL: (
+        'counter',
+        'Number of processed pipeline stages.',
+        ('stage', 'handler', 'outcome'),
+    ),
+    STAGE_DURATION: (
+        'histogram',
+        'Duration of pipeline stages in seconds.',
+        ('stage', 'handler', 'outcome'),
+    ),
+    STAGE_IN_FLIGHT: (
+        'gauge',
+        'Number of pipeline stages in progress.',
+        ('stage', 'handler'),
+    ),
+}
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class MetricsBackend:
+    """
+    Interface for metrics backends. Labels are passed as keyword
+    arguments and match label names declared in `METRICS`.
+    """
+
+    def inc(self, name: 'str', value: 'float' = 1, **labels) -> 'None':
+        raise NotImplementedError
+
+    def observe(self, name: 'str', value: 'float', **labels) -> 'None':
+        raise NotImplementedError
+
+    def gauge_add(self, name: 'str', value: 'float', **labels) -> 'None':
+        raise NotImplementedError
+
+    def export(self) -> 'str':
+        """
+        Return metrics in the Prometheus text exposition format.
+        """
+        raise NotImplementedError
+
+
+class LocalMetricsBackend(MetricsBackend):
+    """
+    Thread-safe, in-memory metrics of the current process.
+    """
+
+    def __init__(self, buckets: 'Tuple[float, ...]' = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values: 'Dict[Tuple[str, tuple], Union[float, list]]' = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    gauge_add = inc
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # [count per bucket..., +Inf count, sum]
+            hist = self._values.get(key)
+            if hist is None:
+                hist = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+
+    def export(self):
+        with self._lock:
+            values = sorted(
+                (key, list(val) if isinstance(val, list) else val)
+                for key, val in self._values.items()
+            )
+
+        lines = []
+        for name, (kind, help_text, _) in sorted(METRICS.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (key_name, labels), val in values:
+                if key_name != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {val}')
+                    continue
+
+                for bound, count in zip(self.buckets, val):
+                    lines.append(f'{name}_bucket'
+                                 f'{_format_labels(labels, le=bound)} {count}')
+                lines.append(f'{name}_bucket'
+                             f'{_format_labels(labels, le="+Inf")} {val[-2]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {val[-2]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {val[-1]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> 'None':
+        with self._lock:
+            self._values.clear()
+
+
+class PrometheusClientBackend(MetricsBackend):
+    """
+    Backend using `prometheus_client` package. Use it when metrics
+    from many processes (e.g. celery workers) have to be aggregated,
+    see `prometheus_client` documentation on the multiprocess mode.
+    """
+
+    def __init__(self, buckets: 'Tuple[float, ...]' = DEFAULT_BUCKETS):
+        import prometheus_client
+
+        classes = {
+            'counter': prometheus_client.Counter,
+            'gauge': prometheus_client.Gauge,
+            'histogram': prometheus_client.Histogram,
+        }
+        self._metrics = {}
+        for name, (kind, help_text, label_names) in METRICS.items():
+            kwargs = {'buckets': buckets} if kind == 'histogram' else {}
+            if kind == 'gauge':
+                kwargs['multiprocess_mode'] = 'livesum'
+            self._metrics[name] = classes[kind](
+                # Counter's `_total` suffix is added by the client
+                name[:-len('_total')] if kind == 'counter' else name,
+                help_text,
+                label_names,
+                **kwargs
+            )
+
+    def inc(self, name, value=1, **labels):
+        self._metrics[name].labels(**labels).inc(value)
+
+    def observe(self, name, value, **labels):
+        self._metrics[name].labels(**labels).observe(value)
+
+    def gauge_add(self, name, value, **labels):
+        self._metrics[name].labels(**labels).inc(value)
+
+    def export(self):
+        import os
+        import prometheus_client
+        from prometheus_client import multiprocess
+
+        registry = prometheus_client.REGISTRY
+        if 'prometheus_multiproc_dir' in os.environ:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry).decode('utf-8')
+
+
+def _format_labels(labels: 'tuple', **extra) -> 'str':
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    values = ','.join(
+        f'{key}="{_escape(str(val))}"' for key, val in items
+    )
+    return '{' + values + '}'
+
+
+def _escape(value: 'str') -> 'str':
+    return (value.replace('\\', '\\\\')
+                 .replace('\n', '\\n')
+                 .replace('"', '\\"'))
+
+
+class _NullStage:
+    handler = ''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _Stage:
+    __slots__ = ('backend', 'stage', 'handler', 'in_flight_handler', 'start')
+
+    def __init__(self, backend: 'MetricsBackend', stage: 'str',
+                 handler: 'str'):
+        self.backend = backend
+        self.stage = stage
+        self.handler = handler
+        self.in_flight_handler = handler
+
+    def __enter__(self):
+        self.backend.gauge_add(
+            STAGE_IN_FLIGHT, 1, stage=self.stage, handler=self.handler,
+        )
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self.start
+        outcome = 'ok' if exc_type is None else 'error'
+        # `handler` may have been set inside the block (e.g. by routing),
+        # in-flight gauge is decremented with labels it was incremented.
+        self.backend.gauge_add(
+            STAGE_IN_FLIGHT, -1, stage=self.stage,
+            handler=self.in_flight_handler,
+        )
+        self.backend.inc(
+            STAGE_TOTAL, stage=self.stage, handler=self.handler,
+            outcome=outcome,
+        )
+        self.backend.observe(
+            STAGE_DURATION, duration, stage=self.stage, handler=self.handler,
+            outcome=outcome,
+        )
+        return False
+
+
+_NULL_STAGE = _NullStage()
+_UNSET = object()
+_backend: 'Union[MetricsBackend, None]' = _UNSET
+
+
+def get_backend() -> 'Union[MetricsBackend, None]':
+    global _backend
+    if _backend is _UNSET:
+        backend_cls = msg_settings.metrics_backend
+        _backend = backend_cls() if backend_cls is not None else None
+    return _backend
+
+
+def set_backend(backend: 'Union[MetricsBackend, None]') -> 'None':
+    """
+    Replace configured metrics backend (e.g. in tests).
+    """
+    global _backend
+    _backend = backend
+
+
+def track(stage: 'str', handler: 'str' = '') -> 'Union[_Stage, _NullStage]':
+    """
+    Context manager measuring a stage of the pipeline. Routing stage
+    doesn't know the handler up front, it may set `handler` attribute
+    of the returned object inside the block.
+
+    >>> with track('send', handler.name):
+    ...     handler.send(msg)
+    """
+    backend = _backend if _backend is not _UNSET else get_backend()
+    if backend is None:
+        return _NULL_STAGE
+    return _Stage(backend, stage, handler)
@@ -0,0 +1,34 @@
+# Generated by Django 2.0.13 on 2026-10-19 06:58
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0002_auto_20180517_0948'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='msg',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='Attempts'),
+        ),
+        migrations.AddField(
+            model_name='msg',
+            name='enqueued_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Enqueued at'),
+        ),
+        migrations.AddField(
+            model_name='msg',
+            name='sent_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Sent at'),
+        ),
+        migrations.AddField(
+            model_name='msg',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Started at'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:04
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0003_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='msg',
+            index=models.Index(fields=['status', 'created'], name='msg_status_created_idx'),
+        ),
+    ]
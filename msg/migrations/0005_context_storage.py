@@ -0,0 +1,29 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:08
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0004_retention_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MsgContext',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Digest')),
+                ('compression', models.CharField(blank=True, max_length=8, verbose_name='Compression')),
+                ('data', models.BinaryField(verbose_name='Data')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='msg',
+            name='context_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='msg.MsgContext', verbose_name='Deduplicated context'),
+        ),
+    ]
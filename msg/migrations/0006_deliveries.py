@@ -0,0 +1,38 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:12
+
+import django.contrib.postgres.fields.jsonb
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0005_context_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MsgDelivery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Position')),
+                ('chunk', models.PositiveIntegerField(verbose_name='Chunk')),
+                ('recipient', django.contrib.postgres.fields.jsonb.JSONField(verbose_name='Recipient')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR')], default=1, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='Modified')),
+                ('msg', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='msg.Msg', verbose_name='Message')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='msgdelivery',
+            index=models.Index(fields=['msg', 'chunk'], name='msg_delivery_chunk_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='msgdelivery',
+            unique_together={('msg', 'position')},
+        ),
+    ]
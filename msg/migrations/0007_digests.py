@@ -0,0 +1,28 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:21
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0006_deliveries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='msg',
+            name='coalesce_until',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Coalesce until'),
+        ),
+        migrations.AddField(
+            model_name='msg',
+            name='digest_key',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Digest key'),
+        ),
+        migrations.AddIndex(
+            model_name='msg',
+            index=models.Index(fields=['digest_key', 'status'], name='msg_digest_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:24
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0007_digests'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=32, verbose_name='Channel')),
+                ('recipient', models.CharField(max_length=255, verbose_name='Recipient')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='Reason')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='msg',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED')], default=1, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='msgdelivery',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED')], default=1, verbose_name='Status'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='suppression',
+            unique_together={('channel', 'recipient')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:26
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0008_suppression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='msg',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Expires at'),
+        ),
+        migrations.AlterField(
+            model_name='msg',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED'), (6, 'EXPIRED')], default=1, verbose_name='Status'),
+        ),
+        migrations.AlterField(
+            model_name='msgdelivery',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED'), (6, 'EXPIRED')], default=1, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:29
+
+from django.db import migrations
+from django.db import models
+
+# Copy of `msg.counters` SQL at the time of the migration
+INSTALL_SQL = [
+    '''
+    CREATE OR REPLACE FUNCTION msg_count_changes() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO msg_msgcounterdelta (type, status, delta)
+            SELECT type, status, COUNT(*) FROM new_rows
+            GROUP BY type, status;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO msg_msgcounterdelta (type, status, delta)
+            SELECT type, status, -COUNT(*) FROM old_rows
+            GROUP BY type, status;
+        ELSE
+            INSERT INTO msg_msgcounterdelta (type, status, delta)
+            SELECT type, status, SUM(change) FROM (
+                SELECT type, status, 1 AS change FROM new_rows
+                UNION ALL
+                SELECT type, status, -1 AS change FROM old_rows
+            ) changes
+            GROUP BY type, status
+            HAVING SUM(change) <> 0;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'CREATE TRIGGER msg_count_insert AFTER INSERT ON msg_msg '
+    'REFERENCING NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE msg_count_changes()',
+    'CREATE TRIGGER msg_count_update AFTER UPDATE ON msg_msg '
+    'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE msg_count_changes()',
+    'CREATE TRIGGER msg_count_delete AFTER DELETE ON msg_msg '
+    'REFERENCING OLD TABLE AS old_rows '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE msg_count_changes()',
+    'INSERT INTO msg_msgcounter (type, status, count) '
+    'SELECT type, status, COUNT(*) FROM msg_msg GROUP BY type, status',
+]
+UNINSTALL_SQL = [
+    'DROP TRIGGER IF EXISTS msg_count_insert ON msg_msg',
+    'DROP TRIGGER IF EXISTS msg_count_update ON msg_msg',
+    'DROP TRIGGER IF EXISTS msg_count_delete ON msg_msg',
+    'DROP FUNCTION msg_count_changes()',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0009_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MsgCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=255, verbose_name='Type')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED'), (6, 'EXPIRED')], verbose_name='Status')),
+                ('count', models.BigIntegerField(default=0, verbose_name='Count')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MsgCounterDelta',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=255, verbose_name='Type')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED'), (6, 'EXPIRED')], verbose_name='Status')),
+                ('delta', models.BigIntegerField(verbose_name='Delta')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='msgcounter',
+            unique_together={('type', 'status')},
+        ),
+        migrations.RunSQL(INSTALL_SQL, UNINSTALL_SQL),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:32
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MsgAttempt',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('attempt', models.PositiveIntegerField(verbose_name='Attempt')),
+                ('chunk', models.PositiveIntegerField(blank=True, null=True, verbose_name='Chunk')),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'NEW'), (2, 'PENDING'), (3, 'DONE'), (4, 'ERROR'), (5, 'SUPPRESSED'), (6, 'EXPIRED')], verbose_name='Status')),
+                ('enqueued_at', models.DateTimeField(blank=True, null=True, verbose_name='Enqueued at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('finished_at', models.DateTimeField(verbose_name='Finished at')),
+                ('provider_id', models.CharField(blank=True, max_length=255, verbose_name='Provider id')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('msg', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='attempt_log', to='msg.Msg', verbose_name='Message')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:37
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0011_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='msg',
+            name='group',
+            field=models.UUIDField(blank=True, db_index=True, null=True, verbose_name='Group'),
+        ),
+    ]
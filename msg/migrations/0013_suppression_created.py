@@ -0,0 +1,19 @@
+# Generated by Django 2.0.13 on 2026-10-19 07:51
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('msg', '0012_groups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='suppression',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created'),
+        ),
+    ]
@@ -1,28 +1,280 @@
+import copy
+import hashlib
+import json
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
 from enum import Enum
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
 from typing import Union
 
 from django.contrib.postgres.fields import JSONField
+from django.db import connections
 from django.db import models
+from django.db import router
+from django.db import transaction
+from django.utils import timezone
 from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 
+from . import capture
+from .breaker import get_breaker
+from .breaker import is_provider_failure
+from .exceptions import CircuitOpenException
 from .exceptions import MissingHandlerException
 from .handlers import Handler
 from .handlers import MetaHandler
+from .handlers import MsgCtx
+from .handlers import MultiChannelHandler
+from .metrics import track
+from .profiling import profile
 from .settings import msg_settings
+from .suppression import filter_recipients
+from .suppression import normalize_recipient
+
+
+def get_digest_key(handler_name: 'str', language: 'str',
+                   recipients: 'list') -> 'str':
+    """
+    Key of the digest messages are coalesced into
+    (see `Handler.coalesce_window`).
+    """
+    return hashlib.sha256(
+        _canonical_json([handler_name, language, recipients]),
+    ).hexdigest()
+
+
+def _canonical_json(context: 'dict') -> 'bytes':
+    return json.dumps(context, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def context_digest(context: 'dict') -> 'str':
+    return hashlib.sha256(_canonical_json(context)).hexdigest()
+
+
+def encode_context(context: 'dict') -> 'Tuple[str, str, bytes]':
+    """
+    Serialize context in a canonical form.
+
+    :return:
+        (sha256 hex digest, compression, data) tuple. Data is compressed
+        only when it is at least `context_compression_min_size` bytes.
+    """
+    raw = _canonical_json(context)
+    digest = hashlib.sha256(raw).hexdigest()
+
+    compression = msg_settings.context_compression or ''
+    if len(raw) < msg_settings.context_compression_min_size:
+        compression = ''
+
+    if compression == MsgContext.Compression.ZLIB:
+        data = zlib.compress(raw)
+    elif compression == MsgContext.Compression.ZSTD:
+        import zstandard
+        data = zstandard.ZstdCompressor().compress(raw)
+    elif not compression:
+        data = raw
+    else:
+        raise ValueError(f'Unknown context compression {compression!r}.')
+    return digest, compression, data
+
+
+def decode_context(compression: 'str', data: 'bytes') -> 'str':
+    data = bytes(data)
+    if compression == MsgContext.Compression.ZLIB:
+        data = zlib.decompress(data)
+    elif compression == MsgContext.Compression.ZSTD:
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+class _ContextCache:
+    """
+    Per-process LRU cache of decoded contexts (as JSON text).
+    Contexts are content-addressed, so an entry never goes stale.
+    """
+
+    def __init__(self, size: 'int' = 128):
+        self.size = size
+        self._data: 'OrderedDict' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: 'str') -> 'Union[str, None]':
+        with self._lock:
+            text = self._data.get(digest)
+            if text is not None:
+                self._data.move_to_end(digest)
+            return text
+
+    def put(self, digest: 'str', text: 'str') -> 'None':
+        with self._lock:
+            self._data[digest] = text
+            self._data.move_to_end(digest)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> 'None':
+        with self._lock:
+            self._data.clear()
+
+
+_context_cache = _ContextCache()
+
+
+class MsgContextManager(models.Manager):
+
+    def store(self, context: 'dict') -> 'str':
+        """
+        Save context unless the same one is stored already.
+
+        :return:
+            Digest of the context.
+        """
+        digest, compression, data = encode_context(context)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(digest, compression, data, created) '
+                f'VALUES (%s, %s, %s, %s) '
+                f'ON CONFLICT (digest) DO NOTHING',
+                [digest, compression, data, timezone.now()],
+            )
+        return digest
+
+    def load(self, digest: 'str') -> 'dict':
+        return self.load_many([digest])[digest]
+
+    def load_many(self, digests: 'Iterable[str]') -> 'Dict[str, dict]':
+        """
+        Load contexts, missing in the per-process cache ones with
+        a single query. Each call returns new copies of the contexts.
+        """
+        digests = set(digests)
+        texts = {}
+        for digest in digests:
+            text = _context_cache.get(digest)
+            if text is not None:
+                texts[digest] = text
+
+        missing = digests - set(texts)
+        if missing:
+            rows = self.filter(digest__in=missing).values_list(
+                'digest', 'compression', 'data',
+            )
+            for digest, compression, data in rows:
+                texts[digest] = decode_context(compression, data)
+                _context_cache.put(digest, texts[digest])
+
+        return {digest: json.loads(text) for digest, text in texts.items()}
+
+    def purge_orphans(self, older_than, chunk_size: 'int' = 1000) -> 'int':
+        """
+        Delete contexts no message refers to, in chunks.
+
+        :param older_than:
+            Only contexts created before this time are deleted, so
+            a context stored for a message being created is kept.
+
+        :return:
+            Number of deleted contexts.
+        """
+        table = self.model._meta.db_table
+        deleted = 0
+        while True:
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE digest IN ('
+                    f'  SELECT c.digest FROM {table} c'
+                    f'  WHERE c.created < %s AND NOT EXISTS ('
+                    f'    SELECT 1 FROM {Msg._meta.db_table} m'
+                    f'    WHERE m.context_ref_id = c.digest'
+                    f'  ) LIMIT %s'
+                    f')',
+                    [older_than, chunk_size],
+                )
+                count = cursor.rowcount
+            deleted += count
+            if count < chunk_size:
+                return deleted
+
+
+class MsgContext(models.Model):
+    """
+    Content-addressed message context, shared by messages with
+    the same context (see `context_storage` setting).
+    """
+
+    class Compression:
+        ZLIB = 'zlib'
+        ZSTD = 'zstd'
+
+    digest = models.CharField(
+        verbose_name=_('Digest'),
+        max_length=64,
+        primary_key=True,
+    )
+    compression = models.CharField(
+        verbose_name=_('Compression'),
+        max_length=8,
+        blank=True,
+    )
+    data = models.BinaryField(
+        verbose_name=_('Data'),
+    )
+    created = models.DateTimeField(
+        verbose_name=_('Created'),
+        auto_now_add=True,
+    )
+
+    objects = MsgContextManager()
+
+    def get_context(self) -> 'dict':
+        return json.loads(decode_context(self.compression, self.data))
 
 
 class MsgManager(models.Manager):
 
-    def create_from_any(self, *args, **kwargs) -> 'Msg':
+    def primary(self) -> 'models.QuerySet':
+        """
+        Queryset on the database messages are written to, for reads which
+        must not lag behind (dispatch, claims), unlike `read_db`.
+        """
+        return self.using(router.db_for_write(self.model))
+
+    def create_from_any(self, *args,
+                        **kwargs) -> 'Union[Msg, MsgGroup]':
+        """
+        :return:
+            Created message, or group of messages when the arguments are
+            matched by a multi-channel handler.
+        """
+        with profile('create') as session:
+            obj = self._create_from_any(*args, **kwargs)
+            session.handler = obj.type
+            session.msg_id = (obj.group if isinstance(obj, MsgGroup)
+                              else obj.pk)
+        return obj
 
+    def _create_from_any(self, *args, **kwargs) -> 'Union[Msg, MsgGroup]':
         handler: 'Union[Handler, None]' = None
 
-        for handler_name, handler_cls in MetaHandler.get_handlers().items():
-            h: 'Handler' = handler_cls()
-            if h.match(*args, **kwargs):
-                handler = h
-                break
+        handlers = MetaHandler.get_handlers()
+
+        with track('route') as stage:
+            for handler_name, handler_cls in handlers.items():
+                h: 'Handler' = handler_cls()
+                if h.match(*args, **kwargs):
+                    handler = h
+                    stage.handler = h.name
+                    break
 
         if handler is None:
             raise MissingHandlerException(
@@ -30,7 +282,34 @@ class MsgManager(models.Manager):
                 f'(args: {args!r}, kwargs: {kwargs!r}).'
             )
 
-        msg_ctx = handler.parse(*args, **kwargs)
+        with track('parse', handler.name):
+            msg_ctx = handler.parse(*args, **kwargs)
+
+        if isinstance(handler, MultiChannelHandler):
+            return self._create_group(handler, msg_ctx)
+
+        if msg_settings.capture_rate:
+            capture.maybe_capture(handler, msg_ctx)
+
+        return self._create(handler, msg_ctx)
+
+    def create_from_ctx(self, handler_name: 'str',
+                        msg_ctx: 'MsgCtx') -> 'Msg':
+        """
+        Create a message of the handler from already parsed context,
+        without routing and parsing (e.g. replay of captured traffic,
+        see `msg.capture`).
+        """
+        handler_cls = MetaHandler.get_handler_cls(handler_name)
+        if handler_cls is None:
+            raise MissingHandlerException(
+                f'{handler_name} - such message handler does not exist'
+            )
+        return self._create(handler_cls(), msg_ctx)
+
+    def _create(self, handler: 'Handler', msg_ctx: 'MsgCtx') -> 'Msg':
+        if handler.coalesce_window:
+            return self._coalesce(handler, msg_ctx)
 
         obj: 'Msg' = self.model(
             type=handler.name,
@@ -38,16 +317,271 @@ class MsgManager(models.Manager):
             language=msg_ctx.language,
             recipients=msg_ctx.recipients,
             context=msg_ctx.context,
+            expires_at=handler.get_expires_at(msg_ctx, timezone.now()),
         )
         obj.handler = handler
 
         self._for_write = True
-        obj.save(force_insert=True, using=self.db)
+        with track('insert', handler.name):
+            if (msg_ctx.context
+                    and msg_settings.context_storage == 'deduplicated'):
+                obj.context_ref_id = MsgContext.objects.db_manager(
+                    self.db,
+                ).store(msg_ctx.context)
+                # Row keeps an empty context, the instance the whole one
+                obj.context = {}
+                obj.save(force_insert=True, using=self.db)
+                obj.context = msg_ctx.context
+                obj._context_loaded = True
+            else:
+                obj.save(force_insert=True, using=self.db)
+        return obj
+
+    def _create_group(self, handler: 'MultiChannelHandler',
+                      msg_ctxs: 'Dict[str, MsgCtx]') -> 'MsgGroup':
+        """
+        Create a message of each channel with one insert, the messages
+        share the group id. Channel messages are not coalesced.
+        """
+        group = uuid.uuid4()
+        now = timezone.now()
+        objs: 'List[Msg]' = []
+        for channel_name, msg_ctx in msg_ctxs.items():
+            channel = handler.get_channel(channel_name)
+            if msg_settings.capture_rate:
+                capture.maybe_capture(channel, msg_ctx)
+
+            obj: 'Msg' = self.model(
+                type=channel.name,
+                status=Msg.Status.NEW.value,
+                language=msg_ctx.language,
+                recipients=msg_ctx.recipients,
+                context=msg_ctx.context,
+                expires_at=channel.get_expires_at(msg_ctx, now),
+                group=group,
+            )
+            obj.handler = channel
+            objs.append(obj)
+
+        self._for_write = True
+        with track('insert', handler.name):
+            contexts = [obj.context for obj in objs]
+            if msg_settings.context_storage == 'deduplicated':
+                storage = MsgContext.objects.db_manager(self.db)
+                for obj in objs:
+                    if obj.context:
+                        # Channels usually share the context, it's stored
+                        # once.
+                        obj.context_ref_id = storage.store(obj.context)
+                        # Row keeps an empty context, the instance the
+                        # whole one
+                        obj.context = {}
+                        obj._context_loaded = True
+            self.bulk_create(objs)
+            for obj, context in zip(objs, contexts):
+                obj.context = context
+        return MsgGroup(type=handler.name, group=group, msgs=objs)
+
+    def get_group_statuses(self, group: 'uuid.UUID') -> 'Dict[str, str]':
+        """
+        :return:
+            Status name of each channel message of the group, by channel
+            handler name, e.g. `{'welcome-email': 'DONE',
+            'welcome-sms': 'ERROR'}`.
+        """
+        rows = self.primary().filter(group=group).values_list('type',
+                                                              'status')
+        return {handler: Msg.Status(status).name for handler, status in rows}
+
+    def _coalesce(self, handler: 'Handler', msg_ctx) -> 'Msg':
+        """
+        Merge the message into the open digest of the same handler,
+        language and recipients, or open a new digest.
+        """
+        digest_key = get_digest_key(handler.name, msg_ctx.language,
+                                    msg_ctx.recipients)
+        now = timezone.now()
+
+        self._for_write = True
+        with transaction.atomic(using=self.db), \
+                track('insert', handler.name):
+            with connections[self.db].cursor() as cursor:
+                # Concurrent messages of the same digest wait for each
+                # other, so only one digest is open at a time.
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                               [int(digest_key[:15], 16)])
+
+            # Locked, so the digest isn't dispatched while merging
+            obj = self.select_for_update().filter(
+                digest_key=digest_key,
+                status=Msg.Status.NEW.value,
+                coalesce_until__gt=now,
+            ).order_by('-pk').first()
+
+            if obj is not None:
+                obj.handler = handler
+                obj.context = handler.merge(obj.context, msg_ctx.context)
+                obj.coalesced = True
+                # Digest lives as long as its latest message
+                obj.expires_at = handler.get_expires_at(msg_ctx, now)
+                obj.save(update_fields=['context', 'expires_at', 'modified'])
+                return obj
+
+            # Digests keep their context inline, it changes with merges
+            obj = self.model(
+                type=handler.name,
+                status=Msg.Status.NEW.value,
+                language=msg_ctx.language,
+                recipients=msg_ctx.recipients,
+                context=msg_ctx.context,
+                digest_key=digest_key,
+                coalesce_until=now + timedelta(
+                    seconds=handler.coalesce_window,
+                ),
+                expires_at=handler.get_expires_at(msg_ctx, now),
+            )
+            obj.handler = handler
+            obj.save(force_insert=True, using=self.db)
         return obj
 
+    def flush_digests(self, pks: 'Iterable[int]' = None) -> 'int':
+        """
+        Dispatch digests whose coalescing window has passed.
+
+        :param pks:
+            Flush only these digests
+
+        :return:
+            Number of dispatched digests.
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            # Digests claimed by concurrent flushes are skipped
+            queryset = self.select_for_update(skip_locked=True).filter(
+                status=Msg.Status.NEW.value,
+                digest_key__isnull=False,
+                coalesce_until__lte=now,
+            )
+            if pks is not None:
+                queryset = queryset.filter(pk__in=list(pks))
+            msgs = list(queryset)
+            self.filter(pk__in=[msg.pk for msg in msgs]).update(
+                status=Msg.Status.PENDING.value,
+                enqueued_at=now,
+                modified=now,
+            )
+
+        if msgs:
+            self.dispatch_batch(msgs)
+        return len(msgs)
+
+    def expire(self, pks: 'Iterable[int]' = None) -> 'int':
+        """
+        Mark unsent messages past their `expires_at` as `EXPIRED`.
+
+        :param pks:
+            Expire only these messages
+
+        :return:
+            Number of expired messages.
+        """
+        now = timezone.now()
+        queryset = self.filter(
+            status__in=[Msg.Status.NEW.value, Msg.Status.PENDING.value],
+            expires_at__lte=now,
+        )
+        if pks is not None:
+            queryset = queryset.filter(pk__in=list(pks))
+        return queryset.update(status=Msg.Status.EXPIRED.value, modified=now)
+
+    def load_contexts(self, msgs: 'Iterable[Msg]') -> 'None':
+        """
+        Load deduplicated contexts of many messages at once.
+        """
+        msgs = [msg for msg in msgs if msg.context_pending]
+        if not msgs:
+            return
+        contexts = MsgContext.objects.db_manager(self.db).load_many(
+            msg.context_ref_id for msg in msgs
+        )
+        for msg in msgs:
+            msg.context = contexts[msg.context_ref_id]
+            msg._context_loaded = True
+
+    def bulk_create_from_any(self, items: 'Iterable', handler: 'str' = None,
+                             chunk_size: 'int' = 10000) -> 'int':
+        """
+        Create messages from a stream of items with `COPY`
+        (see `msg.ingest.bulk_create_from_any`).
+
+        :return:
+            Number of created messages.
+        """
+        from .ingest import bulk_create_from_any
+
+        return sum(bulk_create_from_any(
+            items, handler=handler, chunk_size=chunk_size, using=self.db,
+        ))
+
+    def dispatch_batch(self, msgs: 'Iterable[Msg]',
+                       pipeline=None) -> 'List[Tuple[Msg, Exception]]':
+        """
+        Dispatch many messages at once with the render/send pipeline
+        (see `msg.pipeline.Pipeline`).
+
+        :param msgs:
+            Messages (or queryset of messages) to dispatch
+
+        :param pipeline:
+            Pipeline instance, if not provided pipeline is configured
+            from the settings.
+
+        :return:
+            List of (message, exception) pairs of failed messages.
+        """
+        from .pipeline import Pipeline
+
+        msgs = list(msgs)
+        now = timezone.now()
+
+        expired = [msg for msg in msgs
+                   if msg.expires_at is not None and msg.expires_at <= now]
+        if expired:
+            self.filter(pk__in=[msg.pk for msg in expired]).update(
+                status=Msg.Status.EXPIRED.value,
+                modified=now,
+            )
+            for msg in expired:
+                msg.status = Msg.Status.EXPIRED.value
+            msgs = [msg for msg in msgs
+                    if msg.status != Msg.Status.EXPIRED.value]
+
+        if not msg_settings.terminal_writes_only:
+            self.filter(pk__in=[msg.pk for msg in msgs]).update(
+                status=Msg.Status.PENDING.value,
+                enqueued_at=now,
+                modified=now,
+            )
+        for msg in msgs:
+            msg.status = Msg.Status.PENDING.value
+            msg.enqueued_at = now
+
+        if pipeline is None:
+            pipeline = Pipeline()
+        return pipeline.run(msgs)
+
 
 class Msg(models.Model):
     _handler: 'Handler'
+    rendered: 'Union[dict, None]' = None
+    _context_loaded = False
+    # Whether the message was merged into an existing digest
+    coalesced = False
+
+    # Written by `set_status()`, the other fields never change after
+    # the message is created.
+    STATUS_FIELDS = ['status', 'modified', 'enqueued_at', 'started_at',
+                     'sent_at', 'attempts']
 
     class Status(Enum):
         @classmethod
@@ -59,6 +593,10 @@ class Msg(models.Model):
         PENDING = 2
         DONE = 3
         ERROR = 4
+        # All recipients are on the suppression list
+        SUPPRESSED = 5
+        # Not sent before `expires_at`
+        EXPIRED = 6
 
     type = models.CharField(
         verbose_name=_('Type'),
@@ -81,6 +619,14 @@ class Msg(models.Model):
         default={},
         blank=True,
     )
+    context_ref = models.ForeignKey(
+        MsgContext,
+        verbose_name=_('Deduplicated context'),
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name='+',
+    )
     created = models.DateTimeField(
         verbose_name=_('Created'),
         auto_now_add=True,
@@ -89,51 +635,388 @@ class Msg(models.Model):
         _('Modified'),
         auto_now=True,
     )
+    enqueued_at = models.DateTimeField(
+        verbose_name=_('Enqueued at'),
+        null=True,
+        blank=True,
+    )
+    started_at = models.DateTimeField(
+        verbose_name=_('Started at'),
+        null=True,
+        blank=True,
+    )
+    sent_at = models.DateTimeField(
+        verbose_name=_('Sent at'),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name=_('Attempts'),
+        default=0,
+    )
+    digest_key = models.CharField(
+        verbose_name=_('Digest key'),
+        max_length=64,
+        null=True,
+        blank=True,
+    )
+    coalesce_until = models.DateTimeField(
+        verbose_name=_('Coalesce until'),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_('Expires at'),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    # Shared by channel messages of a multi-channel handler
+    group = models.UUIDField(
+        verbose_name=_('Group'),
+        null=True,
+        blank=True,
+        db_index=True,
+    )
 
     objects = MsgManager()
 
+    class Meta:
+        indexes = [
+            # Retention (see `msg.retention`)
+            models.Index(fields=['status', 'created'],
+                         name='msg_status_created_idx'),
+            # Open digests (see `Handler.coalesce_window`)
+            models.Index(fields=['digest_key', 'status'],
+                         name='msg_digest_idx'),
+        ]
+
     @staticmethod
     def new(*args, dispatch_now, async=msg_settings.async, **kwargs):
         msg = Msg.objects.create_from_any(*args, **kwargs)
 
-        if dispatch_now:
+        if isinstance(msg, MsgGroup):
+            if dispatch_now:
+                msg.dispatch(async=async)
+            return msg
+
+        if dispatch_now and msg.coalesce_until is not None:
+            # Digest is dispatched when its coalescing window passes
+            if async and not msg.coalesced:
+                from .tasks import dispatch_digest
+                dispatch_digest.apply_async((msg.pk,),
+                                            eta=msg.coalesce_until)
+        elif dispatch_now:
             msg.dispatch(async=async)
 
         return msg
 
+    @staticmethod
+    def bulk_new(items: 'Iterable', *, dispatch_now,
+                 async=msg_settings.async, handler: 'str' = None,
+                 chunk_size: 'int' = 10000) -> 'int':
+        """
+        Create (and dispatch) messages from a stream of items, each item
+        is passed to the handler as the only argument. Messages are
+        dispatched in batches, chunk by chunk.
+
+        :return:
+            Number of created messages.
+        """
+        from .ingest import bulk_create_from_any
+
+        if not dispatch_now:
+            return Msg.objects.bulk_create_from_any(
+                items, handler=handler, chunk_size=chunk_size,
+            )
+
+        count = 0
+        for pks in bulk_create_from_any(items, handler=handler,
+                                        chunk_size=chunk_size,
+                                        returning=True):
+            count += len(pks)
+            if async:
+                from .tasks import dispatch_msgs
+                dispatch_msgs.delay(pks)
+            else:
+                Msg.objects.dispatch_batch(Msg.objects.filter(pk__in=pks))
+        return count
+
     def set_status(self, new_status: 'Status', save=False) -> 'None':
         self.status = Msg.Status(new_status).value
 
         if save:
-            self.save()
+            with track('status', self.type):
+                self.save(update_fields=self.STATUS_FIELDS)
+
+    @property
+    def context_pending(self) -> 'bool':
+        """
+        Whether the context is stored deduplicated and not loaded yet.
+        """
+        return self.context_ref_id is not None and not self._context_loaded
+
+    def load_context(self) -> 'None':
+        if self.context_pending:
+            self.context = MsgContext.objects.load(self.context_ref_id)
+            self._context_loaded = True
 
     def dispatch(self, async=msg_settings.async):
-        self.set_status(Msg.Status.PENDING, save=True)
+        self.enqueued_at = timezone.now()
+        self._set_pending()
         if async:
             self._dispatch_delay()
         else:
-            self._dispatch()
+            self._dispatch(async=False)
 
-    def _dispatch(self):
-        cur_language = translation.get_language()
-        try:
-            translation.activate(self.language)
-            self._send()
-        except Exception as exc:
-            self.set_status(Msg.Status.ERROR, save=True)
-            raise exc
-        finally:
-            translation.activate(cur_language)
+    def _set_pending(self) -> 'None':
+        # Non-terminal transition, the row isn't written with
+        # `terminal_writes_only` (see `MsgAttempt`).
+        self.set_status(Msg.Status.PENDING,
+                        save=not msg_settings.terminal_writes_only)
 
-        self.set_status(Msg.Status.DONE, save=True)
+    def _log_attempt(self, status: 'Status', provider_id: 'str' = None,
+                     error: 'Exception' = None,
+                     chunk: 'int' = None) -> 'None':
+        with track('attempt', self.type):
+            MsgAttempt.objects.create(
+                msg_id=self.pk,
+                attempt=self.attempts,
+                chunk=chunk,
+                status=status.value,
+                enqueued_at=self.enqueued_at,
+                started_at=self.started_at,
+                finished_at=timezone.now(),
+                provider_id=(provider_id or '')[:255],
+                error=f'{type(error).__name__}: {error}' if error else '',
+            )
+
+    @property
+    def is_expired(self) -> 'bool':
+        return (self.expires_at is not None
+                and self.expires_at <= timezone.now())
+
+    def _dispatch(self, restore_language=True, async: 'bool' = None):
+        """
+        :param async:
+            Whether chunks of split messages are dispatched by celery
+            tasks, `async` setting by default.
+        """
+        if self.is_expired:
+            self.set_status(Msg.Status.EXPIRED, save=True)
+            return
+
+        if self.is_split:
+            self._dispatch_split(
+                msg_settings.async if async is None else async,
+            )
+            return
+
+        with profile('dispatch', self.type, self.pk):
+            # Written together with the final status
+            self.started_at = timezone.now()
+            self.attempts += 1
+
+            cur_language = translation.get_language()
+            try:
+                self.load_context()
+                self.recipients = filter_recipients(self.handler.channel,
+                                                    self.recipients)
+                if not self.recipients:
+                    self.set_status(Msg.Status.SUPPRESSED, save=True)
+                    return
+                if cur_language != self.language:
+                    translation.activate(self.language)
+                provider_id = self._send()
+            except CircuitOpenException as exc:
+                # Nothing was sent
+                self.attempts -= 1
+                if exc.defer:
+                    self._set_pending()
+                else:
+                    self.set_status(Msg.Status.ERROR, save=True)
+                raise exc
+            except Exception as exc:
+                self._log_attempt(Msg.Status.ERROR, error=exc)
+                self.set_status(Msg.Status.ERROR, save=True)
+                raise exc
+            finally:
+                # Batch dispatch sends messages grouped by the language,
+                # so it doesn't restore the language after each message.
+                if (restore_language
+                        and translation.get_language() != cur_language):
+                    translation.activate(cur_language)
+
+            self._log_attempt(Msg.Status.DONE, provider_id=provider_id)
+            self.sent_at = timezone.now()
+            self.set_status(Msg.Status.DONE, save=True)
 
-    def _send(self):
-        if not msg_settings.skip_send:
-            self.handler.send(self)
+    def _send(self) -> 'Union[str, None]':
+        """
+        :return:
+            Provider's id of the sent message (see `Handler.send()`).
+        """
+        if msg_settings.skip_send:
+            return None
+
+        # Rendered ahead, so the send stage measures the provider only
+        # and template errors don't count as failures of the provider
+        # in its circuit breaker.
+        self.rendered = self.handler.get_rendered(self)
+
+        breaker = get_breaker(self.handler)
+        trial = breaker.allow() if breaker is not None else False
+        try:
+            with track('send', self.type):
+                provider_id = self.handler.send(self)
+        except Exception as exc:
+            if breaker is not None:
+                if is_provider_failure(exc):
+                    breaker.failure(trial)
+                else:
+                    breaker.success(trial)
+            raise
+        if breaker is not None:
+            breaker.success(trial)
+        return provider_id
 
     def _dispatch_delay(self):
         from .tasks import dispatch_msg
-        dispatch_msg.delay(self.pk)
+        # Enqueue time is passed along, it may not be written to the row
+        dispatch_msg.delay(self.pk, self.enqueued_at.timestamp())
+
+    @property
+    def is_split(self) -> 'bool':
+        """
+        Whether the message is sent in recipient chunks
+        (see `Handler.recipients_chunk_size`).
+        """
+        handler_cls = MetaHandler.get_handler_cls(self.type)
+        chunk_size = getattr(handler_cls, 'recipients_chunk_size', None)
+        return bool(chunk_size) and len(self.recipients) > chunk_size
+
+    def _dispatch_split(self, async: 'bool') -> 'None':
+        # Only chunks which are not sent yet are dispatched, so
+        # dispatching the message again retries failed chunks.
+        # Written even with `terminal_writes_only`, chunks are finished
+        # by other workers which read the attempt from the row.
+        self.started_at = timezone.now()
+        self.attempts += 1
+        self.set_status(Msg.Status.PENDING, save=True)
+
+        chunks = MsgDelivery.objects.get_unsent_chunks(self)
+        if not chunks:
+            self._finish_split()
+            return
+
+        errors = []
+        for chunk in chunks:
+            if async:
+                from .tasks import dispatch_chunk
+                dispatch_chunk.delay(self.pk, chunk)
+                continue
+
+            try:
+                self.dispatch_chunk(chunk)
+            except Exception as exc:
+                errors.append(exc)
+
+        if errors:
+            raise errors[0]
+
+    def dispatch_chunk(self, chunk: 'int') -> 'None':
+        """
+        Send the message to recipients of the chunk which didn't get it
+        yet and finish the message when it is the last chunk.
+        """
+        deliveries = list(
+            self.deliveries.filter(chunk=chunk)
+            .exclude(status=Msg.Status.DONE.value)
+            .order_by('position')
+            .values_list('pk', 'recipient')
+        )
+        error = None
+
+        allowed = set(filter_recipients(
+            self.handler.channel,
+            [recipient for _, recipient in deliveries],
+        ))
+        if len(allowed) < len(deliveries):
+            suppressed = [pk for pk, recipient in deliveries
+                          if recipient not in allowed]
+            MsgDelivery.objects.filter(pk__in=suppressed).update(
+                status=Msg.Status.SUPPRESSED.value,
+                modified=timezone.now(),
+            )
+            deliveries = [(pk, recipient) for pk, recipient in deliveries
+                          if pk not in suppressed]
+
+        if deliveries:
+            self.load_context()
+            chunk_msg = copy.copy(self)
+            chunk_msg.recipients = [recipient for _, recipient in deliveries]
+
+            with profile('dispatch', self.type, self.pk):
+                cur_language = translation.get_language()
+                try:
+                    if cur_language != self.language:
+                        translation.activate(self.language)
+                    provider_id = chunk_msg._send()
+                except Exception as exc:
+                    provider_id = None
+                    error = exc
+                finally:
+                    if translation.get_language() != cur_language:
+                        translation.activate(cur_language)
+
+            if isinstance(error, CircuitOpenException) and error.defer:
+                # Deliveries are left as they are, for the next attempt
+                raise error
+
+            self._log_attempt(Msg.Status.ERROR if error else Msg.Status.DONE,
+                              provider_id=provider_id, error=error,
+                              chunk=chunk)
+
+            now = timezone.now()
+            MsgDelivery.objects.filter(
+                pk__in=[pk for pk, _ in deliveries],
+            ).update(
+                status=(Msg.Status.ERROR if error else Msg.Status.DONE).value,
+                attempts=models.F('attempts') + 1,
+                sent_at=None if error else now,
+                modified=now,
+            )
+
+        self._finish_split()
+        if error is not None:
+            raise error
+
+    def _finish_split(self) -> 'None':
+        with transaction.atomic():
+            # Chunks finishing concurrently wait for each other here,
+            # so the last one sees all the others and sets the status.
+            list(Msg.objects.select_for_update()
+                 .filter(pk=self.pk).values_list('pk'))
+            statuses = set(self.deliveries.values_list('status', flat=True))
+            if statuses & {Msg.Status.NEW.value, Msg.Status.PENDING.value}:
+                return
+
+            if Msg.Status.ERROR.value in statuses:
+                self.status = Msg.Status.ERROR.value
+            elif statuses == {Msg.Status.SUPPRESSED.value}:
+                self.status = Msg.Status.SUPPRESSED.value
+            else:
+                self.status = Msg.Status.DONE.value
+                self.sent_at = timezone.now()
+            self.modified = timezone.now()
+            with track('status', self.type):
+                Msg.objects.filter(pk=self.pk).update(
+                    status=self.status,
+                    sent_at=self.sent_at,
+                    modified=self.modified,
+                )
 
     @property
     def handler(self):
@@ -152,3 +1035,298 @@ class Msg(models.Model):
                 f'{self.type} - such message handler does not exist'
             )
         return handler_cls()
+
+
+class MsgGroup(NamedTuple):
+    """
+    Channel messages of a multi-channel handler, created from one call
+    (see `MultiChannelHandler`).
+    """
+    # Name of the multi-channel handler
+    type: 'str'
+    group: 'uuid.UUID'
+    msgs: 'List[Msg]'
+
+    def dispatch(self, async=msg_settings.async,
+                 ) -> 'List[Tuple[Msg, Exception]]':
+        """
+        Send channel messages in parallel: each one is a separate task
+        when `async` is set, otherwise they're sent by the pipeline with
+        a send worker per channel (see `msg.pipeline.Pipeline`).
+        A failed channel doesn't stop the others.
+
+        :return:
+            List of (message, exception) pairs of failed messages
+            (always empty when `async` is set).
+        """
+        if async:
+            for msg in self.msgs:
+                msg.dispatch(async=True)
+            return []
+        if not self.msgs:
+            return []
+
+        from .pipeline import Pipeline
+
+        using = self.msgs[0]._state.db
+        # Send workers have their own database connections, which don't
+        # see messages created in an open transaction.
+        parallel = not connections[using].in_atomic_block
+        pipeline = Pipeline(send_workers=len(self.msgs) if parallel else 0)
+        return Msg.objects.db_manager(using).dispatch_batch(
+            self.msgs, pipeline=pipeline,
+        )
+
+    def get_statuses(self) -> 'Dict[str, str]':
+        """
+        :return:
+            Current status name of each channel message
+            (see `MsgManager.get_group_statuses()`).
+        """
+        return Msg.objects.get_group_statuses(self.group)
+
+
+class MsgDeliveryManager(models.Manager):
+
+    def get_unsent_chunks(self, msg: 'Msg') -> 'List[int]':
+        """
+        Create delivery records of the message unless they exist.
+
+        :return:
+            Sorted numbers of chunks with recipients which didn't get
+            the message yet.
+        """
+        chunk_size = msg.handler.recipients_chunk_size
+
+        with transaction.atomic():
+            list(Msg.objects.select_for_update()
+                 .filter(pk=msg.pk).values_list('pk'))
+            if not self.filter(msg=msg).exists():
+                self.bulk_create(
+                    (
+                        self.model(
+                            msg=msg,
+                            position=position,
+                            chunk=position // chunk_size,
+                            recipient=recipient,
+                        )
+                        for position, recipient in enumerate(msg.recipients)
+                    ),
+                    batch_size=10000,
+                )
+
+        return sorted(set(
+            self.filter(msg=msg)
+            .exclude(status=Msg.Status.DONE.value)
+            .values_list('chunk', flat=True)
+        ))
+
+
+class MsgDelivery(models.Model):
+    """
+    Delivery of the message to a single recipient,
+    used by messages sent in recipient chunks.
+    """
+    msg = models.ForeignKey(
+        Msg,
+        verbose_name=_('Message'),
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+        # Covered by the unique index
+        db_index=False,
+        # Partitioned messages table can't be referenced
+        # (see `msg.partitioning`), deletes cascade in Django.
+        db_constraint=False,
+    )
+    position = models.PositiveIntegerField(
+        verbose_name=_('Position'),
+    )
+    chunk = models.PositiveIntegerField(
+        verbose_name=_('Chunk'),
+    )
+    recipient = JSONField(
+        verbose_name=_('Recipient'),
+    )
+    status = models.PositiveSmallIntegerField(
+        verbose_name=_('Status'),
+        choices=Msg.Status.choices(),
+        default=Msg.Status.NEW.value,
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name=_('Attempts'),
+        default=0,
+    )
+    sent_at = models.DateTimeField(
+        verbose_name=_('Sent at'),
+        null=True,
+        blank=True,
+    )
+    modified = models.DateTimeField(
+        _('Modified'),
+        auto_now=True,
+    )
+
+    objects = MsgDeliveryManager()
+
+    class Meta:
+        unique_together = [('msg', 'position')]
+        indexes = [
+            models.Index(fields=['msg', 'chunk'],
+                         name='msg_delivery_chunk_idx'),
+        ]
+
+
+class SuppressionManager(models.Manager):
+
+    def suppress(self, channel: 'str', recipients: 'Iterable[str]',
+                 reason: 'str' = '') -> 'None':
+        """
+        Add recipients to the suppression list of the channel, skipping
+        the ones which are on it already.
+        """
+        rows = [(channel, normalize_recipient(recipient), reason,
+                 timezone.now()) for recipient in recipients]
+        if not rows:
+            return
+        with connections[self.db].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(channel, recipient, reason, created) '
+                f'VALUES (%s, %s, %s, %s) '
+                f'ON CONFLICT (channel, recipient) DO NOTHING',
+                rows,
+            )
+
+    def unsuppress(self, channel: 'str',
+                   recipients: 'Iterable[str]') -> 'int':
+        deleted, _ = self.filter(
+            channel=channel,
+            recipient__in=[normalize_recipient(recipient)
+                           for recipient in recipients],
+        ).delete()
+        return deleted
+
+
+class Suppression(models.Model):
+    """
+    Recipient which doesn't get messages of the channel
+    (see `Handler.channel` and `msg.suppression`).
+    """
+    channel = models.CharField(
+        verbose_name=_('Channel'),
+        max_length=32,
+    )
+    recipient = models.CharField(
+        verbose_name=_('Recipient'),
+        max_length=255,
+    )
+    reason = models.CharField(
+        verbose_name=_('Reason'),
+        max_length=255,
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name=_('Created'),
+        auto_now_add=True,
+        # Incremental refresh (see `msg.suppression`)
+        db_index=True,
+    )
+
+    objects = SuppressionManager()
+
+    class Meta:
+        unique_together = [('channel', 'recipient')]
+
+    def save(self, *args, **kwargs):
+        self.recipient = normalize_recipient(self.recipient)
+        super().save(*args, **kwargs)
+
+
+class MsgAttempt(models.Model):
+    """
+    Append-only log of dispatch attempts, a row per attempt (or per
+    chunk of split messages).
+    """
+    id = models.BigAutoField(primary_key=True)
+    msg = models.ForeignKey(
+        Msg,
+        verbose_name=_('Message'),
+        on_delete=models.CASCADE,
+        related_name='attempt_log',
+        # Messages table may be partitioned (see `msg.partitioning`)
+        db_constraint=False,
+    )
+    attempt = models.PositiveIntegerField(
+        verbose_name=_('Attempt'),
+    )
+    chunk = models.PositiveIntegerField(
+        verbose_name=_('Chunk'),
+        null=True,
+        blank=True,
+    )
+    status = models.PositiveSmallIntegerField(
+        verbose_name=_('Status'),
+        choices=Msg.Status.choices(),
+    )
+    enqueued_at = models.DateTimeField(
+        verbose_name=_('Enqueued at'),
+        null=True,
+        blank=True,
+    )
+    started_at = models.DateTimeField(
+        verbose_name=_('Started at'),
+        null=True,
+        blank=True,
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_('Finished at'),
+    )
+    provider_id = models.CharField(
+        verbose_name=_('Provider id'),
+        max_length=255,
+        blank=True,
+    )
+    error = models.TextField(
+        verbose_name=_('Error'),
+        blank=True,
+    )
+
+
+class MsgCounter(models.Model):
+    """
+    Number of messages per handler and status, maintained by database
+    triggers (see `msg.counters`).
+    """
+    type = models.CharField(
+        verbose_name=_('Type'),
+        max_length=255,
+    )
+    status = models.PositiveSmallIntegerField(
+        verbose_name=_('Status'),
+        choices=Msg.Status.choices(),
+    )
+    count = models.BigIntegerField(
+        verbose_name=_('Count'),
+        default=0,
+    )
+
+    class Meta:
+        unique_together = [('type', 'status')]
+
+
+class MsgCounterDelta(models.Model):
+    """
+    Change of `MsgCounter` not reconciled yet.
+    """
+    id = models.BigAutoField(primary_key=True)
+    type = models.CharField(
+        verbose_name=_('Type'),
+        max_length=255,
+    )
+    status = models.PositiveSmallIntegerField(
+        verbose_name=_('Status'),
+        choices=Msg.Status.choices(),
+    )
+    delta = models.BigIntegerField(
+        verbose_name=_('Delta'),
+    )
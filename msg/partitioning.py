@@ -0,0 +1,249 @@
+"""
+Optional range partitioning of messages table by `created` (PostgreSQL 11+).
+
+Messages are kept in monthly partitions (`<table>_pYYYYMM`) and a default
+partition, so old months can be dropped instantly instead of being deleted
+row by row. Use `msg_partition` command to manage partitions.
+
+Conversion rewrites the whole table while holding an exclusive lock,
+run it in a maintenance window.
+"""
+import re
+from datetime import date
+from typing import List
+
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters
+from .models import Msg
+from .models import MsgAttempt
+from .models import MsgCounterDelta
+from .models import MsgDelivery
+
+PARTITION_SUFFIX_RE = re.compile(r'_p(?P<year>\d{4})(?P<month>\d{2})$')
+
+
+def _table() -> 'str':
+    return Msg._meta.db_table
+
+
+def _month_start(day: 'date', months: 'int' = 0) -> 'date':
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(month: 'date') -> 'str':
+    return f'{_table()}_p{month:%Y%m}'
+
+
+def is_partitioned() -> 'bool':
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+            [_table()],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def get_referencing_constraints() -> 'List[tuple]':
+    """
+    Foreign keys of other tables referencing messages table as
+    (table, constraint) pairs. Partitioned table has a composite primary
+    key, so these foreign keys cannot be kept.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            "WHERE confrelid = to_regclass(%s) AND contype = 'f'",
+            [_table()],
+        )
+        return cursor.fetchall()
+
+
+def get_partitions() -> 'List[str]':
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT inhrelid::regclass::text FROM pg_inherits '
+            'WHERE inhparent = to_regclass(%s) ORDER BY 1',
+            [_table()],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ensure_partitions(months_ahead: 'int' = 3,
+                      since: 'date' = None) -> 'List[str]':
+    """
+    Create missing monthly partitions from `since` (current month
+    by default) up to `months_ahead` months ahead.
+
+    :return:
+        Names of created partitions.
+    """
+    qn = connection.ops.quote_name
+    today = timezone.now().date()
+    month = _month_start(since or today)
+    last = _month_start(today, months_ahead)
+    existing = set(get_partitions())
+    created = []
+
+    with connection.cursor() as cursor:
+        while month <= last:
+            name = _partition_name(month)
+            if name not in existing:
+                cursor.execute(
+                    f'CREATE TABLE {qn(name)} PARTITION OF {qn(_table())} '
+                    'FOR VALUES FROM (%s) TO (%s)',
+                    [month, _month_start(month, 1)],
+                )
+                created.append(name)
+            month = _month_start(month, 1)
+
+    return created
+
+
+def drop_partitions(before: 'date') -> 'List[str]':
+    """
+    Drop monthly partitions which contain only messages created before
+    the given date, with deliveries and attempts of their messages
+    (they don't reference the messages table with a foreign key).
+
+    :return:
+        Names of dropped partitions.
+    """
+    qn = connection.ops.quote_name
+    dropped = []
+
+    with connection.cursor() as cursor:
+        for name in get_partitions():
+            match = PARTITION_SUFFIX_RE.search(name)
+            if match is None:
+                continue  # default partition
+            month = date(int(match.group('year')),
+                         int(match.group('month')), 1)
+            if _month_start(month, 1) > before:
+                continue
+
+            with transaction.atomic():
+                for model in (MsgDelivery, MsgAttempt):
+                    cursor.execute(
+                        f'DELETE FROM {qn(model._meta.db_table)} '
+                        f'WHERE msg_id IN (SELECT id FROM {qn(name)})'
+                    )
+                # Dropping a table doesn't fire the counter triggers
+                cursor.execute(
+                    f'INSERT INTO {MsgCounterDelta._meta.db_table} '
+                    f'(type, status, delta) '
+                    f'SELECT type, status, -COUNT(*) FROM {qn(name)} '
+                    f'GROUP BY type, status'
+                )
+                cursor.execute(f'DROP TABLE {qn(name)}')
+            dropped.append(name)
+
+    return dropped
+
+
+@transaction.atomic
+def convert_to_partitioned(months_ahead: 'int' = 3,
+                           drop_foreign_keys: 'bool' = False,
+                           keep_old: 'bool' = False) -> 'None':
+    """
+    Convert messages table to a table partitioned by `created`.
+    Existing rows are copied to monthly partitions.
+
+    :param drop_foreign_keys:
+        Drop foreign keys referencing messages table, otherwise
+        conversion fails if there are any.
+
+    :param keep_old:
+        Keep the original table (renamed to `<table>_old`).
+    """
+    assert not is_partitioned(), 'Messages table is already partitioned.'
+
+    qn = connection.ops.quote_name
+    table = _table()
+    old_table = f'{table}_old'
+
+    constraints = get_referencing_constraints()
+    if constraints and not drop_foreign_keys:
+        raise ValueError(
+            'Foreign keys reference messages table: '
+            + ', '.join(f'{t}.{c}' for t, c in constraints)
+            + '. They have to be dropped to partition the table.'
+        )
+
+    with connection.cursor() as cursor:
+        # Table with pending deferred foreign key checks can't be dropped
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        for referencing_table, constraint in constraints:
+            cursor.execute(f'ALTER TABLE {qn(referencing_table)} '
+                           f'DROP CONSTRAINT {qn(constraint)}')
+
+        # Indexes are recreated on the new table with the same names
+        cursor.execute(
+            'SELECT i.indexname, i.indexdef FROM pg_indexes i '
+            'JOIN pg_class c ON c.relname = i.indexname '
+            'JOIN pg_index x ON x.indexrelid = c.oid '
+            'WHERE i.tablename = %s AND NOT x.indisprimary',
+            [table],
+        )
+        indexes = cursor.fetchall()
+        # Foreign keys of the table itself (LIKE doesn't copy them)
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old_table)}')
+        # Rows are only moved, counter triggers are recreated afterwards
+        for statement in counters.get_drop_triggers_sql(old_table):
+            cursor.execute(statement)
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {qn(name)} '
+                           f'RENAME TO {qn(name[:59] + "_old")}')
+
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(old_table)} '
+            'INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            'PARTITION BY RANGE (created)'
+        )
+        cursor.execute(f'ALTER TABLE {qn(table)} '
+                       f'ADD PRIMARY KEY (id, created)')
+        for name, definition in indexes:
+            # Definition references the table by (schema qualified) name
+            definition = re.sub(
+                r' ON (\S+\.)?' + re.escape(table) + r'\b',
+                f' ON {qn(table)}',
+                definition,
+            )
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(table)} '
+                           f'ADD CONSTRAINT {qn(name)} {definition}')
+
+        cursor.execute(f'ALTER SEQUENCE {sequence} '
+                       f'OWNED BY {qn(table)}.id')
+        cursor.execute(f'CREATE TABLE {qn(table + "_default")} '
+                       f'PARTITION OF {qn(table)} DEFAULT')
+
+        cursor.execute(f'SELECT MIN(created) FROM {qn(old_table)}')
+        oldest = cursor.fetchone()[0]
+
+    ensure_partitions(
+        months_ahead=months_ahead,
+        since=oldest.date() if oldest is not None else None,
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(table)} '
+                       f'SELECT * FROM {qn(old_table)}')
+        for statement in counters.get_create_triggers_sql(table):
+            cursor.execute(statement)
+        if not keep_old:
+            cursor.execute(f'DROP TABLE {qn(old_table)}')
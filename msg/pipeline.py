@@ -0,0 +1,233 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+from django.db import connections
+from django.utils import timezone
+from django.utils import translation
+
+from .metrics import track
+from .models import Msg
+from .settings import msg_settings
+from .utils import warm_up_translations
+
+_STOP = object()
+
+# Render executor shared by all pipelines of the process
+_executor: 'Union[Executor, None]' = None
+_executor_key: 'Union[tuple, None]' = None
+_executor_lock = threading.Lock()
+
+
+def render_msg(handler_name: 'str', language: 'str',
+               recipients: 'list', context: 'dict') -> 'Union[dict, None]':
+    """
+    Render stage of the pipeline. It is a module level function
+    operating on plain data, so it can be sent to a process pool.
+    It leaves the message language active in the current thread.
+
+    Process pool workers are expected to be forked from an already
+    configured Django process (default on Linux), so the handlers
+    are registered there as well.
+    """
+    msg = Msg(
+        type=handler_name,
+        language=language,
+        recipients=recipients,
+        context=context,
+    )
+    # Messages are rendered grouped by the language, so the language
+    # is activated only when the group changes and it is not restored.
+    if translation.get_language() != language:
+        translation.activate(language)
+    with track('render', handler_name):
+        return msg.handler.render(msg)
+
+
+def get_render_executor(kind: 'str', workers: 'int') -> 'Executor':
+    """
+    Return the render executor of the process, so the workers are
+    started (and process pool workers forked) once, not per batch.
+    It is created again with other `kind` or `workers`, in a forked
+    process (the inherited executor has no workers) and when it broke
+    (a process pool worker died).
+    """
+    global _executor, _executor_key
+    key = (os.getpid(), kind, workers)
+    with _executor_lock:
+        if _executor is not None and _executor_key == key \
+                and not getattr(_executor, '_broken', False):
+            return _executor
+
+        if _executor is not None and _executor_key[0] == key[0]:
+            _executor.shutdown(wait=False)
+        if kind == 'process':
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers)
+        _executor_key = key
+        return _executor
+
+
+class Pipeline:
+    """
+    Dispatch messages in two stages connected by a bounded queue:
+
+    - render stage (CPU-bound) - `Handler.render()`, run in a thread
+      or process pool of `render_workers` size,
+    - send stage (I/O-bound) - `Handler.send()` with status updates,
+      run in a pool of `send_workers` threads.
+
+    Size of `0` runs the stage inline, in the calling thread.
+    At most `queue_size` messages wait between stages, so rendering
+    never runs too far ahead of sending.
+
+    Messages are processed grouped by the language, so each worker
+    activates the language once per group instead of once per message.
+    """
+
+    def __init__(self, render_workers: 'int' = None,
+                 render_executor: 'str' = None,
+                 send_workers: 'int' = None,
+                 queue_size: 'int' = None):
+        def default(value, setting):
+            if value is None:
+                return getattr(msg_settings, setting)
+            return value
+
+        self.render_workers = default(render_workers, 'render_workers')
+        self.render_executor = default(render_executor, 'render_executor')
+        self.send_workers = default(send_workers, 'send_workers')
+        self.queue_size = max(default(queue_size, 'pipeline_queue_size'), 1)
+
+        assert self.render_executor in ('thread', 'process'), (
+            '`render_executor` has to be either "thread" or "process".'
+        )
+
+    def run(self, msgs: 'Iterable[Msg]') -> 'List[Tuple[Msg, Exception]]':
+        """
+        Render and send all messages.
+
+        :param msgs:
+            Messages to dispatch
+
+        :return:
+            List of (message, exception) pairs of failed messages.
+            Failed messages have ERROR status set.
+        """
+        msgs = sorted(msgs, key=lambda msg: msg.language)
+        Msg.objects.load_contexts(msgs)
+        failed: 'List[Tuple[Msg, Exception]]' = []
+        send_queue = queue.Queue(maxsize=self.queue_size)
+        workers = [
+            threading.Thread(
+                target=self._send_worker,
+                args=(send_queue, failed),
+                daemon=True,
+            )
+            for _ in range(self.send_workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def put(item):
+            if workers:
+                send_queue.put(item)
+            else:
+                self._send(*item, failed=failed)
+
+        cur_language = translation.get_language()
+        executor = self._get_render_executor(
+            languages={msg.language for msg in msgs},
+        )
+        pending: 'deque' = deque()
+        try:
+            for msg in msgs:
+                if executor is None:
+                    put(self._render(msg))
+                    continue
+
+                future = executor.submit(render_msg, *self._render_args(msg))
+                pending.append((msg, future))
+                if len(pending) >= self.queue_size:
+                    put(self._collect(*pending.popleft()))
+
+            while pending:
+                put(self._collect(*pending.popleft()))
+        finally:
+            for _ in workers:
+                send_queue.put(_STOP)
+            for worker in workers:
+                worker.join()
+            translation.activate(cur_language)
+
+        return failed
+
+    def _get_render_executor(self, languages: 'Set[str]',
+                             ) -> 'Union[Executor, None]':
+        if not self.render_workers:
+            return None
+        if self.render_executor == 'process':
+            # Load catalogs before the workers are forked (by the first
+            # batch), the workers load other languages once on their own
+            warm_up_translations(languages)
+        return get_render_executor(self.render_executor, self.render_workers)
+
+    @staticmethod
+    def _render_args(msg: 'Msg') -> 'tuple':
+        return msg.type, msg.language, msg.recipients, msg.context
+
+    def _render(self, msg: 'Msg') -> 'tuple':
+        try:
+            rendered = render_msg(*self._render_args(msg))
+        except Exception as exc:
+            return msg, None, exc
+        return msg, rendered, None
+
+    @staticmethod
+    def _collect(msg: 'Msg', future: 'Future') -> 'tuple':
+        try:
+            rendered = future.result()
+        except Exception as exc:
+            return msg, None, exc
+        return msg, rendered, None
+
+    @staticmethod
+    def _send(msg: 'Msg', rendered: 'Union[dict, None]',
+              error: 'Union[Exception, None]', failed: 'list') -> 'None':
+        if error is not None:
+            # Logged like a render failure of a single message dispatch
+            msg.started_at = timezone.now()
+            msg.attempts += 1
+            msg._log_attempt(Msg.Status.ERROR, error=error)
+            msg.set_status(Msg.Status.ERROR, save=True)
+            failed.append((msg, error))
+            return
+
+        msg.rendered = rendered
+        try:
+            msg._dispatch(restore_language=False)
+        except Exception as exc:
+            failed.append((msg, exc))
+
+    def _send_worker(self, send_queue: 'queue.Queue',
+                     failed: 'list') -> 'None':
+        try:
+            while True:
+                item = send_queue.get()
+                if item is _STOP:
+                    break
+                self._send(*item, failed=failed)
+        finally:
+            # Each thread has its own database connection
+            connections.close_all()
@@ -0,0 +1,220 @@
+"""
+Opt-in profiling of message creation and dispatch.
+
+A fraction (`profile_rate`) of messages is profiled and, if
+`profile_threshold` is set, every message processed longer than the
+threshold. Profiles are written to `profile_dir` as cProfile stats
+(`profile_format='pstats'`) or collapsed stacks for flame graphs
+(`profile_format='collapsed'`). Collapsed stacks are collected by a
+sampling thread, so they are much cheaper than cProfile when every message
+has to be profiled because of the threshold.
+
+When neither rate nor threshold is set, `profile()` returns a shared no-op
+object.
+"""
+import cProfile
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict
+from typing import Union
+
+from .settings import msg_settings
+
+
+class _Sampler:
+    """
+    Single background thread sampling stacks of registered threads.
+    """
+
+    def __init__(self, interval: 'float'):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stacks: 'Dict[int, Counter]' = {}
+        self._thread = None
+
+    def start(self, thread_id: 'int') -> 'None':
+        with self._lock:
+            self._stacks[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='msg-profiler', daemon=True,
+                )
+                self._thread.start()
+
+    def stop(self, thread_id: 'int') -> 'Counter':
+        with self._lock:
+            return self._stacks.pop(thread_id)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._stacks:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._stacks.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> 'str':
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} '
+                     f'({os.path.basename(code.co_filename)}'
+                     f':{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class _NullSession:
+    handler = ''
+    msg_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class _Session:
+
+    def __init__(self, profiler: 'Profiler', kind: 'str', handler: 'str',
+                 msg_id, sampled: 'bool'):
+        self.profiler = profiler
+        self.kind = kind
+        self.handler = handler
+        self.msg_id = msg_id
+        self.sampled = sampled
+
+    def __enter__(self):
+        if self.profiler.format == 'pstats':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._thread_id = threading.get_ident()
+            self.profiler.sampler.start(self._thread_id)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self.start
+        if self.profiler.format == 'pstats':
+            self._profile.disable()
+        else:
+            stacks = self.profiler.sampler.stop(self._thread_id)
+
+        threshold = self.profiler.threshold
+        if self.sampled or (threshold is not None and duration >= threshold):
+            path = self.profiler.get_path(self.kind, self.handler,
+                                          self.msg_id)
+            if self.profiler.format == 'pstats':
+                self._profile.dump_stats(path)
+            else:
+                with open(path, 'w') as f:
+                    for stack, count in stacks.items():
+                        f.write(f'{stack} {count}\n')
+        return False
+
+
+class Profiler:
+    """
+    Profiling configuration.
+
+    :param rate:
+        Fraction of profiled messages (0.0 - 1.0)
+
+    :param threshold:
+        Messages processed longer than this (in seconds) are profiled.
+        None disables it.
+
+    :param directory:
+        Directory where profiles are written
+
+    :param format:
+        'pstats' or 'collapsed'
+
+    :param interval:
+        Sampling interval (in seconds) of 'collapsed' format
+    """
+
+    def __init__(self, rate: 'float' = 0.0, threshold: 'float' = None,
+                 directory: 'str' = None, format: 'str' = 'pstats',
+                 interval: 'float' = 0.005):
+        assert format in ('pstats', 'collapsed'), (
+            '`profile_format` has to be either "pstats" or "collapsed".'
+        )
+        self.rate = rate
+        self.threshold = threshold
+        self.directory = directory or os.path.join(tempfile.gettempdir(),
+                                                   'msg-profiles')
+        self.format = format
+        self.sampler = _Sampler(interval)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_path(self, kind: 'str', handler: 'str', msg_id) -> 'str':
+        extension = 'prof' if self.format == 'pstats' else 'collapsed'
+        name = re.sub(r'[^\w.-]+', '_', f'{kind}-{handler}-{msg_id}')
+        return os.path.join(
+            self.directory, f'{name}-{time.time():.6f}.{extension}',
+        )
+
+    def session(self, kind: 'str', handler: 'str',
+                msg_id) -> 'Union[_Session, _NullSession]':
+        sampled = self.rate > 0 and random.random() < self.rate
+        if not sampled and self.threshold is None:
+            return _NULL_SESSION
+        return _Session(self, kind, handler, msg_id, sampled)
+
+
+_NULL_SESSION = _NullSession()
+_UNSET = object()
+_profiler: 'Union[Profiler, None]' = _UNSET
+
+
+def get_profiler() -> 'Union[Profiler, None]':
+    global _profiler
+    if _profiler is _UNSET:
+        if msg_settings.profile_rate or msg_settings.profile_threshold:
+            _profiler = Profiler(
+                rate=msg_settings.profile_rate,
+                threshold=msg_settings.profile_threshold,
+                directory=msg_settings.profile_dir,
+                format=msg_settings.profile_format,
+            )
+        else:
+            _profiler = None
+    return _profiler
+
+
+def set_profiler(profiler: 'Union[Profiler, None]') -> 'None':
+    """
+    Replace configured profiler (e.g. in tests).
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def profile(kind: 'str', handler: 'str' = '',
+            msg_id=None) -> 'Union[_Session, _NullSession]':
+    """
+    Context manager profiling a block of code. The handler and message id
+    are used in the profile file name, they may be set inside the block
+    as attributes of the returned object.
+
+    >>> with profile('dispatch', msg.type, msg.pk):
+    ...     msg.handler.send(msg)
+    """
+    profiler = _profiler if _profiler is not _UNSET else get_profiler()
+    if profiler is None:
+        return _NULL_SESSION
+    return profiler.session(kind, handler, msg_id)
@@ -0,0 +1,185 @@
+"""
+Templates of handlers. Handlers choose the engine with `template_engine`
+attribute (an alias from `TEMPLATES` setting, e.g. Jinja2 for hot
+templates), all engines are tried when it's not set.
+
+Templates are compiled once per process (unless `DEBUG` is on), so
+rendering a message doesn't go through the template loaders again.
+
+HTML templates can be post-processed (CSS inlined and minified) before
+they are compiled, so it's done once per process instead of once per
+message. Template tags are replaced with placeholders for the processing,
+so only static parts of the template are processed and rendered
+variables are not. Translated and comment blocks are replaced whole,
+so msgids of `blocktrans` keep matching the catalogs. It requires
+self-contained templates: CSS of extended or included templates is not
+inlined and `<style>` blocks can't contain template tags. HTML parsers
+mangle tags in place of attributes (`<td {% if x %}class="a"{% endif %}>`),
+CSS of such templates is not inlined.
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import List
+from typing import Tuple
+from typing import Union
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import get_template as _get_template
+
+logger = logging.getLogger(__name__)
+
+# Blocks with contents which must not change: translated (Django
+# `blocktrans`, Jinja2 `trans`) and comment blocks
+BLOCK_RE = (r'{%-?\s*(?P<block>blocktrans|blocktranslate|trans|comment)\b'
+            r'.*?%}.*?{%-?\s*end(?P=block)\s*-?%}')
+# Such blocks, `{% tag %}`, `{{ variable }}` and `{# comment #}`
+# (Django and Jinja2)
+TAG_RE = re.compile(BLOCK_RE + r'|{%.*?%}|{{.*?}}|{#.*?#}', re.DOTALL)
+# HTML parsers may lowercase placeholders (e.g. in attribute names)
+PLACEHOLDER_RE = re.compile(r'MSGTPL(\d+)X', re.IGNORECASE)
+# Start tags and quoted attribute values in them
+START_TAG_RE = re.compile(r'<[A-Za-z][^>]*>')
+QUOTED_RE = re.compile(r'"[^"]*"|\'[^\']*\'')
+# Placeholder which is not (the start of) an attribute value
+ATTRIBUTE_PLACEHOLDER_RE = re.compile(r'(?<![=\w])MSGTPL\d+X')
+# Contents of these elements are not minified
+PRESERVE_RE = re.compile(r'(<(pre|textarea|script)\b.*?</\2\s*>)',
+                         re.IGNORECASE | re.DOTALL)
+# Except conditional comments (`<!--[if mso]>`) used by mail clients
+COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+WHITESPACE_RE = re.compile(r'\s+')
+BODY_RE = re.compile(r'<body[^>]*>(.*)</body>', re.IGNORECASE | re.DOTALL)
+
+
+def protect_tags(source: 'str') -> 'Tuple[str, List[str]]':
+    """
+    Replace template tags and translated and comment blocks with
+    placeholders, which pass through HTML processing untouched.
+
+    :return:
+        (source with placeholders, list of the tags) tuple.
+    """
+    tags = []
+
+    def replace(match):
+        tags.append(match.group(0))
+        return f'MSGTPL{len(tags) - 1}X'
+
+    return TAG_RE.sub(replace, source), tags
+
+
+def restore_tags(source: 'str', tags: 'List[str]') -> 'str':
+    return PLACEHOLDER_RE.sub(lambda match: tags[int(match.group(1))],
+                              source)
+
+
+def has_attribute_tags(source: 'str') -> 'bool':
+    """
+    Whether template tags (placeholders) of the protected source are
+    in place of attributes of HTML elements, e.g.
+    `<td {% if x %}class="a"{% endif %}>`. HTML parsers turn them into
+    attributes, which are not restored as they were.
+    """
+    for tag in START_TAG_RE.findall(source):
+        tag = re.sub(r'\s*=\s*', '=', QUOTED_RE.sub('""', tag))
+        if ATTRIBUTE_PLACEHOLDER_RE.search(tag):
+            return True
+    return False
+
+
+def inline_css(html: 'str') -> 'str':
+    """
+    Move CSS of `<style>` blocks to `style` attributes (requires
+    premailer).
+    """
+    from premailer import Premailer
+
+    inlined = Premailer(
+        html,
+        keep_style_tags=False,
+        remove_classes=False,
+        disable_validation=True,
+        allow_network=False,
+        cssutils_logging_level=logging.CRITICAL,
+    ).transform()
+
+    # Premailer always returns the whole document
+    if '<html' not in html.lower():
+        body = BODY_RE.search(inlined)
+        inlined = body.group(1).strip() if body else inlined
+    return inlined
+
+
+def minify_html(html: 'str') -> 'str':
+    """
+    Remove comments and collapse whitespace, except contents of `<pre>`,
+    `<textarea>` and `<script>`.
+    """
+    parts = PRESERVE_RE.split(html)
+    minified = []
+    # Split returns (text, preserved element, its tag name) triples
+    for i in range(0, len(parts), 3):
+        text = COMMENT_RE.sub('', parts[i])
+        minified.append(WHITESPACE_RE.sub(' ', text))
+        if i + 1 < len(parts):
+            minified.append(parts[i + 1])
+    return ''.join(minified).strip()
+
+
+def _get_source(template) -> 'str':
+    # Django templates keep the source, Jinja2 ones have to load it again
+    source = getattr(template.template, 'source', None)
+    if source is None:
+        env = template.backend.env
+        source = env.loader.get_source(env, template.template.name)[0]
+    return source
+
+
+def _process(name: 'str', using: 'Union[str, None]',
+             inline: 'bool', minify: 'bool'):
+    template = _get_template(name, using=using)
+    if not (inline or minify):
+        return template
+
+    source, tags = protect_tags(_get_source(template))
+    if inline and has_attribute_tags(source):
+        logger.warning('CSS of %s template is not inlined, it has template '
+                       'tags in place of HTML attributes.', name)
+    elif inline:
+        source = inline_css(source)
+    if minify:
+        source = minify_html(source)
+    return template.backend.from_string(restore_tags(source, tags))
+
+
+_get_cached_template = lru_cache(maxsize=None)(_process)
+
+
+def get_template(name: 'str', using: 'str' = None,
+                 inline: 'bool' = False, minify: 'bool' = False):
+    """
+    :param using:
+        Alias of the template engine
+
+    :param inline:
+        Inline CSS of the template source
+
+    :param minify:
+        Minify the template source
+
+    :return:
+        Template of the engine's backend, rendered with `render(context)`
+        where the context is a dict, whichever the engine is.
+    """
+    if settings.DEBUG:
+        return _process(name, using, inline, minify)
+    return _get_cached_template(name, using, inline, minify)
+
+
+@receiver(setting_changed)
+def clear_cache(setting: 'str' = 'TEMPLATES', **kwargs) -> 'None':
+    if setting == 'TEMPLATES':
+        _get_cached_template.cache_clear()
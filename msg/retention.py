@@ -0,0 +1,122 @@
+"""
+Retention of messages.
+
+Messages are purged `retention` days after they were created, per status.
+Handlers can override it with `retention` attribute, e.g.:
+
+    MSG_SETTINGS = {'retention': {'DONE': 30, 'ERROR': 90}}
+
+    class OneTimePasswordHandler(TwilioHandler):
+        retention = {'DONE': 1, 'ERROR': None}  # None - keep forever
+"""
+import time
+from datetime import datetime
+from datetime import timedelta
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+from typing import Union
+
+from django.db import transaction
+from django.utils import timezone
+
+from .handlers import MetaHandler
+from .models import Msg
+from .settings import msg_settings
+
+
+class RetentionRule(NamedTuple):
+    status: 'Msg.Status'
+    cutoff: 'datetime'
+    # Handler name the rule is limited to, all handlers if None
+    type: 'Union[str, None]' = None
+    # Handlers excluded from the rule (they have their own rules)
+    exclude_types: 'Tuple[str, ...]' = ()
+
+    def get_queryset(self):
+        queryset = Msg.objects.filter(
+            status=self.status.value,
+            created__lt=self.cutoff,
+        )
+        if self.type is not None:
+            return queryset.filter(type=self.type)
+        if self.exclude_types:
+            return queryset.exclude(type__in=self.exclude_types)
+        return queryset
+
+
+def _parse_status(name: 'str') -> 'Msg.Status':
+    try:
+        return Msg.Status[name]
+    except KeyError:
+        raise ValueError(f'{name!r} is not a valid message status.')
+
+
+def get_rules(now: 'datetime' = None) -> 'List[RetentionRule]':
+    """
+    Build retention rules from `retention` setting and handlers'
+    `retention` attributes.
+    """
+    now = now or timezone.now()
+    overrides: 'Dict[Msg.Status, List[str]]' = {}
+    rules: 'List[RetentionRule]' = []
+
+    for name, handler_cls in MetaHandler.get_handlers().items():
+        for status_name, days in (handler_cls.retention or {}).items():
+            status = _parse_status(status_name)
+            overrides.setdefault(status, []).append(name)
+            if days is not None:
+                rules.append(RetentionRule(
+                    status=status,
+                    cutoff=now - timedelta(days=days),
+                    type=name,
+                ))
+
+    for status_name, days in msg_settings.retention.items():
+        status = _parse_status(status_name)
+        if days is not None:
+            rules.append(RetentionRule(
+                status=status,
+                cutoff=now - timedelta(days=days),
+                exclude_types=tuple(overrides.get(status, ())),
+            ))
+
+    return rules
+
+
+def purge(rule: 'RetentionRule', chunk_size: 'int' = 1000,
+          sleep: 'float' = 0.0) -> 'int':
+    """
+    Delete messages matching the rule in chunks of `chunk_size` messages,
+    each chunk in its own (short) transaction. Chunks are selected by
+    primary key order from the last deleted key (keyset pagination),
+    so already deleted rows are not scanned again. The rule is checked
+    again when a chunk is deleted, messages which changed meanwhile
+    (e.g. were retried) are kept.
+
+    :param sleep:
+        Pause between chunks (in seconds) to spread the load.
+
+    :return:
+        Number of deleted messages.
+    """
+    queryset = rule.get_queryset().order_by('pk')
+    deleted = 0
+    last_pk = 0
+
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk)
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+
+        with transaction.atomic():
+            _, per_model = rule.get_queryset().filter(pk__in=pks).delete()
+        deleted += per_model.get(Msg._meta.label, 0)
+        last_pk = pks[-1]
+
+        if sleep:
+            time.sleep(sleep)
+
+    return deleted
@@ -6,10 +6,34 @@ DEFAULT_SETTINGS = {
     'async': False,
     'handlers': [],
     'default_lang': 'en',
+    'render_workers': 0,
+    'render_executor': 'thread',
+    'send_workers': 0,
+    'pipeline_queue_size': 100,
+    'warm_up_translations': False,
+    'metrics_backend': None,
+    'profile_rate': 0.0,
+    'profile_threshold': None,
+    'profile_dir': None,
+    'profile_format': 'pstats',
+    'retention': {},
+    'context_storage': 'inline',
+    'context_compression': None,
+    'context_compression_min_size': 1024,
+    'circuit_breaker': None,
+    'connect_timeout': 5.0,
+    'read_timeout': 30.0,
+    'backends': {},
+    'suppression_refresh': 60,
+    'read_db': 'default',
+    'terminal_writes_only': False,
+    'capture_rate': 0.0,
+    'capture_file': None,
 }
 
 IMPORT_STRINGS = [
-    'handlers'
+    'handlers',
+    'metrics_backend',
 ]
 
 EXTRA_SETTINGS = {
@@ -46,10 +70,11 @@ class MsgSettings:
         return self.default[item]
 
     def import_setting(self, item):
-        val = [
-            import_from_string(s) for s
-            in self.user_config[item]
-        ]
+        val = self.user_config.get(item, self.default[item])
+        if isinstance(val, str):
+            val = import_from_string(val)
+        elif val is not None:
+            val = [import_from_string(s) for s in val]
         self._cache[item] = val
         return val
 
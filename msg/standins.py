@@ -0,0 +1,225 @@
+"""
+Local stand-ins of the providers used by built-in handlers: an SMTP sink
+and a fake HTTP API of AWS SES and Twilio. Each of them can simulate
+latency and errors of the provider. They are meant for load tests only.
+"""
+import json
+import random
+import socketserver
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from typing import List
+from unittest import mock
+
+from django.test import override_settings
+
+SES_NAMESPACE = 'http://ses.amazonaws.com/doc/2010-12-01/'
+
+SES_RESPONSE = '''<SendEmailResponse xmlns="{namespace}">
+  <SendEmailResult><MessageId>{id}</MessageId></SendEmailResult>
+  <ResponseMetadata><RequestId>{id}</RequestId></ResponseMetadata>
+</SendEmailResponse>'''
+
+SES_ERROR_RESPONSE = '''<ErrorResponse xmlns="{namespace}">
+  <Error>
+    <Type>Sender</Type>
+    <Code>MessageRejected</Code>
+    <Message>Rejected by the stand-in.</Message>
+  </Error>
+  <RequestId>{id}</RequestId>
+</ErrorResponse>'''
+
+
+class Behaviour:
+    """
+    Latency and error rate shared by all stand-ins.
+    """
+
+    def __init__(self, latency: 'float' = 0.0, error_rate: 'float' = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def __call__(self) -> 'bool':
+        """
+        Simulate the provider latency and return True if the request
+        should fail.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+        return failed
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal SMTP server accepting (and dropping) all messages.
+    """
+
+    def reply(self, line: 'str') -> 'None':
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 msg-standin ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command = line.decode('utf-8', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-msg-standin')
+                self.reply('250 8BITMIME')
+            elif command.startswith('DATA'):
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b'.\n', b''):
+                    pass
+                if self.server.behaviour():
+                    self.reply('451 Rejected by the stand-in')
+                else:
+                    self.reply('250 OK')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 OK')
+
+
+class HTTPProviderHandler(BaseHTTPRequestHandler):
+    """
+    Fake AWS SES (query API) and Twilio (REST API) endpoints.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: 'int', content_type: 'str',
+                  body: 'str') -> 'None':
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        failed = self.server.behaviour()
+        msg_id = uuid.uuid4().hex
+
+        if self.path.startswith('/2010-04-01/'):
+            if failed:
+                self.send_body(400, 'application/json', json.dumps({
+                    'code': 30001,
+                    'message': 'Rejected by the stand-in.',
+                    'status': 400,
+                }))
+            else:
+                self.send_body(201, 'application/json', json.dumps({
+                    'sid': f'SM{msg_id}',
+                    'status': 'queued',
+                }))
+        elif failed:
+            self.send_body(400, 'text/xml', SES_ERROR_RESPONSE.format(
+                namespace=SES_NAMESPACE, id=msg_id,
+            ))
+        else:
+            self.send_body(200, 'text/xml', SES_RESPONSE.format(
+                namespace=SES_NAMESPACE, id=msg_id,
+            ))
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ProviderStandIns:
+    """
+    Run the stand-ins in background threads.
+
+    >>> with ProviderStandIns(latency=0.05, error_rate=0.01) as standins:
+    ...     with send_to_standins(standins):
+    ...         ...
+    """
+
+    def __init__(self, latency: 'float' = 0.0, error_rate: 'float' = 0.0,
+                 host: 'str' = '127.0.0.1', smtp_port: 'int' = 0,
+                 http_port: 'int' = 0):
+        self.behaviour = Behaviour(latency=latency, error_rate=error_rate)
+        self.host = host
+        self.smtp_port = smtp_port
+        self.http_port = http_port
+        self._servers: 'List[socketserver.BaseServer]' = []
+
+    def __enter__(self) -> 'ProviderStandIns':
+        smtp = ThreadingTCPServer((self.host, self.smtp_port), SMTPSinkHandler)
+        http = ThreadingHTTPServer((self.host, self.http_port),
+                                   HTTPProviderHandler)
+        for server in (smtp, http):
+            server.behaviour = self.behaviour
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+
+        self.smtp_port = smtp.server_address[1]
+        self.http_port = http.server_address[1]
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+    def get_settings(self) -> 'dict':
+        """
+        Django settings pointing built-in handlers to the stand-ins.
+        """
+        http_url = f'http://{self.host}:{self.http_port}'
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.smtp_port,
+            'EMAIL_HOST_PASSWORD': '',
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'AWS_SES_ENDPOINT_URL': http_url,
+            'AWS_SES_REGION_NAME': 'us-east-1',
+            'AWS_SES_ACCESS_KEY_ID': 'standin',
+            'AWS_SES_SECRET_ACCESS_KEY': 'standin',
+            'TWILIO_API_BASE_URL': http_url,
+            'TWILIO_ACCOUNT_SID': 'ACstandin',
+            'TWILIO_AUTH_TOKEN': 'standin',
+            'TWILIO_FROM_PHONE_NUMBER': '+15550000000',
+        }
+
+
+@contextmanager
+def send_to_standins(standins: 'ProviderStandIns'):
+    """
+    Send messages of all handlers (in this process) to the stand-ins.
+    Provider settings point to the stand-ins, backend pools are not used
+    (options of their backends would override the settings and send to
+    the real providers) and created messages are not captured.
+    """
+    with override_settings(**standins.get_settings()), \
+            mock.patch('msg.handlers.get_pool', return_value=None), \
+            mock.patch('msg.capture.maybe_capture', return_value=False):
+        yield
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+from django.db import connections
+
+from .models import Msg
+from .settings import msg_settings
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+class HandlerStats(NamedTuple):
+    handler: 'str'
+    count: 'int'
+    # Seconds for each of `PERCENTILES`
+    queue_lag: 'Tuple[float, ...]'
+    send_latency: 'Tuple[float, ...]'
+
+
+def get_handler_stats(since: 'datetime', until: 'datetime' = None,
+                      using: 'str' = None) -> 'List[HandlerStats]':
+    """
+    Compute queue lag (from `enqueued_at` to `started_at`) and send latency
+    (from `started_at` to `sent_at`) percentiles of messages sent in
+    the given time window, per handler.
+    Percentiles are computed by the database (`read_db` by default).
+    """
+    connection = connections[using or msg_settings.read_db]
+    table = connection.ops.quote_name(Msg._meta.db_table)
+    where = ['status = %s', 'sent_at >= %s']
+    params = [list(PERCENTILES), list(PERCENTILES),
+              Msg.Status.DONE.value, since]
+    if until is not None:
+        where.append('sent_at < %s')
+        params.append(until)
+
+    sql = f'''
+        SELECT
+            type,
+            COUNT(*),
+            percentile_cont(%s::float8[]) WITHIN GROUP (
+                ORDER BY EXTRACT(EPOCH FROM started_at - enqueued_at)
+            ),
+            percentile_cont(%s::float8[]) WITHIN GROUP (
+                ORDER BY EXTRACT(EPOCH FROM sent_at - started_at)
+            )
+        FROM {table}
+        WHERE {' AND '.join(where)}
+        GROUP BY type
+        ORDER BY type
+    '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            HandlerStats(
+                handler=handler,
+                count=count,
+                queue_lag=_to_tuple(queue_lag),
+                send_latency=_to_tuple(send_latency),
+            )
+            for handler, count, queue_lag, send_latency in cursor.fetchall()
+        ]
+
+
+def _to_tuple(values) -> 'Tuple[float, ...]':
+    # Percentiles are NULL if no message has both timestamps set
+    if values is None:
+        return (None,) * len(PERCENTILES)
+    return tuple(values)
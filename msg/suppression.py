@@ -0,0 +1,147 @@
+"""
+Recipient suppression list.
+
+Suppressed recipients (e.g. bounced or unsubscribed addresses, see
+`Suppression`) are filtered out of messages of handlers with a `channel`
+before they are sent. Each process keeps the list in memory and fetches
+new entries every `suppression_refresh` seconds, so checking a recipient
+is a set lookup instead of a query. Removed entries are picked up by
+a full reload, every `FULL_REFRESH_EVERY` refreshes. It runs in
+a background thread, senders keep using the current set meanwhile.
+"""
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from typing import Iterable
+from typing import List
+from typing import Union
+
+from django.db import connections
+from django.utils import timezone
+
+from .settings import msg_settings
+
+FULL_REFRESH_EVERY = 10
+# Incremental refresh reads entries created since the previous refresh
+# minus this margin (in seconds), so entries of transactions committed
+# late (or created on hosts with a skewed clock) aren't missed.
+REFRESH_MARGIN = 60
+
+
+def normalize_recipient(recipient: 'str') -> 'str':
+    return str(recipient).strip().lower()
+
+
+class SuppressionFilter:
+
+    def __init__(self, refresh_interval: 'float'):
+        self.refresh_interval = refresh_interval
+        self._entries: 'set' = set()
+        self._read_since: 'Union[datetime, None]' = None
+        self._refreshes = 0
+        self._refreshed_at: 'Union[float, None]' = None
+        self._reloading = False
+        # Taken by the thread refreshing on the send path
+        self._lock = threading.Lock()
+        # Taken while a refreshed set is swapped in
+        self._swap_lock = threading.Lock()
+
+    def filter(self, channel: 'str',
+               recipients: 'Iterable[str]') -> 'List[str]':
+        """
+        :return:
+            Recipients which are not suppressed on the channel.
+        """
+        self._maybe_refresh()
+        entries = self._entries
+        return [recipient for recipient in recipients
+                if (channel, normalize_recipient(recipient)) not in entries]
+
+    def refresh(self, full: 'bool' = False) -> 'None':
+        from .models import Suppression
+
+        full = full or self._read_since is None
+        read_since = timezone.now()
+        previous = self._entries
+        queryset = Suppression.objects.all()
+        if not full:
+            queryset = queryset.filter(
+                created__gte=(self._read_since
+                              - timedelta(seconds=REFRESH_MARGIN)),
+            )
+        rows = set(queryset.values_list('channel', 'recipient').iterator())
+
+        # Readers keep using the previous set until it is swapped
+        with self._swap_lock:
+            if full:
+                # Keep entries of incremental refreshes done meanwhile
+                self._entries = rows | (self._entries - previous)
+            else:
+                self._entries = self._entries | rows
+            if self._read_since is None or self._read_since < read_since:
+                self._read_since = read_since
+            self._refreshed_at = time.monotonic()
+
+    def reload(self) -> 'None':
+        """
+        Full refresh, run in a background thread.
+        """
+        try:
+            self.refresh(full=True)
+        finally:
+            self._reloading = False
+            connections.close_all()
+
+    def _maybe_refresh(self) -> 'None':
+        refreshed_at = self._refreshed_at
+        if refreshed_at is None:
+            # Nothing can be filtered before the first load
+            with self._lock:
+                if self._refreshed_at is None:
+                    self.refresh(full=True)
+            return
+
+        if time.monotonic() - refreshed_at < self.refresh_interval:
+            return
+        # Other threads keep using the current set meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._refreshed_at is not refreshed_at:
+                # Refreshed by another thread meanwhile
+                return
+            self._refreshes += 1
+            if (self._refreshes % FULL_REFRESH_EVERY == 0
+                    and not self._reloading):
+                self._reloading = True
+                threading.Thread(target=self.reload, daemon=True).start()
+            self.refresh()
+        finally:
+            self._lock.release()
+
+
+_filter: 'Union[SuppressionFilter, None]' = None
+_filter_lock = threading.Lock()
+
+
+def get_filter() -> 'SuppressionFilter':
+    global _filter
+    with _filter_lock:
+        if _filter is None:
+            _filter = SuppressionFilter(msg_settings.suppression_refresh)
+        return _filter
+
+
+def filter_recipients(channel: 'Union[str, None]',
+                      recipients: 'List[str]') -> 'List[str]':
+    """
+    :param channel:
+        Channel of the handler, recipients are not filtered if None
+
+    :return:
+        Recipients which are not suppressed.
+    """
+    if channel is None:
+        return recipients
+    return get_filter().filter(channel, recipients)
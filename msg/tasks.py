@@ -1,11 +1,81 @@
+from datetime import datetime
+from typing import List
 from typing import Union
 
 from celery import shared_task
+from django.utils import timezone
+from django.utils.timezone import utc
 
+from . import counters
+from .exceptions import CircuitOpenException
 from .models import Msg
 
 
+@shared_task(bind=True, max_retries=None)
+def dispatch_msg(self, msg_pk: 'Union[str, int]',
+                 enqueued_at: 'float' = None):
+    msg = Msg.objects.primary().get(pk=msg_pk)
+    if enqueued_at is not None:
+        msg.enqueued_at = datetime.fromtimestamp(enqueued_at, tz=utc)
+    try:
+        # Already PENDING, written (if at all) by `Msg.dispatch()`
+        msg._dispatch(async=True)
+    except CircuitOpenException as exc:
+        if not exc.defer:
+            raise
+        raise self.retry(exc=exc, countdown=exc.retry_after)
+
+
+@shared_task
+def dispatch_msgs(msg_pks: 'List[Union[str, int]]'):
+    failed = Msg.objects.dispatch_batch(
+        Msg.objects.primary().filter(pk__in=msg_pks),
+    )
+
+    deferred = [(msg, exc) for msg, exc in failed
+                if isinstance(exc, CircuitOpenException) and exc.defer]
+    if deferred:
+        dispatch_msgs.apply_async(
+            ([msg.pk for msg, _ in deferred],),
+            countdown=min(exc.retry_after for _, exc in deferred),
+        )
+
+
+@shared_task(bind=True, max_retries=None)
+def dispatch_chunk(self, msg_pk: 'Union[str, int]', chunk: 'int'):
+    msg = Msg.objects.primary().get(pk=msg_pk)
+    try:
+        msg.dispatch_chunk(chunk)
+    except CircuitOpenException as exc:
+        if not exc.defer:
+            raise
+        raise self.retry(exc=exc, countdown=exc.retry_after)
+
+
+@shared_task(bind=True, max_retries=None)
+def dispatch_digest(self, msg_pk: 'Union[str, int]'):
+    if Msg.objects.flush_digests(pks=[msg_pk]):
+        return
+
+    msg = Msg.objects.primary().filter(
+        pk=msg_pk, status=Msg.Status.NEW.value,
+    ).first()
+    if msg is not None:
+        # Too early (or claimed by a concurrent flush)
+        remaining = (msg.coalesce_until - timezone.now()).total_seconds()
+        raise self.retry(countdown=max(remaining, 1))
+
+
+@shared_task
+def flush_digests():
+    Msg.objects.flush_digests()
+
+
+@shared_task
+def expire_msgs():
+    Msg.objects.expire()
+
+
 @shared_task
-def dispatch_msg(msg_pk: 'Union[str, int]'):
-    msg = Msg.objects.get(pk=msg_pk)
-    msg.dispatch(async=False)
+def reconcile_counters():
+    counters.reconcile()
@@ -1,7 +1,27 @@
 import importlib
+from typing import Iterable
+
+from django.conf import settings
+from django.utils import translation
 
 
 def import_from_string(val):
     module_path, class_name = val.rsplit('.', 1)
     module = importlib.import_module(module_path)
     return getattr(module, class_name)
+
+
+def warm_up_translations(languages: 'Iterable[str]' = None) -> 'None':
+    """
+    Load translation catalogs of the given languages (all languages
+    from `settings.LANGUAGES` by default), so the catalogs are loaded
+    once per process and not while the first message in the language
+    is dispatched. Worker processes forked afterwards share the loaded
+    catalogs.
+    """
+    if languages is None:
+        languages = [code for code, name in settings.LANGUAGES]
+
+    for language in languages:
+        with translation.override(language):
+            pass
@@ -0,0 +1,18 @@
+from django.http import Http404
+from django.http import HttpResponse
+
+from .metrics import get_backend
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics(request):
+    """
+    Expose metrics of the dispatch pipeline in Prometheus text format.
+    """
+    backend = get_backend()
+    if backend is None:
+        raise Http404('Metrics backend is not configured.')
+
+    return HttpResponse(backend.export(),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
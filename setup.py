@@ -18,7 +18,13 @@ setup(
         'celery': ['celery >= 4.0.0'],
         'boto3': ['boto3 >= 1.0.0'],
         'twilio': ['twilio >= 6.0.0'],
-        'all': ['celery >= 4.0.0', 'boto3 >= 1.0.0', 'twilio >= 6.0.0'],
+        'prometheus': ['prometheus_client >= 0.4.0'],
+        'zstd': ['zstandard >= 0.9.0'],
+        'jinja2': ['Jinja2 >= 2.10'],
+        'premailer': ['premailer >= 3.0.0'],
+        'all': ['celery >= 4.0.0', 'boto3 >= 1.0.0', 'twilio >= 6.0.0',
+                'prometheus_client >= 0.4.0', 'zstandard >= 0.9.0',
+                'Jinja2 >= 2.10', 'premailer >= 3.0.0'],
     },
     test_suite='tests',
     classifiers=[
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from django.contrib.admin import site
+from django.contrib.admin.views.main import PAGE_VAR
+from django.db.utils import ConnectionDoesNotExist
+from django.test import RequestFactory
+
+from .helpers import BaseTestCase
+from msg.admin import EstimatedCountPaginator
+from msg.admin import MsgChangeList
+from msg.admin import MsgModelAdmin
+from msg.admin import estimate_count
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class AdminTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model_admin = MsgModelAdmin(Msg, site)
+        Msg.objects.bulk_create([
+            Msg(type='default', language='en',
+                recipients=[f'{i}@test.test' for i in range(i + 1)])
+            for i in range(5)
+        ])
+
+    def _changelist(self, **params):
+        request = RequestFactory().get('/', params)
+        self.model_admin.list_per_page = 2
+        return self.model_admin.get_changelist_instance(request)
+
+    def test_estimated_count(self):
+        self.assertIsInstance(estimate_count(Msg.objects.all()), int)
+        self.assertEqual(estimate_count(Msg.objects.none()), 0)
+
+        paginator = EstimatedCountPaginator(Msg.objects.all(), 2)
+        self.assertEqual(paginator.count, 5)
+
+        paginator = EstimatedCountPaginator(Msg.objects.all(), 2)
+        paginator.exact_count_limit = 0
+        # Only EXPLAIN
+        with self.assertNumQueries(1):
+            paginator.count
+
+    def test_keyset_navigation(self):
+        changelist = self._changelist()
+        pks = [msg.pk for msg in changelist.result_list]
+        self.assertEqual(pks, sorted(Msg.objects.values_list('pk', flat=True),
+                                     reverse=True)[:2])
+        self.assertEqual(changelist.next_page_url, f'?id__lt={pks[-1]}')
+
+        changelist = self._changelist(id__lt=pks[-1])
+        self.assertLess(changelist.result_list[0].pk, pks[-1])
+
+        changelist = self._changelist(**{'o': '2', PAGE_VAR: '1'})
+        self.assertIsNone(changelist.next_page_url)
+
+    def test_default_filter(self):
+        Msg.objects.update(created='2000-01-01T00:00:00Z')
+        Msg.objects.create(type='default', language='en', recipients=[])
+
+        self.assertEqual(self._changelist().result_count, 1)
+        self.assertEqual(
+            self._changelist(created_within='all').result_count, 6,
+        )
+
+    @mock.patch.dict(msg_settings.user_config, {'read_db': 'replica'})
+    def test_read_db(self):
+        # Listing is read from `read_db`
+        with self.assertRaises(ConnectionDoesNotExist):
+            self._changelist()
+
+        # Actions (e.g. `delete_selected`) write to the primary database
+        with mock.patch.object(MsgChangeList, 'get_results'):
+            changelist = self._changelist()
+        changelist.get_queryset(RequestFactory().get('/')).delete()
+
+        self.assertFalse(Msg.objects.exists())
+
+    def test_changelist_row(self):
+        changelist = self._changelist(created_within='all')
+        msg = changelist.result_list[0]
+
+        self.assertIn('context', msg.get_deferred_fields())
+        self.assertEqual(
+            self.model_admin.get_recipients(msg),
+            '0@test.test, 1@test.test, 2@test.test (+2)',
+        )
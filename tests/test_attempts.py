@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.settings import msg_settings
+from msg.tasks import dispatch_msg
+
+
+class AttemptsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.failing = False
+        test_case = self
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+            def send(self, msg):
+                if test_case.failing:
+                    raise ConnectionError('Provider is down.')
+                return super().send(msg)
+
+    def test_attempts_are_logged(self):
+        self.failing = True
+        msg = Msg.new(dispatch_now=False)
+        with self.assertRaises(ConnectionError):
+            msg.dispatch()
+        self.failing = False
+        msg.dispatch()
+
+        failed, sent = msg.attempt_log.order_by('attempt')
+        self.assertEqual((failed.attempt, failed.status),
+                         (1, Msg.Status.ERROR.value))
+        self.assertEqual(failed.error, 'ConnectionError: Provider is down.')
+        self.assertEqual(failed.provider_id, '')
+        self.assertEqual((sent.attempt, sent.status),
+                         (2, Msg.Status.DONE.value))
+        self.assertEqual(sent.provider_id,
+                         mail.outbox[0].extra_headers['Message-ID'])
+        self.assertLessEqual(sent.enqueued_at, sent.started_at)
+        self.assertLessEqual(sent.started_at, sent.finished_at)
+
+    def test_batch_render_failure_is_logged(self):
+        msg = Msg.new(dispatch_now=False)
+
+        with mock.patch.object(EmailHandler, 'render',
+                               side_effect=ValueError('Broken template')):
+            failed = Msg.objects.dispatch_batch([msg])
+
+        self.assertEqual(len(failed), 1)
+        attempt = msg.attempt_log.get()
+        self.assertEqual((attempt.attempt, attempt.status),
+                         (1, Msg.Status.ERROR.value))
+        self.assertEqual(attempt.error, 'ValueError: Broken template')
+        self.assertEqual(Msg.objects.get(pk=msg.pk).attempts, 1)
+
+    def _msg_updates(self, queries):
+        return [query for query in queries.captured_queries
+                if query['sql'].startswith('UPDATE "msg_msg"')]
+
+    @mock.patch.dict(msg_settings.user_config, {'terminal_writes_only': True})
+    def test_terminal_writes_only(self):
+        msg = Msg.new(dispatch_now=False)
+
+        with CaptureQueriesContext(connection) as queries:
+            msg.dispatch()
+        self.assertEqual(len(self._msg_updates(queries)), 1)
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertIsNotNone(msg.enqueued_at)
+        self.assertEqual(msg.attempt_log.get().status, Msg.Status.DONE.value)
+
+        msgs = [Msg.new(dispatch_now=False) for _ in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            Msg.objects.dispatch_batch(msgs)
+        self.assertEqual(len(self._msg_updates(queries)), 3)
+
+    @mock.patch.dict(msg_settings.user_config, {'terminal_writes_only': True})
+    def test_async_enqueued_at(self):
+        msg = Msg.new(dispatch_now=False)
+        with mock.patch('msg.tasks.dispatch_msg.delay') as delay:
+            msg.dispatch(async=True)
+
+        self.assertEqual(Msg.objects.get(pk=msg.pk).status,
+                         Msg.Status.NEW.value)
+        dispatch_msg(*delay.call_args[0])
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(msg.enqueued_at, msg.attempt_log.get().enqueued_at)
+        self.assertLessEqual(msg.enqueued_at, msg.started_at)
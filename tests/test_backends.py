@@ -0,0 +1,179 @@
+import smtplib
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+
+from .helpers import BaseTestCase
+from msg import backends
+from msg import hedging
+from msg.exceptions import CircuitOpenException
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class BackendsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        backends._pools.clear()
+        hedging._trackers.clear()
+
+    def test_weighted_order(self):
+        pool = backends.BackendPool('smtp', [
+            {'name': 'a', 'weight': 3},
+            {'name': 'b', 'weight': 1},
+        ])
+
+        first = [pool.get_order()[0]['name'] for _ in range(2000)]
+
+        self.assertTrue(0.65 < first.count('a') / len(first) < 0.85)
+
+    def test_slow_backend_weight_is_lowered(self):
+        pool = backends.BackendPool('smtp', [
+            {'name': 'a'},
+            {'name': 'b', 'weight': 2},
+        ])
+        for _ in range(hedging.MIN_SAMPLES):
+            pool.trackers['a'].observe(0.1)
+            pool.trackers['b'].observe(1.0)
+
+        self.assertEqual(pool.get_weights(), {'a': 1, 'b': 0.2})
+
+    def test_all_breakers_open(self):
+        pool = backends.BackendPool('smtp', [{'name': 'a'}],
+                                    {'failure_threshold': 1})
+        func = mock.Mock(side_effect=ConnectionError)
+
+        with self.assertRaises(ConnectionError):
+            pool.call(func)
+        with self.assertRaises(CircuitOpenException):
+            pool.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_breakers_disabled(self):
+        pool = backends.BackendPool('smtp', [{'name': 'a'}, {'name': 'b'}])
+        func = mock.Mock(side_effect=ConnectionError)
+
+        for _ in range(10):
+            with self.assertRaises(ConnectionError):
+                pool.call(func)
+
+        self.assertEqual(pool.breakers, {})
+        self.assertEqual(func.call_count, 20)
+
+    def test_message_errors_are_not_failed_over(self):
+        pool = backends.BackendPool('smtp', [{'name': 'a'}, {'name': 'b'}],
+                                    {'failure_threshold': 1})
+        refused = smtplib.SMTPRecipientsRefused({'a@test.test': (550, b'')})
+        func = mock.Mock(side_effect=refused)
+
+        for _ in range(3):
+            with self.assertRaises(smtplib.SMTPRecipientsRefused):
+                pool.call(func)
+
+        # Each call tried a single backend and no breaker opened
+        self.assertEqual(func.call_count, 3)
+        for backend_breaker in pool.breakers.values():
+            self.assertFalse(backend_breaker.allow())
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'backends': {'smtp': [{'name': 'a', 'host': 'a.test'}]},
+    })
+    def test_pool_per_config(self):
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        handler = TestHandler()
+        pool = backends.get_pool(handler)
+        self.assertIs(backends.get_pool(handler), pool)
+
+        with mock.patch.dict(msg_settings.user_config, {
+            'backends': {'smtp': [{'name': 'b', 'host': 'b.test'}]},
+        }):
+            other = backends.get_pool(handler)
+
+        self.assertEqual([backend['name'] for backend in other.backends],
+                         ['b'])
+
+    def test_pool_of_nested_options(self):
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            backends = [{'name': 'a', 'config': {'retries': {'mode': 'a'}},
+                         'headers': ['X-Test']}]
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        def get_connection(timeout, **options):
+            self.assertEqual(options['config'], {'retries': {'mode': 'a'}})
+            return mail.get_connection()
+
+        with mock.patch('msg.handlers.get_connection', get_connection):
+            Msg.new(dispatch_now=True)
+        self.assertEqual(len(mail.outbox), 1)
+
+        handler = TestHandler()
+        pool = backends.get_pool(handler)
+        self.assertIs(backends.get_pool(handler), pool)
+
+        handler.backends = [{'name': 'a', 'config': {'retries': {'mode': 'b'}},
+                             'headers': ['X-Test']}]
+        self.assertIsNot(backends.get_pool(handler), pool)
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'backends': {
+            'smtp': [
+                {'name': 'relay-1', 'host': 'relay-1.test'},
+                {'name': 'relay-2', 'host': 'relay-2.test'},
+            ],
+        },
+        'circuit_breaker': {'failure_threshold': 5},
+    })
+    def test_failover(self):
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        hosts = []
+
+        def get_connection(timeout, host):
+            hosts.append(host)
+            if host == 'relay-1.test':
+                raise ConnectionError('Relay is down.')
+            return mail.get_connection()
+
+        with mock.patch('msg.handlers.get_connection', get_connection):
+            for _ in range(20):
+                Msg.new(dispatch_now=True)
+
+        self.assertEqual(len(mail.outbox), 20)
+        self.assertEqual(hosts.count('relay-2.test'), 20)
+        # Breaker of the failing relay opens after 5 failures
+        self.assertLessEqual(hosts.count('relay-1.test'), 5)
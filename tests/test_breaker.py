@@ -0,0 +1,184 @@
+import smtplib
+import time
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.template import TemplateDoesNotExist
+
+from .helpers import BaseTestCase
+from msg import breaker
+from msg.exceptions import CircuitOpenException
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class BreakerTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        breaker._breakers.clear()
+        self.calls = []
+        self.failing = True
+        test_case = self
+
+        class TestHandlerMixin:
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, handler_name):
+                return handler_name == self.name
+
+            def parse(self, handler_name):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+            def send(self, msg):
+                test_case.calls.append(self.name)
+                if test_case.failing and self.provider == 'relay':
+                    raise ConnectionError('Provider is down.')
+                super().send(msg)
+
+        type('RelayHandler', (TestHandlerMixin, EmailHandler), {
+            'name': 'relay',
+            'provider': 'relay',
+        })
+        type('OtherHandler', (TestHandlerMixin, EmailHandler), {
+            'name': 'other',
+        })
+
+    def _dispatch(self, handler_name):
+        msg = Msg.new(handler_name, dispatch_now=False)
+        try:
+            msg.dispatch()
+        except (ConnectionError, CircuitOpenException) as exc:
+            return msg, exc
+        return msg, None
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'circuit_breaker': {'failure_threshold': 2, 'cooldown': 30},
+    })
+    def test_open_and_close(self):
+        for _ in range(2):
+            msg, exc = self._dispatch('relay')
+            self.assertIsInstance(exc, ConnectionError)
+
+        msg, exc = self._dispatch('relay')
+        self.assertIsInstance(exc, CircuitOpenException)
+        self.assertFalse(exc.defer)
+        self.assertEqual(msg.status, Msg.Status.ERROR.value)
+        self.assertEqual(msg.attempts, 0)
+        self.assertEqual(self.calls, ['relay', 'relay'])
+
+        # Other providers are not affected
+        msg, exc = self._dispatch('other')
+        self.assertIsNone(exc)
+        self.assertEqual(len(mail.outbox), 1)
+
+        self.failing = False
+        later = time.time() + 31
+        with mock.patch('msg.breaker.time.time', return_value=later):
+            msg, exc = self._dispatch('relay')
+            self.assertIsNone(exc)
+            msg, exc = self._dispatch('relay')
+            self.assertIsNone(exc)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'circuit_breaker': {'failure_threshold': 2, 'cooldown': 30},
+    })
+    def test_template_errors_are_not_provider_failures(self):
+        class BrokenHandler(EmailHandler):
+            name = 'broken'
+            provider = 'relay'
+            subject = 'test'
+            template_text = 'tests/emails/missing.txt'
+            template_html = 'tests/emails/missing.html'
+
+            def match(self, handler_name):
+                return handler_name == self.name
+
+            def parse(self, handler_name):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        for _ in range(3):
+            msg = Msg.new('broken', dispatch_now=False)
+            with self.assertRaises(TemplateDoesNotExist):
+                msg.dispatch()
+
+        self.failing = False
+        msg, exc = self._dispatch('relay')
+        self.assertIsNone(exc)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'circuit_breaker': {'failure_threshold': 1, 'cooldown': 30},
+    })
+    def test_failed_trial_opens_again(self):
+        self._dispatch('relay')
+
+        later = time.time() + 31
+        with mock.patch('msg.breaker.time.time', return_value=later):
+            msg, exc = self._dispatch('relay')
+            self.assertIsInstance(exc, ConnectionError)
+            msg, exc = self._dispatch('relay')
+            self.assertIsInstance(exc, CircuitOpenException)
+        self.assertEqual(len(self.calls), 2)
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'circuit_breaker': {'failure_threshold': 1, 'on_open': 'defer'},
+    })
+    def test_defer(self):
+        self._dispatch('relay')
+
+        msg, exc = self._dispatch('relay')
+
+        self.assertIsInstance(exc, CircuitOpenException)
+        self.assertTrue(exc.defer)
+        self.assertEqual(Msg.objects.get(pk=msg.pk).status,
+                         Msg.Status.PENDING.value)
+
+    def test_disabled_by_default(self):
+        for _ in range(10):
+            self._dispatch('relay')
+        self.assertEqual(len(self.calls), 10)
+
+    def test_provider_failures(self):
+        from botocore.exceptions import ClientError
+        from botocore.exceptions import EndpointConnectionError
+        from twilio.base.exceptions import TwilioRestException
+
+        def client_error(status, code):
+            return ClientError({
+                'Error': {'Code': code},
+                'ResponseMetadata': {'HTTPStatusCode': status},
+            }, 'SendEmail')
+
+        failures = [
+            ConnectionError(),
+            TimeoutError(),
+            smtplib.SMTPServerDisconnected(),
+            smtplib.SMTPResponseException(421, b'Try again later'),
+            smtplib.SMTPRecipientsRefused({'a@test.test': (450, b'Busy')}),
+            EndpointConnectionError(endpoint_url='http://ses.test'),
+            client_error(503, 'ServiceUnavailable'),
+            client_error(400, 'Throttling'),
+            TwilioRestException(500, '/Messages'),
+            TwilioRestException(429, '/Messages'),
+        ]
+        for exc in failures:
+            self.assertTrue(breaker.is_provider_failure(exc), exc)
+
+        errors = [
+            ValueError(),
+            TemplateDoesNotExist('test.html'),
+            smtplib.SMTPRecipientsRefused({'a@test.test': (550, b'No')}),
+            smtplib.SMTPDataError(552, b'Too large'),
+            client_error(400, 'MessageRejected'),
+            TwilioRestException(400, '/Messages'),
+        ]
+        for exc in errors:
+            self.assertFalse(breaker.is_provider_failure(exc), exc)
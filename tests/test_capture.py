@@ -0,0 +1,157 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+
+from .helpers import BaseTestCase
+from msg.capture import get_shape
+from msg.capture import restore_shape
+from msg.handlers import EmailHandler
+from msg.handlers import MetaHandler
+from msg.handlers import MsgCtx
+from msg.loadtest import get_replay_ctx
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class CaptureTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        MetaHandler._handlers_map = {}
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+        class TestHandler(EmailHandler):
+            name = 'welcome'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, recipients, context, language='en'):
+                return MsgCtx(recipients=recipients, context=context,
+                              language=language)
+
+
+class CaptureTestCase(CaptureTestMixin, BaseTestCase):
+
+    def test_shape(self):
+        context = {'name': 'Joe', 'items': [{'id': 1, 'price': 9.5}],
+                   'active': True, 'note': None}
+
+        shape = get_shape(context)
+
+        self.assertEqual(shape, {'name': 's3', 'items': [{'id': 'i',
+                                                          'price': 'f'}],
+                                 'active': 'b', 'note': None})
+        self.assertEqual(restore_shape(shape), {
+            'name': 'xxx', 'items': [{'id': 0, 'price': 0.0}],
+            'active': False, 'note': None,
+        })
+
+    def test_shape_of_data_keys(self):
+        context = {'scores': {'joe@test.test': 1, 'ann@test.test': 2},
+                   'orders': {1001: 'a', 1002: 'b'}}
+
+        self.assertEqual(get_shape(context), {
+            'scores': {'k0': 'i', 'k1': 'i'},
+            'orders': {'k0': 's1', 'k1': 's1'},
+        })
+
+    def test_capture(self):
+        config = {'capture_rate': 1.0, 'capture_file': self.path}
+        with mock.patch.dict(msg_settings.user_config, config):
+            Msg.new(['a@test.test', 'b@test.test'], {'name': 'Joe'},
+                    dispatch_now=False)
+            Msg.new(['c@test.test'], {}, language='pl', dispatch_now=False)
+        config['capture_rate'] = 0.0
+        with mock.patch.dict(msg_settings.user_config, config):
+            Msg.new(['c@test.test'], {}, dispatch_now=False)
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['handler'], 'welcome')
+        self.assertEqual(records[0]['recipients'], 2)
+        self.assertEqual(records[0]['context'], {'name': 's3'})
+        self.assertNotIn('Joe', json.dumps(records))
+        self.assertNotIn('test.test', json.dumps(records))
+        self.assertEqual(records[1]['language'], 'pl')
+
+        msg_ctx = get_replay_ctx(records[0], 1)
+        self.assertEqual(msg_ctx.recipients, ['replay-1000@example.com',
+                                              'replay-1001@example.com'])
+        msg = Msg.objects.create_from_ctx('welcome', msg_ctx)
+        self.assertEqual(msg.context, {'name': 'xxx'})
+
+
+class ReplayTestCase(CaptureTestMixin, TransactionTestCase):
+    """
+    Replayed messages are created by other threads (connections),
+    so they can't be rolled back.
+    """
+
+    def test_replay(self):
+        with open(self.path, 'w') as f:
+            for i in range(3):
+                f.write(json.dumps({
+                    'time': 1000 + i * 0.01, 'handler': 'welcome',
+                    'language': 'en', 'recipients': 1, 'context': {},
+                }) + '\n')
+
+        out = StringIO()
+        call_command('msg_replay', self.path, speed=10, stdout=out)
+
+        self.assertIn('Messages:   3 (done 3, errors 0', out.getvalue())
+        self.assertFalse(Msg.objects.exists())
+
+    def test_replay_is_not_sent_to_backends(self):
+        class PooledHandler(EmailHandler):
+            name = 'pooled'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            # Real relay, refuses connections
+            backends = [{'name': 'relay', 'host': '127.0.0.1', 'port': 1}]
+
+            def match(self, *args, **kwargs):
+                return False
+
+            def parse(self, *args, **kwargs):
+                pass
+
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({
+                'time': 1000, 'handler': 'pooled', 'language': 'en',
+                'recipients': 1, 'context': {},
+            }) + '\n')
+
+        out = StringIO()
+        with mock.patch('msg.handlers.get_connection',
+                        wraps=get_connection) as connection:
+            call_command('msg_replay', self.path, speed=0, stdout=out)
+
+        self.assertIn('Messages:   1 (done 1, errors 0', out.getvalue())
+        self.assertEqual(connection.call_count, 1)
+        self.assertNotIn('host', connection.call_args[1])
+
+    def test_replay_missing_handler(self):
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({
+                'time': 1000, 'handler': 'missing', 'language': 'en',
+                'recipients': 1, 'context': {},
+            }) + '\n')
+
+        with self.assertRaisesRegex(CommandError, 'missing'):
+            call_command('msg_replay', self.path, stdout=StringIO())
@@ -0,0 +1,90 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.utils import timezone
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import _context_cache
+from msg.models import Msg
+from msg.models import MsgContext
+from msg.settings import msg_settings
+
+CONTEXT = {'name': 'John', 'items': ['x' * 100] * 20}
+
+
+class ContextStorageTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        _context_cache.clear()
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, context):
+                return True
+
+            def parse(self, context):
+                return MsgCtx(
+                    recipients=['test@test.test'],
+                    context=context,
+                )
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'context_storage': 'deduplicated',
+        'context_compression': 'zlib',
+    })
+    def test_deduplicated(self):
+        msgs = [Msg.new(CONTEXT, dispatch_now=False) for _ in range(3)]
+        Msg.new({}, dispatch_now=False)
+
+        self.assertEqual(MsgContext.objects.count(), 1)
+        stored = MsgContext.objects.get()
+        self.assertEqual(stored.compression, 'zlib')
+        self.assertEqual(stored.get_context(), CONTEXT)
+        self.assertEqual(msgs[0].context, CONTEXT)
+        self.assertEqual(
+            Msg.objects.filter(context={}).count(), 4,
+        )
+
+        msg = Msg.objects.get(pk=msgs[0].pk)
+        self.assertTrue(msg.context_pending)
+        msg.dispatch()
+        self.assertEqual(msg.context, CONTEXT)
+        self.assertEqual(Msg.objects.get(pk=msg.pk).context, {})
+        self.assertEqual(len(mail.outbox), 1)
+
+        failed = Msg.objects.dispatch_batch(
+            Msg.objects.filter(status=Msg.Status.NEW.value),
+        )
+        self.assertEqual(failed, [])
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_inline(self):
+        msg = Msg.new(CONTEXT, dispatch_now=False)
+        self.assertIsNone(msg.context_ref)
+        self.assertEqual(Msg.objects.get(pk=msg.pk).context, CONTEXT)
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'context_storage': 'deduplicated',
+    })
+    def test_purge_orphans(self):
+        msg = Msg.new({'a': 1}, dispatch_now=False)
+        Msg.new({'b': 2}, dispatch_now=False).delete()
+        later = timezone.now() + timedelta(seconds=1)
+
+        self.assertEqual(MsgContext.objects.purge_orphans(later), 1)
+        self.assertEqual(
+            list(MsgContext.objects.values_list('digest', flat=True)),
+            [msg.context_ref_id],
+        )
+        self.assertEqual(
+            MsgContext.objects.purge_orphans(timezone.now() - timedelta(1)),
+            0,
+        )
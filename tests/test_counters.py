@@ -0,0 +1,86 @@
+from io import StringIO
+
+from django.core import mail
+from django.core.management import call_command
+
+from .helpers import BaseTestCase
+from msg import counters
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.models import MsgCounter
+from msg.models import MsgCounterDelta
+
+
+class CountersTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        class TestHandlerMixin:
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, handler_name):
+                return handler_name == self.name
+
+            def parse(self, handler_name):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        type('WelcomeHandler', (TestHandlerMixin, EmailHandler), {
+            'name': 'welcome',
+        })
+        type('ResetHandler', (TestHandlerMixin, EmailHandler), {
+            'name': 'reset',
+        })
+
+    def test_counts(self):
+        for _ in range(3):
+            Msg.new('welcome', dispatch_now=False)
+        Msg.new('welcome', dispatch_now=True)
+        Msg.new('reset', dispatch_now=False)
+
+        expected = {
+            'reset': {'NEW': 1},
+            'welcome': {'NEW': 3, 'DONE': 1},
+        }
+        self.assertEqual(counters.get_counts(), expected)
+
+        counters.reconcile()
+        self.assertFalse(MsgCounterDelta.objects.exists())
+        self.assertTrue(MsgCounter.objects.exists())
+        self.assertEqual(counters.get_counts(), expected)
+
+        Msg.objects.filter(type='welcome', status=Msg.Status.NEW.value) \
+            .update(status=Msg.Status.ERROR.value)
+        Msg.objects.filter(type='reset').delete()
+        counters.reconcile()
+
+        self.assertEqual(counters.get_counts(), {
+            'welcome': {'DONE': 1, 'ERROR': 3},
+        })
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_bulk_import(self):
+        Msg.bulk_new(['welcome'] * 5, dispatch_now=False)
+
+        self.assertEqual(counters.get_counts(), {'welcome': {'NEW': 5}})
+
+    def test_rebuild(self):
+        Msg.new('welcome', dispatch_now=False)
+        MsgCounterDelta.objects.create(type='welcome', status=1, delta=10)
+
+        counters.rebuild()
+
+        self.assertEqual(counters.get_counts(), {'welcome': {'NEW': 1}})
+
+    def test_command(self):
+        Msg.new('welcome', dispatch_now=False)
+        out = StringIO()
+
+        call_command('msg_stats', counts=True, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('handler  new  pending'))
+        self.assertTrue(lines[1].startswith('welcome  1    0'))
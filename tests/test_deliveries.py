@@ -0,0 +1,102 @@
+from unittest import mock
+
+from django.core import mail
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.settings import msg_settings
+
+RECIPIENTS = [f'{c}@test.test' for c in 'abcde']
+
+
+class DeliveriesTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.failing = set()
+        failing = self.failing
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            recipients_chunk_size = 2
+
+            def match(self, recipients):
+                return True
+
+            def parse(self, recipients):
+                return MsgCtx(recipients=recipients, context={})
+
+            def send(self, msg):
+                if failing & set(msg.recipients):
+                    raise ConnectionError('Provider is down.')
+                super().send(msg)
+
+    def test_split_dispatch(self):
+        self.failing.add('c@test.test')
+        msg = Msg.new(RECIPIENTS, dispatch_now=False)
+
+        with self.assertRaises(ConnectionError):
+            msg.dispatch()
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.ERROR.value)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            list(msg.deliveries.order_by('position')
+                 .values_list('chunk', 'status')),
+            [(0, Msg.Status.DONE.value), (0, Msg.Status.DONE.value),
+             (1, Msg.Status.ERROR.value), (1, Msg.Status.ERROR.value),
+             (2, Msg.Status.DONE.value)],
+        )
+
+        # Only the failed chunk is sent again
+        self.failing.clear()
+        msg.dispatch()
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertIsNotNone(msg.sent_at)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[2].to, ['c@test.test', 'd@test.test'])
+        self.assertEqual(
+            msg.deliveries.get(recipient='c@test.test').attempts, 2,
+        )
+
+    def test_not_split(self):
+        msg = Msg.new(RECIPIENTS[:2], dispatch_now=True)
+
+        self.assertFalse(msg.deliveries.exists())
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @mock.patch.dict(msg_settings.user_config, {'async': True})
+    def test_chunks_dispatched_async(self):
+        msg = Msg.new(RECIPIENTS, dispatch_now=False)
+
+        with mock.patch('msg.tasks.dispatch_chunk.delay') as delay:
+            msg._dispatch()
+
+        delay.assert_has_calls([mock.call(msg.pk, chunk)
+                                for chunk in range(3)])
+        self.assertEqual(len(mail.outbox), 0)
+
+        for chunk in range(3):
+            Msg.objects.get(pk=msg.pk).dispatch_chunk(chunk)
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @mock.patch.dict(msg_settings.user_config, {'async': True})
+    def test_sync_dispatch_sends_chunks_inline(self):
+        with mock.patch('msg.tasks.dispatch_chunk.delay') as delay:
+            msg = Msg.new(RECIPIENTS, dispatch_now=True, async=False)
+
+        delay.assert_not_called()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(len(mail.outbox), 3)
@@ -0,0 +1,84 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+
+
+class DigestsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            coalesce_window = 60
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, recipient, event):
+                return MsgCtx(recipients=[recipient],
+                              context={'event': event})
+
+    def _flush_later(self):
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('msg.models.timezone.now', return_value=later):
+            return Msg.objects.flush_digests()
+
+    def test_burst_is_merged(self):
+        first = Msg.new('a@test.test', 1, dispatch_now=True)
+        second = Msg.new('a@test.test', 2, dispatch_now=True)
+        other = Msg.new('b@test.test', 3, dispatch_now=True)
+
+        self.assertFalse(first.coalesced)
+        self.assertTrue(second.coalesced)
+        self.assertEqual(second.pk, first.pk)
+        self.assertNotEqual(other.pk, first.pk)
+        self.assertEqual(Msg.objects.count(), 2)
+        self.assertEqual(Msg.objects.get(pk=first.pk).context, {
+            'event': 2,
+            'digest': [{'event': 1}, {'event': 2}],
+        })
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_flush(self):
+        msg = Msg.new('a@test.test', 1, dispatch_now=True)
+        Msg.new('a@test.test', 2, dispatch_now=True)
+
+        # Window hasn't passed yet
+        self.assertEqual(Msg.objects.flush_digests(), 0)
+        self.assertEqual(self._flush_later(), 1)
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self._flush_later(), 0)
+
+        # Dispatched digest is closed, a new one is opened
+        new = Msg.new('a@test.test', 3, dispatch_now=True)
+        self.assertNotEqual(new.pk, msg.pk)
+
+    def test_flush_command(self):
+        Msg.new('a@test.test', 1, dispatch_now=False)
+        Msg.objects.update(coalesce_until=timezone.now())
+
+        call_command('msg_flush_digests', stdout=mock.Mock())
+
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_async_digest_is_scheduled(self):
+        with mock.patch('msg.tasks.dispatch_digest.apply_async') as task:
+            msg = Msg.new('a@test.test', 1, dispatch_now=True, async=True)
+            Msg.new('a@test.test', 2, dispatch_now=True, async=True)
+
+        task.assert_called_once_with((msg.pk,), eta=msg.coalesce_until)
@@ -0,0 +1,89 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+
+
+class ExpiryTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            ttl = 60
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, ttl=None):
+                return MsgCtx(recipients=['test@test.test'], context={},
+                              ttl=ttl)
+
+    def _later(self, seconds):
+        later = timezone.now() + timedelta(seconds=seconds)
+        return mock.patch('django.utils.timezone.now', return_value=later)
+
+    def test_expires_at(self):
+        msg = Msg.new(dispatch_now=False)
+        self.assertAlmostEqual(msg.expires_at - msg.created,
+                               timedelta(seconds=60),
+                               delta=timedelta(seconds=1))
+
+        msg = Msg.new(ttl=600, dispatch_now=False)
+        self.assertAlmostEqual(msg.expires_at - msg.created,
+                               timedelta(seconds=600),
+                               delta=timedelta(seconds=1))
+
+    def test_expired_message_is_not_sent(self):
+        msg = Msg.new(dispatch_now=False)
+
+        with self._later(61):
+            msg.dispatch()
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.EXPIRED.value)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_batch_dispatch(self):
+        stale = Msg.new(dispatch_now=False)
+        fresh = Msg.new(ttl=600, dispatch_now=False)
+
+        with self._later(61):
+            failed = Msg.objects.dispatch_batch(Msg.objects.all())
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            dict(Msg.objects.values_list('pk', 'status')),
+            {
+                fresh.pk: Msg.Status.DONE.value,
+                stale.pk: Msg.Status.EXPIRED.value,
+            },
+        )
+
+    def test_sweep(self):
+        msg = Msg.new(dispatch_now=False)
+        sent = Msg.new(dispatch_now=True)
+
+        call_command('msg_expire', stdout=mock.Mock())
+        self.assertEqual(Msg.objects.get(pk=msg.pk).status,
+                         Msg.Status.NEW.value)
+
+        with self._later(61):
+            self.assertEqual(Msg.objects.expire(), 1)
+
+        self.assertEqual(Msg.objects.get(pk=msg.pk).status,
+                         Msg.Status.EXPIRED.value)
+        self.assertEqual(Msg.objects.get(pk=sent.pk).status,
+                         Msg.Status.DONE.value)
@@ -0,0 +1,130 @@
+import threading
+import time
+from unittest import mock
+
+from django.core import mail
+from django.test import override_settings
+
+from .helpers import BaseTestCase
+from msg import hedging
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.handlers import SESHandler
+from msg.handlers import TwilioHandler
+from msg.models import Msg
+from msg.settings import msg_settings
+
+
+class HedgingTestCase(BaseTestCase):
+
+    def _warm_tracker(self, latency=0.01):
+        tracker = hedging.LatencyTracker()
+        for _ in range(hedging.MIN_SAMPLES):
+            tracker.observe(latency)
+        return tracker
+
+    def test_percentile(self):
+        tracker = hedging.LatencyTracker(window=100)
+        self.assertIsNone(tracker.percentile(0.95))
+        for i in range(200):
+            tracker.observe(i)
+
+        self.assertEqual(len(tracker), 100)
+        self.assertEqual(tracker.percentile(0.5), 150)
+        self.assertEqual(tracker.percentile(0.95), 195)
+        self.assertEqual(tracker.percentile(1.0), 199)
+
+    def test_slow_call_is_hedged(self):
+        calls = []
+        lock = threading.Lock()
+
+        def func():
+            with lock:
+                calls.append(None)
+                attempt = len(calls)
+            if attempt == 1:
+                time.sleep(0.5)
+            return attempt
+
+        start = time.monotonic()
+        result = hedging.call(func, self._warm_tracker(), hedge=True)
+
+        self.assertEqual(result, 2)
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_fast_failure_is_not_hedged(self):
+        func = mock.Mock(side_effect=ConnectionError)
+
+        with self.assertRaises(ConnectionError):
+            hedging.call(func, self._warm_tracker(0.5), hedge=True)
+        self.assertEqual(func.call_count, 1)
+
+    def test_not_hedged_without_samples(self):
+        tracker = hedging.LatencyTracker()
+        func = mock.Mock(return_value='ok')
+
+        self.assertEqual(hedging.call(func, tracker, hedge=True), 'ok')
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(len(tracker), 1)
+
+
+class TimeoutsTestCase(BaseTestCase):
+
+    @override_settings(TWILIO_ACCOUNT_SID='AC123', TWILIO_AUTH_TOKEN='x')
+    def test_twilio_timeouts(self):
+        class TestHandler(TwilioHandler):
+            name = 'sms'
+            template_text = 'tests/sms/test.txt'
+            read_timeout = 3
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                pass
+
+        client = TestHandler()._get_client()
+        self.assertEqual(client.http_client.timeout,
+                         (msg_settings.connect_timeout, 3))
+
+    @override_settings(AWS_SES_REGION_NAME='eu-west-1')
+    @mock.patch.dict(msg_settings.user_config, {
+        'connect_timeout': 1, 'read_timeout': 2,
+    })
+    def test_ses_timeouts(self):
+        class TestHandler(SESHandler):
+            name = 'ses'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                pass
+
+        client = TestHandler()._get_client()
+        self.assertEqual(client.meta.config.connect_timeout, 1)
+        self.assertEqual(client.meta.config.read_timeout, 2)
+
+    def test_email_timeout(self):
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            read_timeout = 7
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        with mock.patch('msg.handlers.get_connection',
+                        wraps=mail.get_connection) as get_connection:
+            Msg.new(dispatch_now=True)
+
+        get_connection.assert_called_once_with(timeout=7)
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,102 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+
+from .helpers import BaseTestCase
+from msg.exceptions import MissingHandlerException
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.models import MsgContext
+from msg.settings import msg_settings
+
+
+class IngestTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        class WelcomeHandler(EmailHandler):
+            name = 'welcome'
+            subject = 'welcome'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, row):
+                return row['kind'] == 'welcome'
+
+            def parse(self, row):
+                return MsgCtx(
+                    recipients=[row['email']],
+                    context={'campaign': 'spring'},
+                    language=row.get('language') or 'en',
+                )
+
+        class ReminderHandler(WelcomeHandler):
+            name = 'reminder'
+
+            def match(self, row):
+                return row['kind'] == 'reminder'
+
+    def _rows(self, count):
+        return (
+            {
+                'kind': 'welcome' if i % 2 else 'reminder',
+                'email': f'user{i},"x"@test.test',
+                'language': 'pl' if i % 3 else '',
+            }
+            for i in range(count)
+        )
+
+    def test_bulk_create_from_any(self):
+        count = Msg.objects.bulk_create_from_any(self._rows(25),
+                                                 chunk_size=10)
+
+        self.assertEqual(count, 25)
+        self.assertEqual(Msg.objects.filter(type='welcome').count(), 12)
+        msg = Msg.objects.get(recipients=['user3,"x"@test.test'])
+        self.assertEqual(msg.type, 'welcome')
+        self.assertEqual(msg.language, 'en')
+        self.assertEqual(msg.context, {'campaign': 'spring'})
+        self.assertEqual(msg.status, Msg.Status.NEW.value)
+        self.assertIsNotNone(msg.created)
+
+    def test_missing_handler(self):
+        with self.assertRaises(MissingHandlerException):
+            Msg.objects.bulk_create_from_any([{'kind': 'other'}])
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'context_storage': 'deduplicated',
+    })
+    def test_bulk_new_dispatch(self):
+        count = Msg.bulk_new(self._rows(7), dispatch_now=True,
+                             handler='welcome', chunk_size=3)
+
+        self.assertEqual(count, 7)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertEqual(MsgContext.objects.count(), 1)
+        self.assertEqual(
+            Msg.objects.filter(status=Msg.Status.DONE.value,
+                               type='welcome').count(),
+            7,
+        )
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                         delete=False) as file:
+            file.write('kind;email\nwelcome;a@test.test\n'
+                       'reminder;b@test.test\n')
+        self.addCleanup(os.remove, file.name)
+
+        out = StringIO()
+        call_command('msg_import', file.name, '--delimiter', ';', stdout=out)
+
+        self.assertIn('Created 2 messages.', out.getvalue())
+        self.assertEqual(
+            sorted(Msg.objects.values_list('type', flat=True)),
+            ['reminder', 'welcome'],
+        )
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import override_settings
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.loadtest import percentiles
+from msg.models import Msg
+from msg.settings import msg_settings
+from msg.standins import ProviderStandIns
+from msg.standins import send_to_standins
+
+
+class StandInsTestCase(BaseTestCase):
+
+    def _create_test_handler(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(
+                    recipients=['test@test.test'],
+                    context={}
+                )
+
+    def test_email_is_sent_to_smtp_stand_in(self):
+        self._create_test_handler()
+
+        with ProviderStandIns() as standins:
+            with override_settings(**standins.get_settings()):
+                msg = Msg.new(None, dispatch_now=True)
+
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(standins.behaviour.requests, 1)
+
+    def test_smtp_stand_in_errors(self):
+        self._create_test_handler()
+
+        with ProviderStandIns(error_rate=1.0) as standins:
+            with override_settings(**standins.get_settings()):
+                with self.assertRaises(Exception):
+                    Msg.new(None, dispatch_now=True)
+
+        self.assertEqual(standins.behaviour.errors, 1)
+
+    def test_backends_and_capture_are_off(self):
+        self._create_test_handler()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'capture.jsonl')
+            with mock.patch.dict(msg_settings.user_config, {
+                # Real relay, refuses connections
+                'backends': {'smtp': [{'name': 'relay', 'host': '127.0.0.1',
+                                       'port': 1}]},
+                'capture_rate': 1.0,
+                'capture_file': path,
+            }):
+                with ProviderStandIns() as standins:
+                    with send_to_standins(standins):
+                        msg = Msg.new(None, dispatch_now=True)
+
+            self.assertFalse(os.path.exists(path))
+
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(standins.behaviour.requests, 1)
+
+    def test_percentiles(self):
+        result = percentiles([float(i) for i in range(1, 101)])
+        self.assertEqual(result, {0.5: 50.0, 0.95: 95.0, 0.99: 99.0})
+        self.assertEqual(percentiles([]), {0.5: None, 0.95: None, 0.99: None})
@@ -0,0 +1,130 @@
+from django.http import Http404
+from django.test import RequestFactory
+
+from .helpers import BaseTestCase
+from msg import metrics
+from msg import views
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.metrics import LocalMetricsBackend
+from msg.models import Msg
+
+
+class MetricsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = LocalMetricsBackend()
+        metrics.set_backend(self.backend)
+
+    def tearDown(self):
+        metrics.set_backend(None)
+        super().tearDown()
+
+    def _create_test_handler(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(
+                    recipients=['test@test.test'],
+                    context={}
+                )
+
+    def test_dispatch_stages_are_tracked(self):
+        self._create_test_handler()
+        Msg.new(None, dispatch_now=True)
+
+        exported = self.backend.export()
+        for stage in ['route', 'parse', 'insert', 'render', 'send']:
+            self.assertIn(
+                'msg_stage_total{handler="test",outcome="ok",'
+                f'stage="{stage}"}} 1',
+                exported,
+            )
+        # PENDING and DONE
+        self.assertIn(
+            'msg_stage_total{handler="test",outcome="ok",stage="status"} 2',
+            exported,
+        )
+        self.assertIn(
+            'msg_stage_in_flight{handler="test",stage="send"} 0',
+            exported,
+        )
+        self.assertIn(
+            'msg_stage_duration_seconds_count{handler="test",outcome="ok",'
+            'stage="send"} 1',
+            exported,
+        )
+
+    def test_failed_stage_is_tracked_as_error(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+            def send(self, msg):
+                raise RuntimeError('Provider is down')
+
+        with self.assertRaises(RuntimeError):
+            Msg.new(None, dispatch_now=True)
+
+        self.assertIn(
+            'msg_stage_total{handler="test",outcome="error",'
+            'stage="send"} 1',
+            self.backend.export(),
+        )
+
+    def test_render_is_not_part_of_send_stage(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+            def render(self, msg):
+                raise ValueError('Broken template')
+
+        with self.assertRaises(ValueError):
+            Msg.new(None, dispatch_now=True)
+
+        exported = self.backend.export()
+        self.assertIn(
+            'msg_stage_total{handler="test",outcome="error",'
+            'stage="render"} 1',
+            exported,
+        )
+        self.assertNotIn('stage="send"', exported)
+
+    def test_metrics_view(self):
+        request = RequestFactory().get('/metrics/')
+        response = views.metrics(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE msg_stage_total counter', response.content)
+
+    def test_metrics_view_without_backend(self):
+        metrics.set_backend(None)
+        request = RequestFactory().get('/metrics/')
+
+        with self.assertRaises(Http404):
+            views.metrics(request)
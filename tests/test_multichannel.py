@@ -0,0 +1,176 @@
+import threading
+from unittest import mock
+
+from django.core import mail
+from django.test import TransactionTestCase
+
+from .helpers import BaseTestCase
+from msg.exceptions import MissingHandlerException
+from msg.handlers import EmailHandler
+from msg.handlers import Handler
+from msg.handlers import MetaHandler
+from msg.handlers import MsgCtx
+from msg.handlers import MultiChannelHandler
+from msg.models import Msg
+from msg.models import MsgGroup
+from msg.settings import msg_settings
+
+
+class MultiChannelTestMixin:
+    user = {'name': 'Test', 'email': 'test@test.test', 'phone': '+48100'}
+
+    def setUp(self):
+        super().setUp()
+        MetaHandler._handlers_map = {}
+        self.sms = []
+        self.parsed = 0
+        test = self
+
+        class AlertEmailHandler(EmailHandler):
+            name = 'alert-email'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return False
+
+            def parse(self, *args, **kwargs):
+                pass
+
+        class AlertSMSHandler(Handler):
+            name = 'alert-sms'
+            channel = 'sms'
+
+            def match(self, *args, **kwargs):
+                return False
+
+            def parse(self, *args, **kwargs):
+                pass
+
+            def send(self, msg):
+                test.send_sms(msg)
+
+        class AlertHandler(MultiChannelHandler):
+            name = 'alert'
+            channels = ['alert-email', 'alert-sms']
+
+            def match(self, user):
+                return True
+
+            def parse(self, user):
+                test.parsed += 1
+                context = {'name': user['name']}
+                msg_ctxs = {
+                    'alert-email': MsgCtx(recipients=[user['email']],
+                                          context=context),
+                }
+                if user.get('phone'):
+                    msg_ctxs['alert-sms'] = MsgCtx(
+                        recipients=[user['phone']],
+                        context=context,
+                    )
+                return msg_ctxs
+
+    def send_sms(self, msg):
+        self.sms.append(msg.recipients)
+
+
+class MultiChannelTestCase(MultiChannelTestMixin, BaseTestCase):
+
+    def test_fan_out(self):
+        group = Msg.new(self.user, dispatch_now=False)
+
+        self.assertIsInstance(group, MsgGroup)
+        self.assertEqual(group.type, 'alert')
+        self.assertEqual(self.parsed, 1)
+        self.assertEqual(
+            sorted(Msg.objects.filter(group=group.group)
+                   .values_list('type', 'recipients')),
+            [('alert-email', ['test@test.test']), ('alert-sms', ['+48100'])],
+        )
+        self.assertEqual([msg.handler.name for msg in group.msgs],
+                         ['alert-email', 'alert-sms'])
+        self.assertEqual(group.get_statuses(),
+                         {'alert-email': 'NEW', 'alert-sms': 'NEW'})
+
+    def test_left_out_channel(self):
+        group = Msg.new({**self.user, 'phone': None}, dispatch_now=False)
+
+        self.assertEqual([msg.type for msg in group.msgs], ['alert-email'])
+
+    def test_dispatch(self):
+        group = Msg.new(self.user, dispatch_now=True, async=False)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.sms, [['+48100']])
+        self.assertEqual(group.get_statuses(),
+                         {'alert-email': 'DONE', 'alert-sms': 'DONE'})
+
+    def test_failed_channel(self):
+        with mock.patch.object(self, 'send_sms',
+                               side_effect=ConnectionError):
+            group = Msg.new(self.user, dispatch_now=False)
+            failed = group.dispatch(async=False)
+
+        self.assertEqual([msg.type for msg, exc in failed], ['alert-sms'])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(group.get_statuses(),
+                         {'alert-email': 'DONE', 'alert-sms': 'ERROR'})
+
+    def test_async_dispatch(self):
+        with mock.patch('msg.tasks.dispatch_msg.delay') as delay:
+            group = Msg.new(self.user, dispatch_now=True, async=True)
+
+        self.assertEqual(sorted(call[0][0] for call in delay.call_args_list),
+                         sorted(msg.pk for msg in group.msgs))
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'context_storage': 'deduplicated',
+    })
+    def test_deduplicated_context(self):
+        group = Msg.new(self.user, dispatch_now=False)
+
+        email, sms = Msg.objects.filter(group=group.group).order_by('type')
+        self.assertIsNotNone(email.context_ref_id)
+        self.assertEqual(email.context_ref_id, sms.context_ref_id)
+        self.assertEqual(email.context, {})
+        self.assertEqual(group.msgs[0].context, {'name': 'Test'})
+
+    def test_unknown_channel(self):
+        handler = MetaHandler.get_handler_cls('alert')()
+        with mock.patch.object(
+            type(handler), 'parse',
+            return_value={'alert-push': MsgCtx(recipients=['x'], context={})},
+        ):
+            with self.assertRaises(MissingHandlerException):
+                Msg.new(self.user, dispatch_now=False)
+
+        self.assertFalse(Msg.objects.exists())
+
+    def test_bulk_creation(self):
+        with self.assertRaises(MissingHandlerException):
+            Msg.objects.bulk_create_from_any([self.user], handler='alert')
+
+
+class ParallelDispatchTestCase(MultiChannelTestMixin, TransactionTestCase):
+    """
+    Channels are sent by worker threads (connections), so the messages
+    have to be committed.
+    """
+
+    def test_channels_are_sent_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def send_email(*args, **kwargs):
+            barrier.wait()
+
+        def send_sms(msg):
+            barrier.wait()
+
+        with mock.patch.object(EmailHandler, '_send_email', send_email), \
+                mock.patch.object(self, 'send_sms', send_sms):
+            group = Msg.new(self.user, dispatch_now=True, async=False)
+
+        self.assertEqual(group.get_statuses(),
+                         {'alert-email': 'DONE', 'alert-sms': 'DONE'})
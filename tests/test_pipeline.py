@@ -0,0 +1,139 @@
+from unittest import mock
+
+from django.core import mail
+from django.utils import translation
+
+from .helpers import BaseTestCase
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.pipeline import Pipeline
+from msg.pipeline import get_render_executor
+
+
+class PipelineTestCase(BaseTestCase):
+
+    def _create_test_handler(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, recipient):
+                return MsgCtx(
+                    recipients=[recipient],
+                    context={}
+                )
+
+        return TestHandler
+
+    @staticmethod
+    def _inline_pipeline():
+        return Pipeline(render_workers=0, send_workers=0)
+
+    def test_email_handler_render(self):
+        handler_cls = self._create_test_handler()
+        msg = Msg.new('test@test.test', dispatch_now=False)
+
+        rendered = handler_cls().render(msg)
+        self.assertEqual(rendered['subject'], 'test')
+        self.assertIsNotNone(rendered['body_text'])
+        self.assertIsNotNone(rendered['body_html'])
+
+    def test_dispatch_batch(self):
+        self._create_test_handler()
+        msgs = [Msg.new(f'test{i}@test.test', dispatch_now=False)
+                for i in range(3)]
+
+        failed = Msg.objects.dispatch_batch(
+            msgs, pipeline=self._inline_pipeline(),
+        )
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(mail.outbox), 3)
+        for msg in msgs:
+            msg.refresh_from_db()
+            self.assertEqual(msg.status, Msg.Status.DONE.value)
+
+    def test_dispatch_batch_with_render_workers(self):
+        self._create_test_handler()
+        msgs = [Msg.new(f'test{i}@test.test', dispatch_now=False)
+                for i in range(5)]
+
+        pipeline = Pipeline(render_workers=2, send_workers=0, queue_size=2)
+        failed = Msg.objects.dispatch_batch(msgs, pipeline=pipeline)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            sorted(m.recipients[0] for m in msgs),
+        )
+
+    def test_render_executor_is_reused(self):
+        self._create_test_handler()
+        pipeline = Pipeline(render_workers=2, send_workers=0)
+
+        executor = get_render_executor('thread', 2)
+        with mock.patch.object(executor, 'shutdown') as shutdown:
+            for i in range(2):
+                msg = Msg.new(f'test{i}@test.test', dispatch_now=False)
+                Msg.objects.dispatch_batch([msg], pipeline=pipeline)
+
+        shutdown.assert_not_called()
+        self.assertIs(get_render_executor('thread', 2), executor)
+        self.assertIsNot(get_render_executor('thread', 3), executor)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_render_error_marks_message_as_failed(self):
+        handler_cls = self._create_test_handler()
+        handler_cls.template_text = 'tests/emails/does-not-exist.txt'
+        msg = Msg.new('test@test.test', dispatch_now=False)
+
+        failed = Msg.objects.dispatch_batch(
+            [msg], pipeline=self._inline_pipeline(),
+        )
+
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.ERROR.value)
+
+    def test_messages_are_rendered_grouped_by_language(self):
+        languages = []
+
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, recipient, language):
+                return MsgCtx(
+                    recipients=[recipient],
+                    context={},
+                    language=language,
+                )
+
+            def render(self, msg):
+                languages.append(translation.get_language())
+                return super().render(msg)
+
+        msgs = [
+            Msg.objects.create_from_any('test@test.test', language)
+            for language in ['pl', 'en', 'pl', 'de', 'en']
+        ]
+
+        with translation.override('fr'):
+            Msg.objects.dispatch_batch(
+                msgs, pipeline=self._inline_pipeline(),
+            )
+            self.assertEqual(translation.get_language(), 'fr')
+
+        self.assertEqual(languages, ['de', 'en', 'en', 'pl', 'pl'])
@@ -0,0 +1,81 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+
+from .helpers import BaseTestCase
+from msg import profiling
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.profiling import Profiler
+
+
+class ProfilingTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling.set_profiler(None)
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def _create_test_handler(self, delay=0.0):
+        class TestHandler(EmailHandler):
+            name = 'test handler'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(
+                    recipients=['test@test.test'],
+                    context={}
+                )
+
+            def send(self, msg):
+                time.sleep(delay)
+                super().send(msg)
+
+    def test_sampled_messages_are_profiled(self):
+        self._create_test_handler()
+        profiling.set_profiler(Profiler(rate=1.0, directory=self.directory))
+
+        msg = Msg.new(None, dispatch_now=True)
+
+        files = sorted(os.listdir(self.directory))
+        self.assertEqual(len(files), 2)
+        suffix = f'test_handler-{msg.pk}-'
+        self.assertTrue(files[0].startswith(f'create-{suffix}'))
+        self.assertTrue(files[1].startswith(f'dispatch-{suffix}'))
+        # Valid cProfile stats
+        pstats.Stats(os.path.join(self.directory, files[1]))
+
+    def test_slow_messages_are_profiled(self):
+        self._create_test_handler(delay=0.05)
+        profiling.set_profiler(Profiler(
+            threshold=0.04, directory=self.directory, format='collapsed',
+            interval=0.001,
+        ))
+
+        Msg.new(None, dispatch_now=True)
+
+        files = os.listdir(self.directory)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('dispatch-'))
+        with open(os.path.join(self.directory, files[0])) as f:
+            self.assertIn('send (test_profiling.py', f.read())
+
+    def test_nothing_is_profiled_when_disabled(self):
+        self._create_test_handler()
+        self.assertIs(profiling.profile('dispatch'), profiling._NULL_SESSION)
+
+        Msg.new(None, dispatch_now=True)
+
+        self.assertEqual(os.listdir(self.directory), [])
@@ -0,0 +1,197 @@
+import os
+from unittest import mock
+from unittest import skipUnless
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.test import override_settings
+
+from .helpers import BaseTestCase
+from msg import rendering
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+try:
+    import premailer
+except ImportError:
+    premailer = None
+
+JINJA2_TEMPLATES = settings.TEMPLATES + [{
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [os.path.join(os.path.dirname(__file__), 'jinja2')],
+}]
+
+
+class RenderingTestCase(BaseTestCase):
+
+    def _create_test_handler(self, **attrs):
+        class TestHandlerMixin:
+            subject = 'test'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={
+                    'name': 'John',
+                    'items': ['<b>1</b>', '2'],
+                })
+
+        return type('TestHandler', (TestHandlerMixin, EmailHandler), {
+            'name': 'default',
+            **attrs,
+        })
+
+    @skipUnless(jinja2, 'jinja2 is not installed')
+    @override_settings(TEMPLATES=JINJA2_TEMPLATES)
+    def test_jinja2_engine(self):
+        self._create_test_handler(
+            template_engine='jinja2',
+            template_text='tests/emails/fast.txt',
+            template_html='tests/emails/fast.html',
+        )
+        msg = Msg.new(dispatch_now=False)
+
+        rendered = msg.handler.render(msg)
+
+        self.assertEqual(rendered['body_text'].strip(), 'Hello JOHN!')
+        self.assertEqual(rendered['body_html'].strip(), '<p>Hello JOHN!</p>')
+
+    def test_templates_are_compiled_once(self):
+        self._create_test_handler(
+            template_engine='django',
+            template_text='tests/emails/test.txt',
+            template_html='tests/emails/test.html',
+        )
+        rendering.clear_cache()
+        msg = Msg.new(dispatch_now=False)
+
+        with mock.patch('msg.rendering._get_template',
+                        wraps=get_template) as get_template_mock:
+            for _ in range(3):
+                msg.handler.render(msg)
+
+        self.assertEqual(get_template_mock.call_count, 2)
+        get_template_mock.assert_any_call('tests/emails/test.txt',
+                                          using='django')
+
+    @override_settings(DEBUG=True)
+    def test_templates_are_not_cached_in_debug(self):
+        self._create_test_handler(
+            template_text='tests/emails/test.txt',
+            template_html='tests/emails/test.html',
+        )
+        msg = Msg.new(dispatch_now=False)
+
+        with mock.patch('msg.rendering._get_template',
+                        wraps=get_template) as get_template_mock:
+            msg.handler.render(msg)
+            msg.handler.render(msg)
+
+        self.assertEqual(get_template_mock.call_count, 4)
+
+    def test_minify_html(self):
+        html = ('<p>\n  a  <!-- comment -->\n b</p>\n'
+                '<!--[if mso]><p>x</p><![endif]-->\n'
+                '<pre>  keep\n  this</pre>  <PRE> \n </PRE>')
+
+        self.assertEqual(
+            rendering.minify_html(html),
+            '<p> a b</p> <!--[if mso]><p>x</p><![endif]--> '
+            '<pre>  keep\n  this</pre> <PRE> \n </PRE>',
+        )
+
+    def test_protect_tags(self):
+        source = '<a href="{{ url }}">{% if x %}{{ x }}{% endif %}</a>{# c #}'
+
+        protected, tags = rendering.protect_tags(source)
+
+        self.assertNotIn('{', protected)
+        self.assertEqual(len(tags), 5)
+        self.assertEqual(rendering.restore_tags(protected, tags), source)
+
+    def test_protect_blocks(self):
+        source = ('{% blocktrans count n=n %}One  item{% plural %}'
+                  '{{ n }}  items{% endblocktrans %}<p>{% comment %} '
+                  '<!-- x -->{% endcomment %}{% trans "Hi" %}</p>')
+
+        protected, tags = rendering.protect_tags(source)
+
+        self.assertEqual(protected, '<p>'.join([
+            'MSGTPL0X', 'MSGTPL1XMSGTPL2X</p>',
+        ]))
+        self.assertEqual(rendering.restore_tags(protected.lower(), tags),
+                         source)
+
+    @skipUnless(premailer, 'premailer is not installed')
+    def test_translated_blocks_are_not_processed(self):
+        catalog = {'Hello %(name)s,\n    welcome &amp; enjoy!':
+                   'Witaj %(name)s,\n    baw się dobrze!'}
+        rendering.clear_cache()
+
+        with mock.patch('django.utils.translation.gettext',
+                        side_effect=lambda msgid: catalog.get(msgid, msgid)):
+            html = rendering.get_template(
+                'tests/emails/translated.html', inline=True, minify=True,
+            ).render({'name': 'John'})
+
+        self.assertIn('<p style="color:red">Witaj John,\n'
+                      '    baw się dobrze!</p>', html)
+        self.assertNotIn('Not', html)
+
+    def test_has_attribute_tags(self):
+        for source, expected in [
+            ('<td {% if x %}class="a"{% endif %}>', True),
+            ('<td class="a"{% if x %} hidden{% endif %}>', True),
+            ('<p {{ attrs }}>', True),
+            ('<a href={{ url }} title = "{{ t }}">{{ x }}</a>', False),
+            ('<p class="{% if x %}a{% endif %}" data-x=\'{{ y }}\'>', False),
+        ]:
+            protected, tags = rendering.protect_tags(source)
+            self.assertEqual(rendering.has_attribute_tags(protected),
+                             expected, source)
+
+    @skipUnless(premailer, 'premailer is not installed')
+    def test_attribute_tags_are_not_inlined(self):
+        rendering.clear_cache()
+
+        with self.assertLogs('msg.rendering', 'WARNING'):
+            template = rendering.get_template(
+                'tests/emails/attribute_tags.html', inline=True, minify=True,
+            )
+
+        self.assertIn('<td class="a">1</td>',
+                      template.render({'x': True, 'y': 1}))
+        self.assertIn('<td >1</td>', template.render({'x': False, 'y': 1}))
+
+    @skipUnless(premailer, 'premailer is not installed')
+    def test_inline_css_and_minify(self):
+        self._create_test_handler(
+            template_text='tests/emails/test.txt',
+            template_html='tests/emails/styled.html',
+            inline_css=True,
+            minify_html=True,
+        )
+        rendering.clear_cache()
+        msg = Msg.new(dispatch_now=False)
+
+        with mock.patch('msg.rendering.inline_css',
+                        wraps=rendering.inline_css) as inline_css:
+            rendered = msg.handler.render(msg)
+            msg.handler.render(msg)
+
+        self.assertEqual(inline_css.call_count, 1)
+        html = rendered['body_html']
+        self.assertIn('<p style="color:red">Hello John!</p>', html)
+        self.assertIn('<td class="note" style="font-size:12px">'
+                      '&lt;b&gt;1&lt;/b&gt;</td>', html)
+        self.assertIn('<pre>  keep\n  this  </pre>', html)
+        self.assertNotIn('<style', html)
+        self.assertNotIn('greeting', html)
+        self.assertNotIn('\n', html.replace('keep\n', ''))
@@ -0,0 +1,158 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from .helpers import BaseTestCase
+from msg import counters
+from msg import partitioning
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.models import MsgAttempt
+from msg.models import MsgDelivery
+from msg.retention import get_rules
+from msg.retention import purge
+from msg.settings import msg_settings
+
+
+class TestHandlerMixin:
+    subject = 'test'
+    template_text = 'tests/emails/test.txt'
+    template_html = 'tests/emails/test.html'
+
+    def match(self, handler_name):
+        return handler_name == self.name
+
+    def parse(self, *args, **kwargs):
+        return MsgCtx(
+            recipients=['test@test.test'],
+            context={}
+        )
+
+
+class RetentionTestCase(BaseTestCase):
+
+    def _create_test_handler(self, name, retention=None):
+        type('TestHandler', (TestHandlerMixin, EmailHandler), {
+            'name': name,
+            'retention': retention,
+        })
+
+    def _create_msg(self, handler_name, status, age_days):
+        msg = Msg.objects.create_from_any(handler_name)
+        Msg.objects.filter(pk=msg.pk).update(
+            status=status.value,
+            created=timezone.now() - timedelta(days=age_days),
+        )
+        return msg
+
+    @mock.patch.dict(msg_settings.user_config, {
+        'retention': {'DONE': 30, 'ERROR': 90},
+    })
+    def test_purge(self):
+        self._create_test_handler('default')
+        self._create_test_handler('otp', retention={'DONE': 1, 'ERROR': None})
+
+        kept = [
+            self._create_msg('default', Msg.Status.DONE, 10),
+            self._create_msg('default', Msg.Status.ERROR, 60),
+            self._create_msg('default', Msg.Status.NEW, 100),
+            self._create_msg('otp', Msg.Status.ERROR, 100),
+        ]
+        for i in range(5):
+            self._create_msg('default', Msg.Status.DONE, 40)
+            self._create_msg('otp', Msg.Status.DONE, 2)
+        self._create_msg('default', Msg.Status.ERROR, 100)
+
+        deleted = sum(purge(rule, chunk_size=2) for rule in get_rules())
+
+        self.assertEqual(deleted, 11)
+        self.assertEqual(
+            set(Msg.objects.values_list('pk', flat=True)),
+            {msg.pk for msg in kept},
+        )
+
+    @mock.patch.dict(msg_settings.user_config, {'retention': {'DONE': 30}})
+    def test_purge_keeps_changed_messages(self):
+        self._create_test_handler('default')
+        old = self._create_msg('default', Msg.Status.DONE, 40)
+        retried = self._create_msg('default', Msg.Status.DONE, 40)
+        atomic = transaction.atomic
+
+        def retry_and_atomic():
+            # Status changes after the chunk was selected
+            Msg.objects.filter(pk=retried.pk).update(
+                status=Msg.Status.PENDING.value,
+            )
+            return atomic()
+
+        with mock.patch('msg.retention.transaction') as patched:
+            patched.atomic = retry_and_atomic
+            deleted = sum(purge(rule) for rule in get_rules())
+
+        self.assertEqual(deleted, 1)
+        self.assertFalse(Msg.objects.filter(pk=old.pk).exists())
+        self.assertTrue(Msg.objects.filter(pk=retried.pk).exists())
+
+    @mock.patch.dict(msg_settings.user_config, {'retention': {'SENT': 1}})
+    def test_invalid_status(self):
+        with self.assertRaises(ValueError):
+            get_rules()
+
+
+class PartitioningTestCase(BaseTestCase):
+
+    def test_convert_to_partitioned(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(recipients=['test@test.test'], context={})
+
+        old = Msg.new(None, dispatch_now=False)
+        Msg.objects.filter(pk=old.pk).update(
+            created=timezone.now() - timedelta(days=400),
+        )
+        MsgDelivery.objects.create(msg=old, position=0, chunk=0,
+                                   recipient='test@test.test')
+        MsgAttempt.objects.create(msg=old, attempt=1,
+                                  status=Msg.Status.DONE.value,
+                                  finished_at=timezone.now())
+
+        partitioning.convert_to_partitioned(months_ahead=1)
+
+        self.assertTrue(partitioning.is_partitioned())
+        self.assertTrue(Msg.objects.filter(pk=old.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM pg_constraint '
+                "WHERE conrelid = 'msg_msg'::regclass AND contype = 'f'"
+            )
+            self.assertEqual(cursor.fetchone()[0], 1)
+        new = Msg.new(None, dispatch_now=True)
+        self.assertGreater(new.pk, old.pk)
+        self.assertEqual(Msg.objects.get(pk=new.pk).status,
+                         Msg.Status.DONE.value)
+
+        dropped = partitioning.drop_partitions(
+            (timezone.now() - timedelta(days=100)).date()
+        )
+
+        self.assertTrue(dropped)
+        self.assertNotIn('msg_msg_default', dropped)
+        self.assertFalse(Msg.objects.filter(pk=old.pk).exists())
+        self.assertFalse(MsgDelivery.objects.filter(msg_id=old.pk).exists())
+        self.assertFalse(MsgAttempt.objects.filter(msg_id=old.pk).exists())
+        self.assertTrue(Msg.objects.filter(pk=new.pk).exists())
+        self.assertTrue(MsgAttempt.objects.filter(msg_id=new.pk).exists())
+        # Counter triggers are kept, dropped partitions are subtracted
+        self.assertEqual(counters.get_counts(), {'test': {'DONE': 1}})
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.utils import ConnectionDoesNotExist
+from django.utils import timezone
+
+from .helpers import BaseTestCase
+from msg.counters import get_counts
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.settings import msg_settings
+from msg.stats import get_handler_stats
+
+
+class LifecycleTestCase(BaseTestCase):
+
+    def _create_test_handler(self):
+        class TestHandler(EmailHandler):
+            name = 'test'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+
+            def match(self, *args, **kwargs):
+                return True
+
+            def parse(self, *args, **kwargs):
+                return MsgCtx(
+                    recipients=['test@test.test'],
+                    context={}
+                )
+
+        return TestHandler
+
+    def test_lifecycle_timestamps(self):
+        self._create_test_handler()
+        msg = Msg.new(None, dispatch_now=False)
+        self.assertIsNone(msg.enqueued_at)
+        self.assertEqual(msg.attempts, 0)
+
+        msg.dispatch()
+        msg.refresh_from_db()
+
+        self.assertEqual(msg.attempts, 1)
+        self.assertLessEqual(msg.enqueued_at, msg.started_at)
+        self.assertLessEqual(msg.started_at, msg.sent_at)
+
+    def test_failed_attempt_is_counted(self):
+        handler_cls = self._create_test_handler()
+        handler_cls.template_text = 'tests/emails/does-not-exist.txt'
+        msg = Msg.new(None, dispatch_now=False)
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                msg.dispatch()
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.attempts, 2)
+        self.assertEqual(msg.status, Msg.Status.ERROR.value)
+        self.assertIsNone(msg.sent_at)
+
+    def test_handler_stats(self):
+        self._create_test_handler()
+        for _ in range(3):
+            Msg.new(None, dispatch_now=True)
+        Msg.new(None, dispatch_now=False)
+
+        stats = get_handler_stats(timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0].handler, 'test')
+        self.assertEqual(stats[0].count, 3)
+        self.assertEqual(len(stats[0].queue_lag), 3)
+        self.assertGreaterEqual(stats[0].send_latency[2], 0)
+
+    def test_msg_stats_command(self):
+        self._create_test_handler()
+        Msg.new(None, dispatch_now=True)
+
+        out = StringIO()
+        call_command('msg_stats', minutes=5, stdout=out)
+
+        self.assertIn('lag p95', out.getvalue())
+        self.assertIn('test', out.getvalue())
+
+    @mock.patch.dict(msg_settings.user_config, {'read_db': 'replica'})
+    def test_read_db(self):
+        self._create_test_handler()
+
+        # Reporting reads go to `read_db`
+        with self.assertRaises(ConnectionDoesNotExist):
+            get_handler_stats(timezone.now())
+        with self.assertRaises(ConnectionDoesNotExist):
+            get_counts()
+
+        # Dispatch stays on the primary database
+        msg = Msg.new(None, dispatch_now=False)
+        with mock.patch('msg.tasks.Msg.objects.dispatch_batch') as batch:
+            from msg.tasks import dispatch_msgs
+            dispatch_msgs([msg.pk])
+        self.assertEqual(batch.call_args[0][0].db, 'default')
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .helpers import BaseTestCase
+from msg import suppression
+from msg.handlers import EmailHandler
+from msg.handlers import MsgCtx
+from msg.models import Msg
+from msg.models import Suppression
+
+
+class SuppressionTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        suppression._filter = None
+        self.addCleanup(setattr, suppression, '_filter', None)
+
+        class TestHandler(EmailHandler):
+            name = 'default'
+            subject = 'test'
+            template_text = 'tests/emails/test.txt'
+            template_html = 'tests/emails/test.html'
+            recipients_chunk_size = 2
+
+            def match(self, recipients):
+                return True
+
+            def parse(self, recipients):
+                return MsgCtx(recipients=recipients, context={})
+
+    def test_suppressed_recipients_are_filtered(self):
+        Suppression.objects.suppress('email', [' A@Test.test'], 'bounce')
+        Suppression.objects.suppress('sms', ['b@test.test'])
+
+        msg = Msg.new(['a@test.test', 'b@test.test'], dispatch_now=True)
+
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(mail.outbox[0].to, ['b@test.test'])
+
+    def test_all_recipients_suppressed(self):
+        Suppression.objects.suppress('email', ['a@test.test'])
+
+        msg = Msg.new(['a@test.test'], dispatch_now=True)
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.SUPPRESSED.value)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_split_message(self):
+        Suppression.objects.suppress('email', ['a@test.test', 'b@test.test'])
+
+        msg = Msg.new(['a@test.test', 'b@test.test', 'c@test.test'],
+                      dispatch_now=True)
+
+        msg.refresh_from_db()
+        self.assertEqual(msg.status, Msg.Status.DONE.value)
+        self.assertEqual(
+            list(msg.deliveries.order_by('position')
+                 .values_list('status', flat=True)),
+            [Msg.Status.SUPPRESSED.value, Msg.Status.SUPPRESSED.value,
+             Msg.Status.DONE.value],
+        )
+        self.assertEqual(mail.outbox[0].to, ['c@test.test'])
+
+    def test_incremental_refresh(self):
+        Suppression.objects.suppress('email', ['a@test.test'])
+        check = suppression.get_filter()
+        self.assertEqual(check.filter('email', ['a@test.test']), [])
+
+        Suppression.objects.suppress('email', ['b@test.test'])
+        Suppression.objects.unsuppress('email', ['a@test.test'])
+        # Cached until the refresh interval passes
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(100):
+                check.filter('email', ['b@test.test'])
+        self.assertEqual(len(queries), 0)
+
+        with mock.patch('msg.suppression.time.monotonic',
+                        return_value=check._refreshed_at + 61):
+            self.assertEqual(
+                check.filter('email', ['b@test.test', 'c@test.test']),
+                ['c@test.test'],
+            )
+        # Incremental refresh doesn't see removed entries
+        self.assertEqual(check._entries, {('email', 'a@test.test'),
+                                          ('email', 'b@test.test')})
+
+        check.refresh(full=True)
+        self.assertEqual(check._entries, {('email', 'b@test.test')})
+
+    def test_refresh_reads_late_commits(self):
+        Suppression.objects.suppress('email', ['late@test.test'])
+        Suppression.objects.suppress('email', ['early@test.test'])
+        check = suppression.get_filter()
+        check.refresh()
+        # As if the entry with the lower key was committed after
+        # the refresh
+        check._entries.discard(('email', 'late@test.test'))
+
+        check.refresh()
+
+        self.assertEqual(check.filter('email', ['late@test.test']), [])
+
+    def test_full_reload_does_not_block_sends(self):
+        Suppression.objects.suppress('email', ['a@test.test'])
+        check = suppression.get_filter()
+        check.filter('email', [])
+        Suppression.objects.unsuppress('email', ['a@test.test'])
+        check._refreshes = suppression.FULL_REFRESH_EVERY - 1
+
+        with mock.patch('msg.suppression.time.monotonic',
+                        return_value=check._refreshed_at + 61), \
+                mock.patch('msg.suppression.threading.Thread') as thread:
+            # Still suppressed, the reload didn't run yet
+            self.assertEqual(check.filter('email', ['a@test.test']), [])
+
+        thread.assert_called_once_with(target=check.reload, daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+        # Connections of the test case are not closed
+        with mock.patch('msg.suppression.connections'):
+            check.reload()
+        self.assertEqual(check.filter('email', ['a@test.test']),
+                         ['a@test.test'])
+        self.assertFalse(check._reloading)